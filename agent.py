@@ -2,121 +2,77 @@
 import os
 os.environ["VNSTOCK_DISABLE_ADS"] = "1"
 
-import ollama
 import json
-import re
-from tools import all_tools
+import inspect
+import hashlib
+import time
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+from tools import tool_functions, llm_tool_schemas, prefetch_for_tool_calls, _get_listed_symbols, answer_key, answer_cache
+from cache import MISSING
+from router import Router
+from llm_router import LLM_ROUTING, llm_route
+from results import ToolResult
+import metrics
 import logging
 
-logging.getLogger("ollama").setLevel(logging.ERROR)
+# 1. ROUTER (một lượt quét, xem router.py)
 
-# 1. Intent Classification (PHẦN QUAN TRỌNG NHẤT)
 
+_router = None
 
-def classify_intent(question: str) -> dict:
-    q = question.lower()
-
-    # COMPANY INFO 
-    if "cổ đông" in q:
-        return {"intent": "company_info", "info_type": "shareholders"}
-    if "ban lãnh đạo" in q or "lãnh đạo" in q:
-        return {"intent": "company_info", "info_type": "officers"}
-    if "công ty con" in q:
-        return {"intent": "company_info", "info_type": "subsidiaries"}
-
-    #COMPARE
-    if "so sánh" in q and "volume" in q:
-        return {"intent": "compare_volume"}
-    if "so sánh" in q or "thấp nhất" in q:
-        return {"intent": "compare_price"}
-
-    # TECHNICAL 
-    if "sma" in q or "rsi" in q:
-        return {"intent": "technical"}
-
-    # OHLCV / VOLUME 
-    if "ohlcv" in q or "giá" in q or "volume" in q or "khối lượng" in q:
-        return {"intent": "ohlcv"}
-
-    return {"intent": "unknown"}
-
-
-# 2. Extract Useful Fields
-
-
-def extract_symbols(question: str):
-    return re.findall(r'\b[A-Z]{2,4}\b', question)
-
-def extract_resolution(question: str):
-    q = question.lower()
-    if "1m" in q:
-        return "1m"
-    if "1d" in q or "daily" in q:
-        return "1d"
-    return "1d"
+# Số mã tối thiểu mỗi intent cần (mã gõ sai / không niêm yết đã bị router loại)
+MIN_SYMBOLS = {
+    "company_info": 1, "technical": 1, "ohlcv": 1,
+    "compare_price": 2, "compare_stocks": 2, "compare_volume": 2,
+}
 
-def extract_date_query(question: str):
+def get_router() -> Router:
     """
-    Cực kỳ quan trọng: GIỮ NGUYÊN CHUỖI GỐC TIẾNG VIỆT
-    vì tools.py parse bằng regex tiếng Việt.
+    Router kèm tập mã niêm yết nếu lấy được. Khi chưa lấy được, tạm dùng Router không
+    kiểm tra mã và thử lại sau (lỗi chỉ được cache LISTING_RETRY giây, xem tools.py).
     """
-    keywords = [
-        "ngày", "tuần", "tháng",
-        "gần nhất", "gần đây",
-        "từ đầu", "đầu tháng"
-    ]
-    for kw in keywords:
-        if kw in question.lower():
-            # Lấy nguyên cụm có từ này
-            idx = question.lower().index(kw)
-            return question[idx-10:].strip()
-
-    return question  # fallback
-
-def extract_indicators(question: str):
-    inds = []
-    for sma in re.findall(r'sma\s*([0-9]+)', question.lower()):
-        inds.append(f"SMA_{sma}")
-    for rsi in re.findall(r'rsi\s*([0-9]+)', question.lower()):
-        inds.append(f"RSI_{rsi}")
-    return inds
-
-
-# 3. RESOLUTION MAP
-
-
-RESOLUTION_MAP = {
-    '1d': '1D', 'daily': '1D',
-    '1m': '1m',
-    '5m': '5m', '15m': '15m',
-    '30m': '30m',
-    '1h': '1H',
-}
+    global _router
+    if _router is None or _router.tickers is None:
+        try:
+            _router = Router(_get_listed_symbols(fallback=False))
+        except Exception as e:
+            if _router is None:
+                logging.error(f"Không lấy được danh sách mã, tạm bỏ qua kiểm tra mã: {e}")
+                _router = Router(None)
+    return _router
 
 
-# 4. MAIN AGENT RESPONSE
+# 2. MAIN AGENT RESPONSE
 
 
-def get_agent_response(question: str) -> str:
+def resolve_tool_call(question: str) -> Tuple[Optional[dict], Optional[ToolResult]]:
+    """Định tuyến câu hỏi thành (tool_call, None), hoặc (None, câu trả lời thay thế)."""
     if not question.strip():
-        return "Câu hỏi trống."
-
-    intent = classify_intent(question)
-    symbols = extract_symbols(question)
+        return None, ToolResult.text("Câu hỏi trống.")
+
+    with metrics.timed('route'):
+        parsed = get_router().parse(question)
+    intent = {"intent": parsed["intent"], "info_type": parsed.get("info_type")}
+    symbols = parsed["symbols"]
+    needed = MIN_SYMBOLS.get(intent["intent"], 0)
+    if len(symbols) < needed:
+        if needed == 1:
+            return None, ToolResult.text("Không tìm thấy mã cổ phiếu hợp lệ trong câu hỏi.")
+        return None, ToolResult.text(f"Không tìm thấy mã cổ phiếu hợp lệ để so sánh (cần ít nhất {needed} mã).")
 
     # ticker1 / ticker2 cho compare
     symbol1 = symbols[0] if len(symbols) > 0 else None
     symbol2 = symbols[1] if len(symbols) > 1 else None
 
-    date_query = extract_date_query(question)
-    resolution = extract_resolution(question)
-    indicators = extract_indicators(question)
+    date_query = parsed["date_query"]
+    resolution = parsed["resolution"]
+    indicators = parsed["indicators"]
 
-    # ÁP DỤNG RESOLUTION MAP
-    resolution = RESOLUTION_MAP.get(resolution.lower(), "1D")
 
-
-    # 5. MAP INTENT → TOOL CALL
+    # 3. MAP INTENT → TOOL CALL
 
 
     tool_call = None
@@ -131,6 +87,15 @@ def get_agent_response(question: str) -> str:
             }
         }
 
+    # SCREEN
+    elif intent["intent"] == "screen":
+        tool_call = {
+            "name": "screen_stocks",
+            "arguments": {
+                "condition": parsed["condition"]
+            }
+        }
+
     #  COMPARE PRICE 
     elif intent["intent"] == "compare_price":
         tool_call = {
@@ -138,7 +103,18 @@ def get_agent_response(question: str) -> str:
             "arguments": {
                 "symbols": symbols,
                 "date_query": date_query,
-                "metric": "open"
+                "metric": parsed["metric"]
+            }
+        }
+
+    # COMPARE BASKET (nhiều mã, nhiều số đo, có xếp hạng)
+    elif intent["intent"] == "compare_stocks":
+        tool_call = {
+            "name": "compare_stocks",
+            "arguments": {
+                "symbols": symbols,
+                "date_query": date_query,
+                "measures": parsed["measures"] or None
             }
         }
 
@@ -178,17 +154,169 @@ def get_agent_response(question: str) -> str:
         }
 
     else:
-        return "Không hiểu yêu cầu."
+        # Router luật không hiểu → thử LLM (nếu bật), có giới hạn thời gian và cache
+        tool_call = None
+        if LLM_ROUTING:
+            with metrics.timed('llm_route'):
+                tool_call = llm_route(question, llm_tool_schemas(), validate=valid_tool_call)
+        if tool_call is None:
+            return None, ToolResult.text("Không hiểu yêu cầu.")
+
+    return tool_call, None
+
+
+# 4. RUN TOOL DIRECTLY
+
+
+def valid_tool_call(tool_call: dict) -> bool:
+    """Tên tool có thật và tham số khớp chữ ký hàm (chặn tham số LLM tự đặt ra, ví dụ 'ticker')."""
+    fn = tool_functions.get(tool_call.get("name"))
+    if fn is None or not isinstance(tool_call.get("arguments"), dict):
+        return False
+    try:
+        inspect.signature(fn).bind(**tool_call["arguments"])
+    except TypeError:
+        return False
+    return True
+
+
+def run_tool_call(tool_call: dict) -> ToolResult:
+    metrics.inc("tool_calls_total", tool=tool_call["name"])
+    with metrics.timed('tool'):
+        return tool_functions[tool_call["name"]](**tool_call["arguments"])
+
+
+def get_agent_result_tagged(question: str, if_none_match: Optional[str] = None) -> Tuple[Optional[ToolResult], Optional[str]]:
+    """
+    Định tuyến + chạy tool, dùng lại câu trả lời đã có khi dữ liệu chưa đổi.
+    Trả về (kết quả, etag); etag None nếu câu trả lời không cache được.
+    Nếu etag trùng `if_none_match` thì trả về (None, etag) mà không chạy tool.
+    """
+    tool_call, answer = resolve_tool_call(question)
+    if answer is not None:
+        return answer, None
+
+    key = answer_key(tool_call)
+    if key is None:
+        return run_tool_call(tool_call), None
+    etag = hashlib.sha1(repr(key).encode()).hexdigest()[:20]
+    if if_none_match is not None and if_none_match == etag:
+        return None, etag
+
+    result = answer_cache.get(key)
+    if result is MISSING:
+        result = run_tool_call(tool_call)
+        if not result.has_data:
+            return result, None
+        answer_cache.set(key, result)
+    return result, etag
+
+
+def get_agent_result(question: str) -> ToolResult:
+    """Định tuyến + chạy tool, trả về kết quả có cấu trúc (chưa format)."""
+    return get_agent_result_tagged(question)[0]
+
+
+def get_agent_results_batch(questions: List[str]) -> List[Tuple[Optional[ToolResult], Optional[str]]]:
+    """
+    Trả lời nhiều câu hỏi: định tuyến tất cả, tải trước một lần phần dữ liệu hợp
+    (mỗi mã/khung chỉ một khoảng rộng nhất), rồi chạy từng tool trên dữ liệu đã có.
+    Trả về [(kết quả, lỗi)] đúng thứ tự; lỗi của một câu không ảnh hưởng câu khác.
+    """
+    routed = []
+    for q in questions:
+        try:
+            routed.append(resolve_tool_call(q) + (None,))
+        except Exception as e:
+            routed.append((None, None, f"Lỗi định tuyến: {e}"))
+
+    try:
+        prefetch_for_tool_calls([call for call, _, _ in routed if call is not None])
+    except Exception as e:
+        logging.error(f"Lỗi tải trước dữ liệu cho batch: {e}")
+
+    results = []
+    for call, answer, error in routed:
+        if error is not None or answer is not None:
+            results.append((answer, error))
+            continue
+        try:
+            results.append((run_tool_call(call), None))
+        except Exception as e:
+            results.append((None, f"Lỗi khi chạy {call['name']}: {e}"))
+    return results
+
+
+def format_answer(result: ToolResult) -> str:
+    """Dạng câu trả lời văn bản cho /ask (mặc định)."""
+    if result.has_data:
+        return f"Dưới đây là bảng dữ liệu:\n```\n{result.to_text()}\n```"
+    return result.to_text()
+
+
+def get_agent_response(question: str) -> str:
+    return format_answer(get_agent_result(question))
+
+
+# 5. ASYNC PATH (cho FastAPI)
+
+# get_agent_response gọi vnstock (HTTP chặn) nên chạy trong pool riêng,
+# giới hạn số câu hỏi đang chờ để không dồn ứ vô hạn khi upstream chậm.
+AGENT_MAX_WORKERS = int(os.environ.get("AGENT_MAX_WORKERS", "16"))
+AGENT_MAX_PENDING = int(os.environ.get("AGENT_MAX_PENDING", "128"))
+
+_agent_pool = ThreadPoolExecutor(max_workers=AGENT_MAX_WORKERS, thread_name_prefix="agent")
+_pending = 0
+
+
+class AgentOverloadedError(RuntimeError):
+    """Số câu hỏi đang xử lý vượt quá AGENT_MAX_PENDING."""
+
+
+def pending_requests() -> int:
+    """Số câu hỏi đang xử lý (dùng để việc nền nhường cho request thật)."""
+    return _pending
+
+
+async def _run_in_agent_pool(fn, *args):
+    """Chạy fn trong _agent_pool, từ chối khi đã có AGENT_MAX_PENDING việc đang chờ."""
+    global _pending
+    if _pending >= AGENT_MAX_PENDING:
+        raise AgentOverloadedError(f"Hệ thống đang bận ({_pending} câu hỏi đang xử lý).")
+
+    _pending += 1
+    submitted = time.perf_counter()
+
+    def run():
+        # Thời gian chờ trong hàng đợi của pool cũng là một bước của request
+        metrics.observe("stage_seconds", time.perf_counter() - submitted, stage='queue')
+        trace = metrics.current_trace()
+        if trace is not None:
+            trace['queue'] = time.perf_counter() - submitted
+        return fn(*args)
+
+    try:
+        loop = asyncio.get_running_loop()
+        # copy_context: trace của request đi theo sang thread của pool
+        return await loop.run_in_executor(_agent_pool, contextvars.copy_context().run, run)
+    finally:
+        _pending -= 1
+
+
+async def get_agent_result_async(question: str) -> ToolResult:
+    """Phiên bản không chặn event loop của get_agent_result."""
+    return await _run_in_agent_pool(get_agent_result, question)
 
 
-    # 6. RUN TOOL DIRECTLY
+async def get_agent_result_tagged_async(question: str, if_none_match: Optional[str] = None):
+    """Phiên bản không chặn event loop của get_agent_result_tagged."""
+    return await _run_in_agent_pool(get_agent_result_tagged, question, if_none_match)
 
 
-    tool = next((t for t in all_tools if t.metadata.name == tool_call["name"]), None)
-    result = tool.fn(**tool_call["arguments"])
+async def get_agent_results_batch_async(questions: List[str]) -> List[Tuple[Optional[ToolResult], Optional[str]]]:
+    """Phiên bản không chặn event loop của get_agent_results_batch (tính là một slot)."""
+    return await _run_in_agent_pool(get_agent_results_batch, questions)
 
-    if "###DATA" in result:
-        data = result.split("###DATA")[1].split("###END_DATA")[0].strip()
-        return f"Dưới đây là bảng dữ liệu:\n```\n{data}\n```"
 
-    return result
+async def get_agent_response_async(question: str) -> str:
+    return format_answer(await get_agent_result_async(question))
@@ -0,0 +1,75 @@
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+# Bộ chứa nến dạng cột gọn nhẹ: mảng NumPy liền khối, float32 cho giá,
+# int64 cho volume và mốc thời gian (epoch ns, đã sắp xếp tăng dần).
+# Các mảng thường là view chỉ-đọc vào file .npy được memory-map bởi BarStore,
+# nên cắt lát không sao chép và nhiều worker dùng chung page cache của OS.
+
+PRICE_DTYPE = np.float32
+FIELDS = ('time', 'open', 'high', 'low', 'close', 'volume')
+
+
+class Bars:
+    __slots__ = FIELDS
+
+    def __init__(self, time, open, high, low, close, volume):
+        self.time = time
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+
+    @classmethod
+    def empty(cls) -> 'Bars':
+        price = np.empty(0, dtype=PRICE_DTYPE)
+        return cls(np.empty(0, dtype='int64'), price, price, price, price, np.empty(0, dtype='int64'))
+
+    @classmethod
+    def from_columns(cls, columns: Dict[str, np.ndarray]) -> 'Bars':
+        return cls(*(columns[f] for f in FIELDS))
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> 'Bars':
+        """DataFrame (time datetime64) -> Bars với dtype gọn."""
+        return cls(
+            df['time'].to_numpy(dtype='datetime64[ns]').view('int64'),
+            *(df[f].to_numpy(dtype=PRICE_DTYPE) for f in ('open', 'high', 'low', 'close')),
+            df['volume'].to_numpy(dtype='int64'),
+        )
+
+    def __len__(self) -> int:
+        return len(self.time)
+
+    def __getitem__(self, key: slice) -> 'Bars':
+        """Cắt lát theo vị trí - chỉ tạo view, không sao chép."""
+        return Bars(*(getattr(self, f)[key] for f in FIELDS))
+
+    def column(self, name: str) -> np.ndarray:
+        return getattr(self, name)
+
+    def datetimes(self) -> np.ndarray:
+        return self.time.view('datetime64[ns]')
+
+    def index_of(self, when) -> int:
+        """Vị trí nến đầu tiên có time >= when (tìm nhị phân)."""
+        return int(np.searchsorted(self.time, pd.Timestamp(when).value))
+
+    def between(self, start, end_exclusive) -> 'Bars':
+        """Các nến có start <= time < end_exclusive (view)."""
+        return self[self.index_of(start):self.index_of(end_exclusive)]
+
+    def as_dict(self) -> Dict[str, np.ndarray]:
+        return {f: getattr(self, f) for f in FIELDS}
+
+    def to_frame(self) -> pd.DataFrame:
+        df = pd.DataFrame({f: getattr(self, f) for f in FIELDS[1:]})
+        df.insert(0, 'time', pd.to_datetime(self.time))
+        return df
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, f).nbytes for f in FIELDS)
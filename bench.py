@@ -0,0 +1,549 @@
+import os
+os.environ["VNSTOCK_DISABLE_ADS"] = "1"
+
+import sys
+import json
+import asyncio
+import itertools
+import random
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+import zlib
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+import tools
+from store import BarStore
+from indicators import IndicatorEngine, IndicatorStateStore
+from providers import FileProvider, build_provider
+from trading_calendar import trading_days, trading_days_back, INTERVAL_MINUTES
+from agent import get_agent_response_async, get_agent_result_async, get_router
+from router import Router
+
+# Benchmark với nguồn dữ liệu giả (không gọi TCBS thật):
+#  - load / router: nguồn sinh ngẫu nhiên, mỗi lần gọi upstream giả lập độ trễ FAKE_LATENCY giây;
+#  - offline: phát lại qua FileProvider phản hồi thật của nguồn dữ liệu cho các mã
+#    trong test.py (fixtures/, ghi bằng `bench.py record`) cùng một thị trường tổng hợp
+#    sinh vào thư mục tạm mỗi lần chạy; đo từng tool và từng câu hỏi end-to-end ở nhiều
+#    mức đồng thời, quy về đơn vị của một vòng hiệu chuẩn cố định (để so được giữa các
+#    máy), so với bench_baseline.json và thoát mã 1 nếu chậm đi quá BENCH_TOLERANCE,
+#    thiếu fixtures ghi thật hoặc thiếu baseline (dùng được trong CI);
+#  - startup: thời gian import lạnh (tiến trình Python mới) của tools/agent/main.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FAKE_LATENCY = 0.05
+NUM_REQUESTS = 200
+CONCURRENCY_LEVELS = [1, 4, 16, 64]
+ROUTER_CORPUS_SIZE = 100_000
+
+FIXTURES_DIR = os.environ.get("BENCH_FIXTURES", os.path.join(HERE, "fixtures"))
+BASELINE_FILE = os.environ.get("BENCH_BASELINE", os.path.join(HERE, "bench_baseline.json"))
+BENCH_TOLERANCE = float(os.environ.get("BENCH_TOLERANCE", "0.3"))   # chậm hơn 30% = hồi quy
+NOISE_FLOOR_MS = 1.0           # bỏ qua chênh lệch tuyệt đối nhỏ hơn mức này
+FIXTURE_SYMBOLS = ['HPG', 'VCB', 'BID', 'TCB', 'VIC']   # các mã trong test.py
+FIXTURE_SYNTHETIC = 200        # mã tổng hợp (sinh khi chạy) để bộ lọc thị trường có dữ liệu
+FIXTURE_DAILY_BARS = 600
+FIXTURE_INTRADAY_DAYS = 10
+OFFLINE_TOOL_REPEAT = 50
+OFFLINE_ROUNDS = 10            # số lượt lặp bộ câu hỏi test.py cho mỗi mức đồng thời
+OFFLINE_CONCURRENCY = [1, 8, 32]
+OFFLINE_PASSES = int(os.environ.get("BENCH_PASSES", "3"))   # lấy trung vị qua các lượt để giảm nhiễu
+CALIBRATION_RUNS = 7
+CALIBRATION_BARS = 20_000
+STARTUP_MODULES = ['tools', 'agent', 'main']
+STARTUP_RUNS = 5
+HEAVY_MODULES = ['llama_index', 'ollama', 'vnstock']   # phải được import lười
+INFO_TYPES = ['shareholders', 'officers', 'subsidiaries']
+AS_OF_FILE = 'as_of.txt'          # ngày ghi fixtures; FileProvider dời nến theo số phiên tới hôm nay
+
+
+def _fake_bars(symbol: str, start: str, end: str, interval: str = '1D') -> pd.DataFrame:
+    """Nến ngẫu nhiên nhưng cố định theo (mã, khung); intraday theo giờ phiên HOSE."""
+    days = trading_days(pd.Timestamp(start).date(), pd.Timestamp(end).date()).astype('datetime64[ns]')
+    if interval in INTERVAL_MINUTES:
+        step = INTERVAL_MINUTES[interval]
+        offsets = np.concatenate([np.arange(9 * 60, 11 * 60 + 30, step), np.arange(13 * 60, 14 * 60 + 45, step)])
+        times = (days[:, None] + offsets[None, :].astype('timedelta64[m]')).ravel()
+    else:
+        times = days
+    rng = np.random.default_rng(zlib.crc32(f"{symbol}:{interval}".encode()))
+    close = rng.uniform(10, 100) * np.exp(np.cumsum(rng.normal(0, 0.02 if interval == '1D' else 0.002, len(times))))
+    return pd.DataFrame({
+        "time": times, "open": close, "high": close * 1.01, "low": close * 0.99, "close": close,
+        "volume": rng.integers(10_000, 5_000_000, len(times)),
+    })
+
+
+class FakeQuote:
+    """Quote giả: sinh nến ngẫu nhiên (cố định theo mã), có độ trễ giả lập."""
+
+    def __init__(self, symbol: str, latency: float = FAKE_LATENCY):
+        self.symbol = symbol
+        self.latency = latency
+
+    def history(self, start: str, end: str, interval: str = '1D') -> pd.DataFrame:
+        time.sleep(self.latency)
+        return _fake_bars(self.symbol, start, end, interval)
+
+
+def synthetic_symbols(n: int):
+    letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    return ["".join(p) for p in itertools.islice(itertools.product(letters, repeat=3), n)]
+
+
+def market_symbols(n: int):
+    """Mã tổng hợp cho bộ lọc offline: X00..X99, Y00.. - có chữ số nên không trùng mã thật và router không nhận nhầm."""
+    return [f"{chr(ord('X') + i // 100)}{i % 100:02d}" for i in range(n)]
+
+
+def use_fake_source(latency: float = FAKE_LATENCY):
+    """Trỏ kho nến của tools sang thư mục tạm + FakeQuote."""
+    tools.bar_store = BarStore(
+        quote_factory=lambda symbol: FakeQuote(symbol, latency),
+        root=tempfile.mkdtemp(prefix="bench_store_"),
+    )
+
+
+async def run_load(questions, concurrency: int) -> float:
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(q):
+        async with slots:
+            await get_agent_response_async(q)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(q) for q in questions))
+    return time.perf_counter() - started
+
+
+def synthetic_questions(n: int):
+    """Corpus câu hỏi tổng hợp theo các mẫu trong test.py."""
+    rng = random.Random(0)
+    symbols = synthetic_symbols(500)
+    templates = [
+        "Lấy dữ liệu OHLCV {n} ngày gần nhất {a}?",
+        "Lấy giá đóng cửa của mã {a} từ đầu tháng {m} theo khung 1d?",
+        "Trong các mã {a}, {b} và {c} mã nào có giá mở cửa thấp nhất trong {n} ngày qua?",
+        "So sánh khối lượng giao dịch của {a} với {b} trong {w} tuần gần đây?",
+        "Danh sách cổ đông lớn của {a}",
+        "Tính cho tôi SMA{n} và RSI{w} của mã {a} trong {w} tháng với timeframe 1m",
+        "Tính MACD và Bollinger 20 của {a} từ đầu tháng {m} đến nay",
+        "Lọc cổ phiếu: RSI14 < 30 và close > SMA50",
+    ]
+    for _ in range(n):
+        a, b, c = rng.sample(symbols, 3)
+        yield rng.choice(templates).format(
+            a=a, b=b, c=c, n=rng.randint(5, 60), w=rng.randint(1, 14), m=rng.randint(1, 12)
+        )
+
+
+def bench_router():
+    from test import TEST_CASES
+
+    print("\n===== BENCHMARK ROUTER =====\n")
+    router = Router()
+    for name, questions, repeat in [
+        ("test.py", TEST_CASES, 2000),
+        ("synthetic", list(synthetic_questions(ROUTER_CORPUS_SIZE)), 1),
+    ]:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for q in questions:
+                router.parse(q)
+        elapsed = time.perf_counter() - started
+        total = len(questions) * repeat
+        print(f"{name:>10}: {total:>8} câu, {elapsed * 1e6 / total:6.2f} µs/câu")
+    print("\n===== HOÀN TẤT =====\n")
+
+
+_IMPORT_SCRIPT = (
+    "import sys, time; t = time.perf_counter(); import {module}; "
+    "print(time.perf_counter() - t); print(','.join(m for m in {heavy!r} if m in sys.modules))"
+)
+
+
+def _import_once(module: str, env: dict = None):
+    out = subprocess.run([sys.executable, "-c", _IMPORT_SCRIPT.format(module=module, heavy=HEAVY_MODULES)],
+                         cwd=HERE, env=env, capture_output=True, text=True, check=True).stdout.splitlines()
+    return float(out[0]), [m for m in out[1].split(',') if m]
+
+
+def _slowest_imports(module: str, top: int = 10):
+    """Các module tốn thời gian nhất theo `python -X importtime` (tính cả module con)."""
+    err = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                         cwd=HERE, capture_output=True, text=True, check=True).stderr
+    rows = []
+    for line in err.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[1].strip().isdigit() and not parts[2][1:].startswith(" "):
+            rows.append((int(parts[1]), parts[2].strip()))   # chỉ module cấp ngoài cùng
+    return sorted(rows, reverse=True)[:top]
+
+
+def bench_startup():
+    print("\n===== BENCHMARK STARTUP (import lạnh) =====\n")
+    env = dict(os.environ, LLM_ROUTING="0")
+    for module in STARTUP_MODULES:
+        runs = [_import_once(module, env) for _ in range(STARTUP_RUNS)]
+        loaded = runs[-1][1]
+        print(f"import {module:<6}: {statistics.median(t for t, _ in runs) * 1000:7.1f} ms (trung vị {STARTUP_RUNS} lần)"
+              f"  module nặng đã nạp: {', '.join(loaded) or 'không'}")
+
+    print(f"\nNặng nhất khi import {STARTUP_MODULES[-1]} (cộng dồn):")
+    for us, name in _slowest_imports(STARTUP_MODULES[-1]):
+        print(f"  {us / 1000:7.1f} ms  {name}")
+    print("\n===== HOÀN TẤT =====\n")
+
+
+def bench_load():
+    print("\n===== BENCHMARK /ask (nguồn dữ liệu giả) =====\n")
+    print(f"Độ trễ upstream giả lập: {FAKE_LATENCY * 1000:.0f} ms, {NUM_REQUESTS} câu hỏi/mức\n")
+
+    for concurrency in CONCURRENCY_LEVELS:
+        # Kho mới cho mỗi mức để mọi câu hỏi đều phải gọi upstream
+        use_fake_source()
+        questions = [f"Lấy dữ liệu OHLCV 10 ngày gần nhất {s}" for s in synthetic_symbols(NUM_REQUESTS)]
+        elapsed = asyncio.run(run_load(questions, concurrency))
+        print(f"concurrency={concurrency:>3}: {elapsed:6.2f}s  →  {NUM_REQUESTS / elapsed:8.1f} req/s")
+
+    print("\n===== HOÀN TẤT =====\n")
+
+
+# === offline: fixtures ghi sẵn + baseline ===
+
+
+def _fake_company(symbol: str, info_type: str) -> pd.DataFrame:
+    rng = random.Random(f"{symbol}:{info_type}")
+    if info_type == 'shareholders':
+        return pd.DataFrame({
+            "id": range(5), "share_holder": [f"Cổ đông {i}" for i in range(5)],
+            "quantity": [rng.randint(10 ** 6, 10 ** 9) for _ in range(5)],
+            "share_own_percent": [rng.uniform(0.01, 0.3) for _ in range(5)],
+            "update_date": ["2025-06-30"] * 5,
+        })
+    if info_type == 'officers':
+        return pd.DataFrame({
+            "officer_name": [f"Lãnh đạo {i}" for i in range(8)],
+            "position": ["Thành viên HĐQT"] * 8, "type": ["đang làm việc"] * 8,
+        })
+    return pd.DataFrame({"organ_name": [f"Công ty con {i}" for i in range(4)],
+                         "ownership_percent": [rng.uniform(0.5, 1) for _ in range(4)]})
+
+
+def _write_fixture(root: str, symbol: str, history: dict, company: dict):
+    for interval, df in history.items():
+        os.makedirs(os.path.join(root, interval), exist_ok=True)
+        # Giá lưu 2 chữ số thập phân như bảng giá (kho nến cũng chỉ giữ float32)
+        df.to_csv(os.path.join(root, interval, f"{symbol}.csv"), index=False, float_format='%.2f')
+    if company:
+        os.makedirs(os.path.join(root, 'company', symbol), exist_ok=True)
+        for info_type, df in company.items():
+            df.to_csv(os.path.join(root, 'company', symbol, f"{info_type}.csv"), index=False)
+
+
+def _write_listing(root: str):
+    """listing.csv cho FileProvider: mọi mã có nến ngày trong fixtures."""
+    symbols = sorted(f[:-4] for f in os.listdir(os.path.join(root, '1D')) if f.endswith('.csv'))
+    pd.DataFrame({"symbol": symbols, "exchange": "HSX", "type": "STOCK"}).to_csv(
+        os.path.join(root, 'listing.csv'), index=False)
+
+
+def _write_as_of(root: str, as_of: date):
+    with open(os.path.join(root, AS_OF_FILE), 'w', encoding='utf-8') as f:
+        f.write(as_of.isoformat())
+
+
+def _read_as_of(root: str) -> date:
+    with open(os.path.join(root, AS_OF_FILE), encoding='utf-8') as f:
+        return date.fromisoformat(f.read().strip())
+
+
+def _fixture_ranges(as_of: date):
+    return {
+        '1D': (trading_days_back(as_of, FIXTURE_DAILY_BARS).isoformat(), as_of.isoformat()),
+        '1m': (trading_days_back(as_of, FIXTURE_INTRADAY_DAYS).isoformat(), as_of.isoformat()),
+    }
+
+
+def _write_synthetic(root: str, symbols, as_of: date, full: bool = False):
+    """Nến tổng hợp (xác định theo mã) kết thúc ở as_of; full=True thêm nến 1m và thông tin doanh nghiệp."""
+    ranges = _fixture_ranges(as_of)
+    for symbol in symbols:
+        history = {'1D': _fake_bars(symbol, *ranges['1D'], '1D')}
+        if full:
+            history['1m'] = _fake_bars(symbol, *ranges['1m'], '1m')
+        company = {t: _fake_company(symbol, t) for t in INFO_TYPES} if full else {}
+        _write_fixture(root, symbol, history, company)
+
+
+def record_fixtures(root: str = FIXTURES_DIR):
+    """Ghi lại phản hồi thật của nguồn dữ liệu (VNSTOCK_SOURCES) cho các mã trong test.py (cần mạng)."""
+    live = build_provider()
+    as_of = date.today()
+    for symbol in FIXTURE_SYMBOLS:
+        history = {interval: live.history(symbol, start, end, interval)
+                   for interval, (start, end) in _fixture_ranges(as_of).items()}
+        company = {t: live.company(symbol, t) for t in INFO_TYPES}
+        _write_fixture(root, symbol, history, company)
+        print(f"Đã ghi {symbol}")
+    _write_as_of(root, as_of)
+    print(f"Đã ghi fixtures tại {root}; commit thư mục này rồi chạy: python bench.py offline --update-baseline")
+
+
+def prepare_replay(synthetic: bool = False) -> str:
+    """
+    Thư mục tạm cho FileProvider: các mã trong test.py (bản ghi thật từ fixtures/, hoặc
+    tổng hợp khi synthetic=True) + FIXTURE_SYNTHETIC mã tổng hợp cho bộ lọc thị trường,
+    cùng ngày as_of để FileProvider dời tất cả về hôm nay như nhau.
+    """
+    root = tempfile.mkdtemp(prefix="bench_replay_")
+    if synthetic:
+        as_of = date.today()
+        _write_synthetic(root, FIXTURE_SYMBOLS, as_of, full=True)
+    else:
+        if not os.path.exists(os.path.join(FIXTURES_DIR, AS_OF_FILE)):
+            print(f"Chưa có fixtures ghi từ nguồn thật trong {FIXTURES_DIR} "
+                  f"(ghi bằng: python bench.py record; chạy thử không cần mạng: python bench.py offline --synthetic)")
+            sys.exit(1)
+        shutil.copytree(FIXTURES_DIR, root, dirs_exist_ok=True)
+        as_of = _read_as_of(FIXTURES_DIR)
+    _write_synthetic(root, market_symbols(FIXTURE_SYNTHETIC), as_of)
+    _write_listing(root)
+    _write_as_of(root, as_of)
+    return root
+
+
+def use_fixtures(root: str):
+    """Trỏ tools sang FileProvider(root) + kho nến và trạng thái chỉ báo tạm mới; danh sách niêm yết lấy từ listing.csv."""
+    provider = FileProvider(root)
+    tools.provider = provider
+    store_root = tempfile.mkdtemp(prefix="bench_store_")
+    tools.bar_store = BarStore(quote_factory=provider.quote, root=store_root)
+    tools.indicator_states = IndicatorStateStore(os.path.join(store_root, '_indicator_state'))
+    _clear_caches()
+
+
+def _clear_caches():
+    """Bỏ câu trả lời và thông tin doanh nghiệp đã cache, để mỗi lượt đo chạy tool thật."""
+    tools.answer_cache.invalidate()
+    tools.company_cache.invalidate()
+
+
+def _summary(samples) -> dict:
+    ms = np.array(samples) * 1000
+    return {"p50_ms": round(float(np.percentile(ms, 50)), 3), "p95_ms": round(float(np.percentile(ms, 95)), 3)}
+
+
+def bench_offline_tools(root: str) -> dict:
+    cases = {
+        "analysis_1D": ("get_stock_analysis", dict(symbol='HPG', date_query='2 tháng',
+                                                   indicators=['SMA_20', 'RSI_14', 'MACD', 'BB'], resolution='1D')),
+        "analysis_1m": ("get_stock_analysis", dict(symbol='TCB', date_query='1 tuần',
+                                                   indicators=['RSI_14'], resolution='1m')),
+        "company_info": ("get_company_info", dict(symbol='VCB', info_type='officers')),
+        "compare_prices": ("compare_stock_prices", dict(symbols=['BID', 'TCB', 'VCB'], date_query='10 ngày')),
+        "compare_volumes": ("compare_stock_volumes", dict(symbol1='VIC', symbol2='HPG', date_query='2 tuần')),
+        "screen": ("screen_stocks", dict(condition="RSI_14 < 50 and close > SMA_50")),
+    }
+    use_fixtures(root)
+    tools.screen_market("close > 0", refresh=True)   # nạp kho nến cho bộ lọc thị trường
+    results = {}
+    for name, (tool, args) in cases.items():
+        fn = tools.tool_functions[tool]
+        fn(**args)   # lần đầu: nạp kho nến / cache
+        samples = []
+        for _ in range(OFFLINE_TOOL_REPEAT):
+            _clear_caches()
+            started = time.perf_counter()
+            fn(**args)
+            samples.append(time.perf_counter() - started)
+        results[f"tool.{name}"] = _summary(samples)
+        print(f"{name:>16}: p50 {results[f'tool.{name}']['p50_ms']:8.2f} ms   p95 {results[f'tool.{name}']['p95_ms']:8.2f} ms")
+    return results
+
+
+async def _timed_questions(questions, concurrency: int):
+    slots = asyncio.Semaphore(concurrency)
+    latencies, failures = [], []
+
+    async def one(q):
+        async with slots:
+            started = time.perf_counter()
+            result = await get_agent_result_async(q)
+            latencies.append(time.perf_counter() - started)
+            if not result.has_data:
+                failures.append((q, result.to_text()))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(q) for q in questions))
+    return time.perf_counter() - started, latencies, failures
+
+
+def bench_offline_e2e(root: str) -> dict:
+    from test import TEST_CASES
+
+    results = {}
+    for concurrency in OFFLINE_CONCURRENCY:
+        use_fixtures(root)   # kho mới: lượt đầu của mỗi câu phải đọc từ nguồn
+        elapsed, latencies, failures = 0.0, [], []
+        for _ in range(OFFLINE_ROUNDS):
+            # Mỗi lượt chạy lại tool thật (không đo cache câu trả lời); kho nến giữ nguyên
+            _clear_caches()
+            round_elapsed, round_latencies, round_failures = asyncio.run(_timed_questions(TEST_CASES, concurrency))
+            elapsed += round_elapsed
+            latencies += round_latencies
+            failures += round_failures
+        for q, answer in dict(failures).items():
+            print(f"  FAIL: {q} → {answer[:120]}")
+        results[f"e2e.c{concurrency}"] = {**_summary(latencies), "throughput": round(len(latencies) / elapsed, 2),
+                                           "failures": len(failures)}
+        r = results[f"e2e.c{concurrency}"]
+        print(f"concurrency={concurrency:>3}: {r['throughput']:8.1f} câu/s   p50 {r['p50_ms']:8.2f} ms   "
+              f"p95 {r['p95_ms']:8.2f} ms   lỗi {r['failures']}")
+    return results
+
+
+def _median_passes(passes: list) -> dict:
+    """Trung vị từng chỉ số qua các lượt đo (riêng số câu lỗi lấy lượt nhiều nhất)."""
+    merged = {}
+    for name, values in passes[0].items():
+        merged[name] = {}
+        for key in values:
+            samples = [p[name][key] for p in passes]
+            merged[name][key] = max(samples) if key == 'failures' else round(statistics.median(samples), 3)
+    return merged
+
+
+def calibrate() -> float:
+    """
+    Thời gian (ms, nhỏ nhất qua CALIBRATION_RUNS lượt) của một tải cố định giống các
+    tool: chỉ báo numpy/pandas trên chuỗi giá cố định + một vòng lặp Python thuần.
+    Kết quả đo được chia cho giá trị này để baseline so được trên máy khác.
+    """
+    rng = np.random.default_rng(0)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, CALIBRATION_BARS)))
+    volume = np.ones(CALIBRATION_BARS, dtype='int64')
+    best = float('inf')
+    for _ in range(CALIBRATION_RUNS):
+        started = time.perf_counter()
+        IndicatorEngine(close, close * 1.01, close * 0.99, volume).compute(['SMA_20', 'RSI_14', 'MACD', 'BB'])
+        sum(i * i for i in range(200_000))
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def normalize(results: dict, calibration_ms: float) -> dict:
+    """ms -> bội số của vòng hiệu chuẩn; câu/s -> câu mỗi vòng hiệu chuẩn."""
+    normalized = {}
+    for name, values in results.items():
+        normalized[name] = {}
+        for key, value in values.items():
+            if key.endswith('_ms'):
+                normalized[name][key[:-3]] = round(value / calibration_ms, 4)
+            elif key == 'throughput':
+                normalized[name][key] = round(value * calibration_ms / 1000, 4)
+            else:
+                normalized[name][key] = value
+    return normalized
+
+
+def compare_baseline(current: dict, baseline: dict, tolerance: float = BENCH_TOLERANCE,
+                     noise_floor: float = 0.0) -> list:
+    """
+    Danh sách hồi quy (số liệu đã normalize): độ trễ tăng / thông lượng giảm quá
+    tolerance, hoặc có thêm câu lỗi. Chênh lệch độ trễ dưới noise_floor bị bỏ qua.
+    """
+    regressions = []
+    for name, values in current.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for key, value in values.items():
+            old = base.get(key)
+            if old is None:
+                continue
+            if key in ('p50', 'p95') and value > old * (1 + tolerance) and value - old > noise_floor:
+                regressions.append(f"{name}.{key}: {old} → {value} (× vòng hiệu chuẩn)")
+            elif key == 'throughput' and value < old * (1 - tolerance):
+                regressions.append(f"{name}.{key}: {old} → {value} (câu / vòng hiệu chuẩn)")
+            elif key == 'failures' and value > old:
+                regressions.append(f"{name}.{key}: {old} → {value}")
+    return regressions
+
+
+def bench_offline(update_baseline: bool = False, synthetic: bool = False):
+    print("\n===== BENCHMARK OFFLINE (fixtures ghi sẵn) =====\n")
+    if synthetic and update_baseline:
+        print("Baseline chỉ được ghi từ fixtures ghi thật, không dùng --synthetic.")
+        sys.exit(1)
+    root = prepare_replay(synthetic)
+    use_fixtures(root)
+    get_router()   # nạp router (danh sách mã từ listing.csv) trước khi đo
+    calibration_ms = calibrate()
+    passes = []
+    for i in range(OFFLINE_PASSES):
+        print(f"--- lượt {i + 1}/{OFFLINE_PASSES} ---")
+        current = bench_offline_tools(root)
+        print()
+        current.update(bench_offline_e2e(root))
+        passes.append(current)
+    calibration_ms = min(calibration_ms, calibrate())   # trước và sau khi đo, lấy lần nhanh nhất
+    print(f"\nVòng hiệu chuẩn: {calibration_ms:.2f} ms")
+    current = normalize(_median_passes(passes), calibration_ms)
+    shutil.rmtree(root, ignore_errors=True)
+
+    if synthetic:
+        print("\nDữ liệu tổng hợp (--synthetic): không so với baseline.")
+        return
+    if update_baseline:
+        with open(BASELINE_FILE, 'w', encoding='utf-8') as f:
+            json.dump({"fixtures_as_of": _read_as_of(FIXTURES_DIR).isoformat(), "results": current},
+                      f, indent=2, ensure_ascii=False)
+            f.write("\n")
+        print(f"\nĐã lưu baseline vào {BASELINE_FILE}")
+        return
+    if not os.path.exists(BASELINE_FILE):
+        # Không tự tạo baseline: cổng CI phải có mốc để so, không âm thầm qua
+        print(f"\nKhông có baseline {BASELINE_FILE} (tạo bằng: python bench.py offline --update-baseline)")
+        sys.exit(1)
+
+    with open(BASELINE_FILE, encoding='utf-8') as f:
+        baseline = json.load(f)
+    if baseline.get("fixtures_as_of") != _read_as_of(FIXTURES_DIR).isoformat():
+        print("\nBaseline được đo trên bản fixtures khác (ghi lại bằng: python bench.py offline --update-baseline)")
+        sys.exit(1)
+    regressions = compare_baseline(current, baseline["results"], noise_floor=NOISE_FLOOR_MS / calibration_ms)
+    if regressions:
+        print(f"\n===== HỒI QUY (ngưỡng {BENCH_TOLERANCE:.0%}) =====")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print("\n===== KHÔNG CÓ HỒI QUY =====\n")
+
+
+BENCHMARKS = {
+    "load": bench_load,
+    "router": bench_router,
+    "startup": bench_startup,
+    "offline": bench_offline,
+    "record": record_fixtures,
+}
+
+
+def main():
+    flags = {a for a in sys.argv[1:] if a.startswith("--")}
+    names = [a for a in sys.argv[1:] if not a.startswith("--")] or ["load"]
+    for name in names:
+        if name == "offline":
+            bench_offline(update_baseline="--update-baseline" in flags, synthetic="--synthetic" in flags)
+        else:
+            BENCHMARKS[name]()
+
+
+if __name__ == "__main__":
+    main()
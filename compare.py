@@ -0,0 +1,85 @@
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from screener import build_matrix
+
+# So sánh chéo nhiều mã trong một lượt: các cột nến được căn về một trục phiên
+# chung (ma trận ngày × mã, như bộ lọc thị trường), rồi mọi số đo được tính
+# bằng phép gộp theo trục ngày trên mảng xếp chồng (trường × ngày × mã),
+# thay vì lặp từng mã với từng DataFrame.
+#
+# Số đo hỗ trợ:
+#   min_<giá> / max_<giá> / mean_<giá>   giá: open, high, low, close
+#   volume       tổng khối lượng
+#   return       tỷ suất sinh lời cả kỳ (close cuối / close đầu - 1)
+#   volatility   độ lệch chuẩn lợi suất log theo phiên, quy đổi năm
+#   corr         ma trận tương quan lợi suất theo phiên
+
+PRICE_FIELDS = ['open', 'high', 'low', 'close']
+AGGREGATES = {'min': np.nanmin, 'max': np.nanmax, 'mean': np.nanmean}
+SERIES_MEASURES = ['volume', 'return', 'volatility']
+DEFAULT_MEASURES = ['return', 'volatility', 'volume']
+TRADING_DAYS_PER_YEAR = 252
+
+
+def parse_measure(name: str) -> str:
+    """Chuẩn hóa tên số đo ('Min_Open' -> 'min_open'); ValueError nếu không hỗ trợ."""
+    measure = name.strip().lower()
+    if measure in SERIES_MEASURES or measure == 'corr':
+        return measure
+    agg, _, field = measure.partition('_')
+    if agg in AGGREGATES and field in PRICE_FIELDS:
+        return measure
+    raise ValueError(f"Số đo không hỗ trợ: {name}")
+
+
+def cross_section(columns_by_symbol: Dict[str, dict], measures: List[str]
+                  ) -> Tuple[List[str], np.ndarray, Dict[str, np.ndarray], Optional[np.ndarray]]:
+    """
+    (mã, trục ngày, {số đo: mảng theo mã}, ma trận tương quan hoặc None).
+    Mã không có nến bị bỏ qua; ngày mã không giao dịch lấy giá gần nhất trước đó.
+    """
+    dates, symbols, matrix = build_matrix(columns_by_symbol, lookback=None)
+    values = {}
+    if not symbols:
+        return symbols, dates, values, None
+
+    # (trường × ngày × mã): mỗi kiểu gộp tính cho cả 4 trường giá trong một lần gọi
+    prices = np.stack([matrix[f] for f in PRICE_FIELDS])
+    for agg in dict.fromkeys(m.split('_')[0] for m in measures if '_' in m):
+        reduced = AGGREGATES[agg](prices, axis=1)
+        for i, field in enumerate(PRICE_FIELDS):
+            if f"{agg}_{field}" in measures:
+                values[f"{agg}_{field}"] = reduced[i]
+
+    close = matrix['close']
+    if 'volume' in measures:
+        values['volume'] = matrix['volume'].sum(axis=0).astype('int64')
+    if 'return' in measures:
+        # Trước phiên đầu tiên của mã là NaN (không ffill được) -> lấy close hợp lệ đầu tiên
+        first = close[np.argmax(~np.isnan(close), axis=0), np.arange(len(symbols))]
+        values['return'] = close[-1] / first - 1
+
+    corr = None
+    if 'volatility' in measures or 'corr' in measures:
+        log_returns = np.diff(np.log(close), axis=0)
+        if 'volatility' in measures:
+            counts = np.sum(~np.isnan(log_returns), axis=0)
+            std = np.nanstd(log_returns, axis=0, ddof=1) if counts.max(initial=0) > 1 else np.nan
+            values['volatility'] = np.where(counts > 1, std, np.nan) * np.sqrt(TRADING_DAYS_PER_YEAR)
+        if 'corr' in measures:
+            complete = log_returns[~np.isnan(log_returns).any(axis=1)]
+            if len(complete) > 1 and len(symbols) > 1:
+                corr = np.corrcoef(complete, rowvar=False)
+            else:
+                corr = np.full((len(symbols), len(symbols)), np.nan)
+    return symbols, dates, values, corr
+
+
+def rank(values: np.ndarray) -> np.ndarray:
+    """Hạng 1 = giá trị lớn nhất; NaN xếp cuối."""
+    order = np.argsort(-np.where(np.isnan(values), -np.inf, values), kind='stable')
+    ranks = np.empty(len(values), dtype='int64')
+    ranks[order] = np.arange(1, len(values) + 1)
+    return ranks
@@ -0,0 +1,601 @@
+import os
+import re
+import copy
+import json
+import time
+import logging
+import tempfile
+import threading
+from collections import deque
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Bộ tính chỉ báo kỹ thuật dạng vector hóa.
+# Mọi mảng đều theo trục 0 là thời gian: (T,) cho một mã hoặc (T, N) cho N mã.
+# Các phép tính trung gian (cumsum, delta, true range, EMA...) được tính một lần
+# và dùng chung cho mọi chỉ báo trong cùng một yêu cầu.
+
+DEFAULT_PARAMS = {
+    'SMA': (20,),
+    'EMA': (20,),
+    'RSI': (14,),
+    'ATR': (14,),
+    'BB': (20, 2),
+    'MACD': (12, 26, 9),
+    'VWAP': (),
+}
+
+_SPEC_RE = re.compile(r'^(SMA|EMA|RSI|ATR|BB|MACD|VWAP)(?:_(\d+(?:_\d+)*))?$')
+
+
+def parse_indicator(spec: str) -> Tuple[str, Tuple[int, ...]]:
+    """'SMA_9' -> ('SMA', (9,)), 'MACD' -> ('MACD', (12, 26, 9)). Ném ValueError nếu không hỗ trợ."""
+    m = _SPEC_RE.match(str(spec).strip().upper())
+    if not m:
+        raise ValueError(f"Chỉ báo không hỗ trợ: {spec}")
+    kind = m.group(1)
+    defaults = DEFAULT_PARAMS[kind]
+    params = tuple(int(p) for p in m.group(2).split('_')) if m.group(2) else ()
+    params = params + defaults[len(params):]
+    if len(params) != len(defaults) or any(p <= 0 for p in params):
+        raise ValueError(f"Tham số không hợp lệ cho chỉ báo: {spec}")
+    return kind, params
+
+
+def output_names(spec: str) -> List[str]:
+    """Tên các cột kết quả của một chỉ báo (BB và MACD sinh nhiều cột)."""
+    kind, _ = parse_indicator(spec)
+    base = str(spec).strip().upper()
+    if kind == 'BB':
+        return [f"{base}_UPPER", f"{base}_MID", f"{base}_LOWER"]
+    if kind == 'MACD':
+        return [base, f"{base}_SIGNAL", f"{base}_HIST"]
+    return [base]
+
+
+# Chỉ báo làm mượt hàm mũ (EMA, Wilder) phụ thuộc toàn bộ lịch sử. Sau k nến, điểm
+# khởi tạo còn trọng số (1 - alpha)^k; cả hai hằng số dưới đây đưa trọng số đó về
+# khoảng e^-6 ≈ 0,25%:
+#   EMA (alpha = 2/(n+1)):   (1 - 2/(n+1))^(3n) ≈ e^-6
+#   Wilder (alpha = 1/n, RSI/ATR): (1 - 1/n)^(6n) ≈ e^-6 (với 3n còn ≈ 5%)
+EMA_CONVERGENCE = 3
+WILDER_CONVERGENCE = 6
+
+
+def warmup_bars(specs: List[str]) -> int:
+    """Số nến quá khứ cần có trước nến đầu tiên hiển thị để mọi chỉ báo đã ổn định."""
+    need = 0
+    for spec in specs or []:
+        kind, params = parse_indicator(spec)
+        if kind in ('SMA', 'BB'):
+            bars = params[0] - 1
+        elif kind == 'RSI':
+            bars = WILDER_CONVERGENCE * params[0] + 1   # +1: RSI bắt đầu từ chênh lệch giá
+        elif kind == 'ATR':
+            bars = WILDER_CONVERGENCE * params[0]
+        elif kind == 'EMA':
+            bars = EMA_CONVERGENCE * params[0]
+        elif kind == 'MACD':
+            fast, slow, signal = params
+            bars = EMA_CONVERGENCE * max(fast, slow) + EMA_CONVERGENCE * signal
+        else:
+            bars = 0   # VWAP tính theo phiên
+        need = max(need, bars)
+    return need
+
+
+def _with_zero_row(cum: np.ndarray) -> np.ndarray:
+    return np.vstack([np.zeros((1, cum.shape[1])), cum])
+
+
+def _smoothed(x: np.ndarray, n: int, alpha: float, start: int = 0) -> np.ndarray:
+    """
+    Làm mượt hàm mũ theo trục 0, khởi tạo bằng trung bình n giá trị đầu
+    (từ vị trí start). alpha = 2/(n+1) cho EMA, 1/n cho Wilder (RSI, ATR).
+    """
+    out = np.full(x.shape, np.nan)
+    first = start + n - 1
+    if x.shape[0] <= first:
+        return out
+    seed = x[start:start + n].mean(axis=0)
+    series = np.vstack([seed[None, :], x[first + 1:]])
+    out[first:] = pd.DataFrame(series).ewm(alpha=alpha, adjust=False).mean().to_numpy()
+    return out
+
+
+class IndicatorEngine:
+    """Tính nhiều chỉ báo trên cùng một bộ mảng giá, dùng chung các bước trung gian."""
+
+    def __init__(self, close, high=None, low=None, volume=None, sessions=None):
+        close = np.asarray(close, dtype='float64')
+        self._squeeze = close.ndim == 1
+        self.close = close.reshape(close.shape[0], -1)
+        self.high = None if high is None else np.asarray(high, dtype='float64').reshape(self.close.shape)
+        self.low = None if low is None else np.asarray(low, dtype='float64').reshape(self.close.shape)
+        self.volume = None if volume is None else np.asarray(volume, dtype='float64').reshape(self.close.shape)
+        self.sessions = None if sessions is None else np.asarray(sessions)
+        self._memo = {}
+
+    def _cached(self, key, fn):
+        if key not in self._memo:
+            self._memo[key] = fn()
+        return self._memo[key]
+
+    def _out(self, arr: np.ndarray) -> np.ndarray:
+        return arr[:, 0] if self._squeeze else arr
+
+    # --- bước trung gian dùng chung ---
+
+    def _cumsum(self) -> np.ndarray:
+        return self._cached('cumsum', lambda: _with_zero_row(np.cumsum(self.close, axis=0)))
+
+    def _cumsum_sq(self) -> np.ndarray:
+        return self._cached('cumsum_sq', lambda: _with_zero_row(np.cumsum(self.close ** 2, axis=0)))
+
+    def _rolling_mean(self, n: int) -> np.ndarray:
+        def calc():
+            out = np.full(self.close.shape, np.nan)
+            if self.close.shape[0] >= n:
+                cs = self._cumsum()
+                out[n - 1:] = (cs[n:] - cs[:-n]) / n
+            return out
+        return self._cached(('sma', n), calc)
+
+    def _delta(self) -> np.ndarray:
+        def calc():
+            d = np.full(self.close.shape, np.nan)
+            d[1:] = self.close[1:] - self.close[:-1]
+            return d
+        return self._cached('delta', calc)
+
+    def _true_range(self) -> np.ndarray:
+        if self.high is None or self.low is None:
+            raise ValueError("ATR cần dữ liệu high/low.")
+
+        def calc():
+            tr = self.high - self.low
+            prev = self.close[:-1]
+            tr[1:] = np.maximum.reduce([
+                tr[1:], np.abs(self.high[1:] - prev), np.abs(self.low[1:] - prev)
+            ])
+            return tr
+        return self._cached('true_range', calc)
+
+    def _ema(self, n: int) -> np.ndarray:
+        return self._cached(('ema', n), lambda: _smoothed(self.close, n, 2.0 / (n + 1)))
+
+    # --- chỉ báo ---
+
+    def sma(self, n: int) -> np.ndarray:
+        return self._out(self._rolling_mean(n))
+
+    def ema(self, n: int) -> np.ndarray:
+        return self._out(self._ema(n))
+
+    def rsi(self, n: int) -> np.ndarray:
+        """RSI làm mượt kiểu Wilder."""
+        d = self._delta()
+        gain = np.where(d > 0, d, 0.0)
+        loss = np.where(d < 0, -d, 0.0)
+        avg_gain = _smoothed(gain, n, 1.0 / n, start=1)
+        avg_loss = _smoothed(loss, n, 1.0 / n, start=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rsi = 100 - 100 / (1 + avg_gain / avg_loss)
+        rsi = np.where((avg_gain == 0) & (avg_loss == 0), 50.0, rsi)
+        return self._out(rsi)
+
+    def atr(self, n: int) -> np.ndarray:
+        """ATR làm mượt kiểu Wilder."""
+        return self._out(_smoothed(self._true_range(), n, 1.0 / n))
+
+    def bollinger(self, n: int, k: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        mid = self._rolling_mean(n)
+        std = np.full(self.close.shape, np.nan)
+        if self.close.shape[0] >= n:
+            cs2 = self._cumsum_sq()
+            mean_sq = (cs2[n:] - cs2[:-n]) / n
+            std[n - 1:] = np.sqrt(np.clip(mean_sq - mid[n - 1:] ** 2, 0, None))
+        return self._out(mid + k * std), self._out(mid), self._out(mid - k * std)
+
+    def macd(self, fast: int, slow: int, signal: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        line = self._ema(fast) - self._ema(slow)
+        sig = _smoothed(line, signal, 2.0 / (signal + 1), start=max(fast, slow) - 1)
+        return self._out(line), self._out(sig), self._out(line - sig)
+
+    def vwap(self) -> np.ndarray:
+        """VWAP lũy kế, reset tại đầu mỗi phiên nếu có `sessions`."""
+        if self.volume is None:
+            raise ValueError("VWAP cần dữ liệu volume.")
+        if self.high is not None and self.low is not None:
+            price = (self.high + self.low + self.close) / 3
+        else:
+            price = self.close
+        cum_pv = _with_zero_row(np.cumsum(price * self.volume, axis=0))
+        cum_v = _with_zero_row(np.cumsum(self.volume, axis=0))
+
+        T = self.close.shape[0]
+        if self.sessions is None:
+            anchor = np.zeros(T, dtype='int64')
+        else:
+            is_start = np.ones(T, dtype=bool)
+            is_start[1:] = self.sessions[1:] != self.sessions[:-1]
+            anchor = np.maximum.accumulate(np.where(is_start, np.arange(T), 0))
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            vwap = (cum_pv[1:] - cum_pv[anchor]) / (cum_v[1:] - cum_v[anchor])
+        return self._out(vwap)
+
+    # --- tổng hợp ---
+
+    def compute(self, specs: List[str]) -> Dict[str, np.ndarray]:
+        """Tính toàn bộ danh sách chỉ báo, trả về {tên cột: mảng}."""
+        results = {}
+        for spec in specs:
+            kind, params = parse_indicator(spec)
+            names = output_names(spec)
+            if kind == 'SMA':
+                values = (self.sma(*params),)
+            elif kind == 'EMA':
+                values = (self.ema(*params),)
+            elif kind == 'RSI':
+                values = (self.rsi(*params),)
+            elif kind == 'ATR':
+                values = (self.atr(*params),)
+            elif kind == 'BB':
+                values = self.bollinger(*params)
+            elif kind == 'MACD':
+                values = self.macd(*params)
+            else:
+                values = (self.vwap(),)
+            results.update(zip(names, values))
+        return results
+
+
+def compute_indicators(specs: List[str], close, high=None, low=None, volume=None, sessions=None) -> Dict[str, np.ndarray]:
+    return IndicatorEngine(close, high, low, volume, sessions).compute(specs)
+
+
+# === streaming (O(1) mỗi nến) ===
+# Phiên bản cập nhật từng nến của các chỉ báo trên, cho kết quả trùng với
+# IndicatorEngine khi được nạp cùng một chuỗi nến.
+
+HISTORY_BARS = 6000   # khoảng một tháng nến 1m (23 phiên × 255 nến)
+STATE_FORMAT = 2      # tăng khi đổi ý nghĩa snapshot: snapshot cũ bị bỏ, nạp lại từ đầu
+
+
+class _Streaming:
+    _deques = ()
+
+    def snapshot(self) -> dict:
+        return {k: (list(v) if k in self._deques else v) for k, v in self.__dict__.items()}
+
+    def restore(self, state: dict):
+        for k, v in state.items():
+            setattr(self, k, deque(v, maxlen=state['n']) if k in self._deques else v)
+        return self
+
+
+class _Smoother(_Streaming):
+    """Trung bình mũ khởi tạo bằng SMA của n giá trị đầu (giống _smoothed)."""
+
+    def __init__(self, n: int, alpha: float):
+        self.n = n
+        self.alpha = alpha
+        self.count = 0
+        self.seed_sum = 0.0
+        self.value = float('nan')
+
+    def update(self, x: float) -> float:
+        if self.count < self.n:
+            self.count += 1
+            self.seed_sum += x
+            if self.count == self.n:
+                self.value = self.seed_sum / self.n
+        else:
+            self.value += self.alpha * (x - self.value)
+        return self.value
+
+
+class StreamingSMA(_Streaming):
+    _deques = ('buf',)
+
+    def __init__(self, n: int):
+        self.n = n
+        self.buf = deque(maxlen=n)
+        self.total = 0.0
+
+    def update(self, bar: dict) -> tuple:
+        x = bar['close']
+        if len(self.buf) == self.n:
+            self.total -= self.buf[0]
+        self.buf.append(x)
+        self.total += x
+        return (self.total / self.n if len(self.buf) == self.n else float('nan'),)
+
+
+class StreamingEMA(_Streaming):
+    def __init__(self, n: int):
+        self.n = n
+        self.ema = _Smoother(n, 2.0 / (n + 1))
+
+    def update(self, bar: dict) -> tuple:
+        return (self.ema.update(bar['close']),)
+
+    def snapshot(self) -> dict:
+        return {'n': self.n, 'ema': self.ema.snapshot()}
+
+    def restore(self, state: dict):
+        self.ema.restore(state['ema'])
+        return self
+
+
+class StreamingRSI(_Streaming):
+    def __init__(self, n: int):
+        self.n = n
+        self.prev = None
+        self.gain = _Smoother(n, 1.0 / n)
+        self.loss = _Smoother(n, 1.0 / n)
+
+    def update(self, bar: dict) -> tuple:
+        close = bar['close']
+        if self.prev is None:
+            self.prev = close
+            return (float('nan'),)
+        d = close - self.prev
+        self.prev = close
+        avg_gain = self.gain.update(max(d, 0.0))
+        avg_loss = self.loss.update(max(-d, 0.0))
+        if avg_gain != avg_gain:   # NaN: chưa đủ n nến
+            return (float('nan'),)
+        if avg_loss == 0:
+            return (50.0 if avg_gain == 0 else 100.0,)
+        return (100 - 100 / (1 + avg_gain / avg_loss),)
+
+    def snapshot(self) -> dict:
+        return {'n': self.n, 'prev': self.prev, 'gain': self.gain.snapshot(), 'loss': self.loss.snapshot()}
+
+    def restore(self, state: dict):
+        self.prev = state['prev']
+        self.gain.restore(state['gain'])
+        self.loss.restore(state['loss'])
+        return self
+
+
+class StreamingATR(_Streaming):
+    def __init__(self, n: int):
+        self.n = n
+        self.prev = None
+        self.atr = _Smoother(n, 1.0 / n)
+
+    def update(self, bar: dict) -> tuple:
+        high, low, close = bar['high'], bar['low'], bar['close']
+        tr = high - low
+        if self.prev is not None:
+            tr = max(tr, abs(high - self.prev), abs(low - self.prev))
+        self.prev = close
+        return (self.atr.update(tr),)
+
+    def snapshot(self) -> dict:
+        return {'n': self.n, 'prev': self.prev, 'atr': self.atr.snapshot()}
+
+    def restore(self, state: dict):
+        self.prev = state['prev']
+        self.atr.restore(state['atr'])
+        return self
+
+
+class StreamingBollinger(_Streaming):
+    _deques = ('buf',)
+
+    def __init__(self, n: int, k: int):
+        self.n = n
+        self.k = k
+        self.buf = deque(maxlen=n)
+        self.total = 0.0
+        self.total_sq = 0.0
+
+    def update(self, bar: dict) -> tuple:
+        x = bar['close']
+        if len(self.buf) == self.n:
+            old = self.buf[0]
+            self.total -= old
+            self.total_sq -= old * old
+        self.buf.append(x)
+        self.total += x
+        self.total_sq += x * x
+        if len(self.buf) < self.n:
+            nan = float('nan')
+            return (nan, nan, nan)
+        mid = self.total / self.n
+        std = max(self.total_sq / self.n - mid * mid, 0.0) ** 0.5
+        return (mid + self.k * std, mid, mid - self.k * std)
+
+
+class StreamingMACD(_Streaming):
+    def __init__(self, fast: int, slow: int, signal: int):
+        self.fast = _Smoother(fast, 2.0 / (fast + 1))
+        self.slow = _Smoother(slow, 2.0 / (slow + 1))
+        self.signal = _Smoother(signal, 2.0 / (signal + 1))
+
+    def update(self, bar: dict) -> tuple:
+        line = self.fast.update(bar['close']) - self.slow.update(bar['close'])
+        if line != line:
+            nan = float('nan')
+            return (nan, nan, nan)
+        sig = self.signal.update(line)
+        return (line, sig, line - sig)
+
+    def snapshot(self) -> dict:
+        return {name: getattr(self, name).snapshot() for name in ('fast', 'slow', 'signal')}
+
+    def restore(self, state: dict):
+        for name in ('fast', 'slow', 'signal'):
+            getattr(self, name).restore(state[name])
+        return self
+
+
+class StreamingVWAP(_Streaming):
+    def __init__(self):
+        self.n = 0
+        self.session = None
+        self.cum_pv = 0.0
+        self.cum_v = 0.0
+
+    def update(self, bar: dict) -> tuple:
+        session = bar.get('session')
+        if session != self.session:
+            self.session = session
+            self.cum_pv = 0.0
+            self.cum_v = 0.0
+        price = (bar['high'] + bar['low'] + bar['close']) / 3
+        self.cum_pv += price * bar['volume']
+        self.cum_v += bar['volume']
+        return (self.cum_pv / self.cum_v if self.cum_v else float('nan'),)
+
+
+def make_streaming(spec: str) -> _Streaming:
+    kind, params = parse_indicator(spec)
+    return {
+        'SMA': StreamingSMA, 'EMA': StreamingEMA, 'RSI': StreamingRSI, 'ATR': StreamingATR,
+        'BB': StreamingBollinger, 'MACD': StreamingMACD, 'VWAP': StreamingVWAP,
+    }[kind](*params)
+
+
+class StreamingIndicatorSet:
+    """
+    Trạng thái chỉ báo của một (symbol, interval): nạp dần từng nến ĐÃ ĐÓNG theo
+    thời gian, giữ lại HISTORY_BARS kết quả gần nhất để dựng bảng mà không phải tính lại.
+    Nến đang hình thành chỉ được tính thử bằng `preview`, không ghi vào trạng thái.
+    """
+
+    def __init__(self, specs: List[str], history: int = HISTORY_BARS):
+        self.specs = [str(s).upper() for s in specs]
+        self.indicators = {spec: make_streaming(spec) for spec in self.specs}
+        self.names = [name for spec in self.specs for name in output_names(spec)]
+        self.history = deque(maxlen=history)   # (time, [giá trị theo self.names])
+        self.last_time = None
+
+    def reset(self):
+        self.__init__(self.specs, self.history.maxlen)
+
+    def update(self, bar: dict):
+        """Nạp một nến (dict có time/open/high/low/close/volume); bỏ qua nến cũ."""
+        if self.last_time is not None and bar['time'] <= self.last_time:
+            return None
+        values = []
+        for spec in self.specs:
+            values.extend(self.indicators[spec].update(bar))
+        self.history.append((bar['time'], values))
+        self.last_time = bar['time']
+        return dict(zip(self.names, values))
+
+    @property
+    def first_time(self):
+        """Mốc cũ nhất còn trong history (None nếu trống)."""
+        return self.history[0][0] if self.history else None
+
+    def preview(self, bar: dict) -> list:
+        """Giá trị chỉ báo cho nến chưa đóng, tính trên bản sao trạng thái (không ghi lại)."""
+        values = []
+        for spec in self.specs:
+            values.extend(copy.deepcopy(self.indicators[spec]).update(bar))
+        return values
+
+    def latest(self) -> dict:
+        return dict(zip(self.names, self.history[-1][1])) if self.history else {}
+
+    def columns(self, times, pending: tuple = None) -> Dict[str, list]:
+        """
+        Các cột chỉ báo căn theo danh sách thời gian (NaN nếu không còn trong history).
+        `pending`: (time, giá trị) của nến chưa đóng từ `preview`.
+        """
+        by_time = dict(self.history)
+        if pending is not None:
+            by_time[pending[0]] = pending[1]
+        nan_row = [float('nan')] * len(self.names)
+        rows = [by_time.get(t, nan_row) for t in times]
+        return {name: [row[i] for row in rows] for i, name in enumerate(self.names)}
+
+    def snapshot(self) -> dict:
+        return {
+            'format': STATE_FORMAT,
+            'specs': self.specs,
+            'last_time': self.last_time,
+            'history': [[t, v] for t, v in self.history],
+            'indicators': {spec: ind.snapshot() for spec, ind in self.indicators.items()},
+        }
+
+    @classmethod
+    def restore(cls, state: dict, history: int = HISTORY_BARS) -> 'StreamingIndicatorSet':
+        obj = cls(state['specs'], history)
+        obj.last_time = state['last_time']
+        obj.history.extend((t, v) for t, v in state['history'])
+        for spec, ind_state in state['indicators'].items():
+            obj.indicators[spec].restore(ind_state)
+        return obj
+
+
+class IndicatorStateStore:
+    """
+    Giữ StreamingIndicatorSet theo (symbol, interval, specs) trong bộ nhớ và
+    ghi snapshot JSON xuống đĩa (tối đa mỗi save_interval giây) để sống qua restart.
+    """
+
+    def __init__(self, root: str, save_interval: float = 30):
+        self.root = root
+        self.save_interval = save_interval
+        self._states = {}
+        self._last_saved = {}
+        self._guard = threading.Lock()
+        self.locks = {}
+
+    def _path(self, key) -> str:
+        symbol, interval, specs = key
+        return os.path.join(self.root, interval, f"{symbol}__{'-'.join(specs)}.json")
+
+    def get(self, symbol: str, interval: str, specs: List[str]) -> Tuple[StreamingIndicatorSet, threading.Lock]:
+        key = (symbol.upper(), interval, tuple(str(s).upper() for s in specs))
+        with self._guard:
+            if key not in self._states:
+                path = self._path(key)
+                state = None
+                if os.path.exists(path):
+                    try:
+                        with open(path, encoding='utf-8') as f:
+                            data = json.load(f)
+                        # Snapshot định dạng cũ có thể chứa nến chưa đóng -> bỏ, nạp lại từ đầu
+                        if data.get('format') == STATE_FORMAT:
+                            state = StreamingIndicatorSet.restore(data)
+                    except Exception as e:
+                        logging.error(f"Lỗi đọc trạng thái chỉ báo {path}: {e}")
+                self._states[key] = state or StreamingIndicatorSet(list(key[2]))
+                self.locks[key] = threading.Lock()
+                self._last_saved[key] = time.monotonic()
+            return self._states[key], self.locks[key]
+
+    def save(self, symbol: str, interval: str, specs: List[str], force: bool = False):
+        key = (symbol.upper(), interval, tuple(str(s).upper() for s in specs))
+        if key not in self._states:
+            return
+        if not force and time.monotonic() - self._last_saved[key] < self.save_interval:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self.locks[key]:
+            data = self._states[key].snapshot()
+        # File tạm riêng cho mỗi lần ghi: thread/worker khác cùng lưu không ghi xen vào nhau
+        fd, tmp = tempfile.mkstemp(prefix='.state', suffix='.tmp', dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self._last_saved[key] = time.monotonic()
+
+    def save_all(self):
+        for symbol, interval, specs in list(self._states):
+            self.save(symbol, interval, list(specs), force=True)
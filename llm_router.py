@@ -0,0 +1,103 @@
+import os
+import re
+import logging
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Callable, Optional
+
+from cache import TTLCache, MISSING
+from singleflight import SingleFlight
+
+logging.getLogger("ollama").setLevel(logging.ERROR)
+
+# Định tuyến bằng LLM (Ollama) - CHỈ dùng khi router luật không hiểu câu hỏi.
+# Có ngân sách thời gian cứng; kết quả (kể cả "không hiểu") được cache theo
+# câu hỏi đã chuẩn hóa để cùng một câu không bao giờ gọi model hai lần.
+
+LLM_ROUTING = os.environ.get("LLM_ROUTING", "0") == "1"
+OLLAMA_HOST = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
+LLM_MODEL = os.environ.get("LLM_MODEL", "llama3.1:8b")
+LLM_TIMEOUT = float(os.environ.get("LLM_TIMEOUT", "8"))        # timeout HTTP (giây)
+LLM_BUDGET = float(os.environ.get("LLM_BUDGET", "10"))         # tổng thời gian tối đa chờ model (giây)
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "2"))
+
+# "Không hiểu" cũng được cache, nhưng ngắn hơn để còn cơ hội thử lại
+MISS_TTL = 10 * 60
+
+SYSTEM_PROMPT = (
+    "Bạn là bộ định tuyến cho trợ lý chứng khoán Việt Nam. "
+    "Hãy gọi ĐÚNG MỘT tool phù hợp nhất với câu hỏi, tuân thủ hướng dẫn tham số của tool. "
+    "Nếu câu hỏi không liên quan đến các tool, KHÔNG gọi tool nào."
+)
+
+route_cache = TTLCache(maxsize=10_000, ttl=24 * 3600)
+_flight = SingleFlight()
+_pool = ThreadPoolExecutor(max_workers=LLM_MAX_CONCURRENCY, thread_name_prefix="llm")
+_client = None
+
+
+def normalize_question(question: str) -> str:
+    """Chuẩn hóa để các cách viết gần giống nhau dùng chung cache."""
+    q = question.strip().lower()
+    q = re.sub(r'\s+', ' ', q)
+    return q.strip(' ?.!')
+
+
+def _get_client():
+    """ollama.Client dùng chung; chỉ import ollama khi LLM routing thực sự được gọi."""
+    global _client
+    if _client is None:
+        import ollama
+        _client = ollama.Client(host=OLLAMA_HOST, timeout=LLM_TIMEOUT)
+    return _client
+
+
+def _ask_model(question: str, tools: list, tool_names: set) -> Optional[dict]:
+    response = _get_client().chat(
+        model=LLM_MODEL,
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": question},
+        ],
+        tools=tools,
+    )
+    for call in response["message"].get("tool_calls") or []:
+        name = call["function"]["name"]
+        if name in tool_names:
+            return {"name": name, "arguments": dict(call["function"]["arguments"])}
+    return None
+
+
+def _route(question: str, tools: list, tool_names: set, validate: Optional[Callable[[dict], bool]]):
+    """Trả về (tool_call, answered): answered=False nếu lỗi/quá hạn/tham số sai (không cache)."""
+    future = _pool.submit(_ask_model, question, tools, tool_names)
+    try:
+        tool_call = future.result(timeout=LLM_BUDGET)
+    except FutureTimeoutError:
+        future.cancel()
+        logging.error(f"LLM routing vượt ngân sách {LLM_BUDGET}s: {question[:80]}")
+        return None, False
+    except Exception as e:
+        logging.error(f"Lỗi LLM routing: {e}")
+        return None, False
+    if tool_call is not None and validate is not None and not validate(tool_call):
+        logging.error(f"LLM đề xuất tham số không hợp lệ, bỏ qua: {tool_call}")
+        return None, False
+    return tool_call, True
+
+
+def llm_route(question: str, tools: list, validate: Optional[Callable[[dict], bool]] = None) -> Optional[dict]:
+    """
+    Trả về tool_call {"name", "arguments"} do LLM chọn, hoặc None.
+    `tools`: danh sách schema dạng OpenAI function-calling.
+    `validate(tool_call)`: False -> coi như không định tuyến được và không cache kết quả.
+    """
+    key = normalize_question(question)
+    cached = route_cache.get(key)
+    if cached is not MISSING:
+        return cached
+
+    tool_names = {t["function"]["name"] for t in tools}
+    tool_call, answered = _flight.do(key, _route, question, tools, tool_names, validate)
+    if answered:
+        route_cache.set(key, tool_call, ttl=None if tool_call else MISS_TTL)
+    return tool_call
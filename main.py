@@ -1,22 +1,229 @@
 # main.py
-from fastapi import FastAPI
+import os
+import time
+import logging
+from typing import List, Optional
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from agent import get_agent_response
+from starlette.concurrency import iterate_in_threadpool
+from agent import get_agent_result_async, get_agent_result_tagged_async, get_agent_results_batch_async, format_answer, AgentOverloadedError, pending_requests
+from tools import cache_stats, indicator_states, screen_market
+from results import arrow_available, to_ndjson, to_sse
+from warmer import Warmer, WARM_WATCHLIST, parse_watchlist
+import metrics
+import workers
 
 app = FastAPI(title="Financial Agent API")
 
+# Trả header Server-Timing (thời gian từng bước) cho mọi request,
+# hoặc chỉ cho request có header "X-Trace: 1"
+METRICS_TRACE = os.environ.get("METRICS_TRACE", "0") == "1"
+
+@app.middleware("http")
+async def record_metrics(request: Request, call_next):
+    trace = metrics.start_trace()
+    started = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - started
+
+    route = request.scope.get("route")
+    path = route.path if route is not None else "other"
+    metrics.observe("request_seconds", elapsed, path=path)
+    metrics.inc("requests_total", path=path, status=response.status_code)
+    if METRICS_TRACE or request.headers.get("x-trace") == "1":
+        trace["total"] = elapsed
+        response.headers["Server-Timing"] = metrics.server_timing(trace)
+    return response
+
 class QueryInput(BaseModel):
     question: str
+    format: str = "text"   # "text" | "json" | "arrow"
+    stream: Optional[str] = None   # None | "ndjson" | "sse"
+
+ARROW_UNAVAILABLE = "Server chưa cài pyarrow nên không hỗ trợ format 'arrow'; dùng 'json'."
 
 class QueryOutput(BaseModel):
     answer: str
 
+def _etag_value(tag: str, fmt: str) -> str:
+    return f'"{tag}-{fmt}"'
+
+def _requested_tag(request: Request, fmt: str) -> Optional[str]:
+    """Lấy phần tag từ If-None-Match nếu nó ứng với đúng định dạng đang yêu cầu."""
+    header = request.headers.get("if-none-match", "").strip()
+    if header.startswith("W/"):
+        header = header[2:]
+    tag, _, tag_format = header.strip('"').rpartition("-")
+    return tag if tag and tag_format == fmt else None
+
 @app.post("/ask", response_model=QueryOutput)
-async def ask_agent(query: QueryInput):
-    print(f"[API] Nhận: {query.question}")
-    answer = get_agent_response(query.question)
-    print(f"[API] Trả: {answer[:100]}...")
-    return QueryOutput(answer=answer)
+async def ask_agent(query: QueryInput, request: Request):
+    logging.info(f"[API] Nhận: {query.question}")
+    if query.stream is not None:
+        return _stream_answer(query)
+    if query.format not in ("text", "json", "arrow"):
+        raise HTTPException(status_code=400, detail="format phải là 'text', 'json' hoặc 'arrow'.")
+    if query.format == "arrow" and not arrow_available():
+        raise HTTPException(status_code=406, detail=ARROW_UNAVAILABLE)
+    try:
+        result, tag = await get_agent_result_tagged_async(query.question, _requested_tag(request, query.format))
+    except AgentOverloadedError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    # Dữ liệu chưa đổi từ lần trước client đã nhận: 304, không chạy tool
+    headers = {"ETag": _etag_value(tag, query.format)} if tag else {}
+    if result is None:
+        return Response(status_code=304, headers=headers)
+
+    # Chỉ dựng đúng định dạng client yêu cầu
+    with metrics.timed('render'):
+        if query.format == "json":
+            return JSONResponse(result.to_json(), headers=headers)
+        if query.format == "arrow":
+            try:
+                body = result.to_arrow()
+            except ImportError:
+                raise HTTPException(status_code=406, detail=ARROW_UNAVAILABLE)
+            return Response(body, media_type="application/vnd.apache.arrow.stream", headers=headers)
+        answer = format_answer(result)
+
+    logging.info(f"[API] Trả: {answer[:100]}...")
+    return JSONResponse({"answer": answer}, headers=headers)
+
+STREAM_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+STREAM_BATCH_ROWS = 500
+
+def _encode_events(result, encode):
+    """
+    Header gửi ngay khi có (trước khi dựng hàng nào); các hàng được dựng và mã hóa
+    theo lô STREAM_BATCH_ROWS dòng để giảm số lần ghi socket.
+    """
+    batch = []
+    for event, payload in result.iter_events():
+        batch.append(encode(event, payload))
+        if event != "row" or len(batch) >= STREAM_BATCH_ROWS:
+            yield "".join(batch)
+            batch = []
+    if batch:
+        yield "".join(batch)
+
+def _stream_answer(query: QueryInput) -> StreamingResponse:
+    """Trả về ngay sự kiện 'start', sau đó header và từng hàng khi kết quả sẵn sàng."""
+    if query.stream not in STREAM_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="stream phải là 'ndjson' hoặc 'sse'.")
+    encode = to_ndjson if query.stream == "ndjson" else to_sse
+
+    async def events():
+        yield encode("start", {"question": query.question})
+        try:
+            result = await get_agent_result_async(query.question)
+        except AgentOverloadedError as e:
+            yield encode("error", {"message": str(e)})
+            return
+        # Mã hóa trong threadpool để bảng lớn không chiếm event loop
+        async for chunk in iterate_in_threadpool(_encode_events(result, encode)):
+            yield chunk
+
+    return StreamingResponse(events(), media_type=STREAM_MEDIA_TYPES[query.stream])
+
+class BatchInput(BaseModel):
+    questions: List[str]
+    format: str = "text"   # "text" | "json"
+
+MAX_BATCH_QUESTIONS = 50
+
+@app.post("/ask/batch")
+async def ask_batch(query: BatchInput):
+    """Nhiều câu hỏi một lần: dữ liệu trùng giữa các câu chỉ tải một lần."""
+    if query.format not in ("text", "json"):
+        raise HTTPException(status_code=400, detail="format phải là 'text' hoặc 'json'.")
+    if len(query.questions) > MAX_BATCH_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"Tối đa {MAX_BATCH_QUESTIONS} câu hỏi mỗi lần.")
+    try:
+        results = await get_agent_results_batch_async(query.questions)
+    except AgentOverloadedError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    answers = []
+    for question, (result, error) in zip(query.questions, results):
+        item = {"question": question, "error": error}
+        if result is not None:
+            if query.format == "json":
+                item["result"] = result.to_json()
+            else:
+                item["answer"] = format_answer(result)
+        answers.append(item)
+    return {"answers": answers}
+
+class ScreenInput(BaseModel):
+    condition: str
+    exchanges: Optional[List[str]] = None
+    limit: int = 50
+    refresh: bool = False
+
+@app.post("/screen")
+def screen(query: ScreenInput):
+    try:
+        df = screen_market(query.condition, query.exchanges, query.refresh)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except workers.WorkerTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    return {"count": len(df), "matches": df.head(query.limit).to_dict(orient="records")}
+
+# Làm ấm cache nền cho danh sách theo dõi (WARM_WATCHLIST), nhường khi có request thật
+warmer = Warmer(parse_watchlist(WARM_WATCHLIST), busy=lambda: pending_requests() > 0)
+
+@app.on_event("startup")
+def start_warmer():
+    warmer.start()
+
+@app.on_event("shutdown")
+def save_indicator_states():
+    warmer.stop()
+    workers.shutdown()
+    indicator_states.save_all()
+
+@app.get("/warmer/status")
+def get_warmer_status():
+    return warmer.status()
+
+# Số liệu chỉ tăng (xuất dạng counter, hậu tố _total để dùng được rate());
+# còn lại (size, in_flight, latency...) là gauge
+MONOTONIC_STATS = {
+    "hits", "misses", "evictions", "upstream_calls", "executed", "shared",
+    "calls", "errors", "hedges", "wins", "submitted", "completed", "timeouts", "restarts",
+}
+
+def _stat_sample(name: str, key: str, labels: dict, value):
+    if key in MONOTONIC_STATS:
+        return (f"{name}_total", "counter", labels, value)
+    return (name, "gauge", labels, value)
+
+def _cache_samples():
+    """Bộ đếm cache / kho nến / single-flight / nguồn dữ liệu cho /metrics."""
+    samples = [("agent_pending_requests", "gauge", {}, pending_requests())]
+    for group, stats in cache_stats().items():
+        for key, value in stats.items():
+            if isinstance(value, dict):   # số liệu theo từng nguồn dữ liệu
+                samples.extend(_stat_sample(f"{group}_{k}", k, {"name": key}, v) for k, v in value.items()
+                               if isinstance(v, (int, float)))
+            elif isinstance(value, (int, float)):
+                samples.append(_stat_sample(f"{group}_{key}", key, {}, value))
+    return sorted(samples, key=lambda sample: sample[0])
+
+metrics.register_collector(_cache_samples)
+metrics.describe("stage_seconds", "Thời gian từng bước xử lý (route, fetch, indicators, tool, render...)")
+metrics.describe("request_seconds", "Thời gian xử lý HTTP request theo endpoint")
+
+@app.get("/metrics")
+def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache/stats")
+def get_cache_stats():
+    return cache_stats()
 
 @app.get("/")
 def root():
@@ -0,0 +1,147 @@
+import time
+import threading
+import contextvars
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Đo đạc nhẹ cho toàn bộ pipeline: thời gian từng bước (route, fetch,
+# indicators, tool, render...), bộ đếm và histogram độ trễ, xuất ra dạng
+# văn bản Prometheus ở /metrics. Mỗi request có thể gom các bước của mình
+# vào một "trace" (contextvar) để trả về qua header Server-Timing.
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+PREFIX = "vnstock_"
+
+_trace: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar("trace", default=None)
+_lock = threading.Lock()
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # ô cuối: +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+# (tên, nhãn đã sắp xếp) -> Histogram / giá trị đếm
+_histograms: Dict[Tuple[str, tuple], Histogram] = {}
+_counters: Dict[Tuple[str, tuple], float] = {}
+_collectors: List[Callable[[], List[Tuple[str, str, dict, float]]]] = []
+_help: Dict[str, str] = {}
+
+
+def _key(name: str, labels: dict) -> Tuple[str, tuple]:
+    return name, tuple(sorted(labels.items()))
+
+
+def observe(name: str, value: float, **labels):
+    with _lock:
+        key = _key(name, labels)
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = Histogram()
+        hist.observe(value)
+
+
+def inc(name: str, amount: float = 1, **labels):
+    with _lock:
+        key = _key(name, labels)
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def register_collector(fn: Callable[[], List[Tuple[str, str, dict, float]]]):
+    """fn() -> [(tên, 'counter'|'gauge', nhãn, giá trị)], gọi mỗi lần render /metrics."""
+    _collectors.append(fn)
+
+
+def describe(name: str, text: str):
+    _help[name] = text
+
+
+# --- trace theo request ---
+
+
+def start_trace() -> Dict[str, float]:
+    trace = {}
+    _trace.set(trace)
+    return trace
+
+
+def current_trace() -> Optional[Dict[str, float]]:
+    return _trace.get()
+
+
+@contextmanager
+def timed(stage: str):
+    """Đo một bước: ghi vào histogram stage_seconds và cộng vào trace của request (nếu có)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        observe("stage_seconds", elapsed, stage=stage)
+        trace = _trace.get()
+        if trace is not None:
+            trace[stage] = trace.get(stage, 0.0) + elapsed
+
+
+def server_timing(trace: Dict[str, float]) -> str:
+    """Header Server-Timing: 'route;dur=0.4, fetch;dur=120.3' (mili giây)."""
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in trace.items())
+
+
+# --- xuất dạng Prometheus ---
+
+
+def _escape(value) -> str:
+    """Giá trị nhãn theo định dạng Prometheus: thoát \\, " và xuống dòng."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels, extra: dict = None) -> str:
+    items = list(labels) + list((extra or {}).items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+def render() -> str:
+    lines = []
+    with _lock:
+        histograms = {k: (list(h.counts), h.sum, h.count) for k, h in _histograms.items()}
+        counters = dict(_counters)
+
+    seen = set()
+    for (name, labels), (counts, total, count) in sorted(histograms.items()):
+        full = PREFIX + name
+        if full not in seen:
+            if name in _help:
+                lines.append(f"# HELP {full} {_help[name]}")
+            lines.append(f"# TYPE {full} histogram")
+            seen.add(full)
+        cumulative = 0
+        for bound, n in zip(list(BUCKETS) + ["+Inf"], counts):
+            cumulative += n
+            lines.append(f"{full}_bucket{_labels(labels, {'le': bound})} {cumulative}")
+        lines.append(f"{full}_sum{_labels(labels)} {total}")
+        lines.append(f"{full}_count{_labels(labels)} {count}")
+
+    samples = [(name, "counter", labels, value) for (name, labels), value in sorted(counters.items())]
+    for fn in _collectors:
+        samples.extend((name, kind, tuple(sorted(labels.items())), value) for name, kind, labels, value in fn())
+    for name, kind, labels, value in samples:
+        full = PREFIX + name
+        if full not in seen:
+            if name in _help:
+                lines.append(f"# HELP {full} {_help[name]}")
+            lines.append(f"# TYPE {full} {kind}")
+            seen.add(full)
+        lines.append(f"{full}{_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,334 @@
+import os
+import time
+import logging
+import threading
+from datetime import date
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Optional
+
+import pandas as pd
+
+from cache import TTLCache, MISSING
+from trading_calendar import sessions_between, shift_trading_days
+
+# Lớp nguồn dữ liệu: mỗi Provider trả về nến (history), thông tin doanh nghiệp
+# (company) và danh sách niêm yết (listing) dạng DataFrame thô như vnstock. FailoverProvider xếp các nguồn theo
+# tỉ lệ lỗi rồi độ trễ quan sát được, gửi yêu cầu dự phòng (hedge) khi nguồn chính chậm bất
+# thường và chuyển sang nguồn kế tiếp khi nguồn chính lỗi.
+#
+# Cấu hình: VNSTOCK_SOURCES="TCBS,VCI" (nguồn đầu là nguồn chính), có thể dùng
+# "file:<thư mục>" cho dữ liệu ghi sẵn (kiểm thử / benchmark offline).
+
+RATE_LIMIT = float(os.environ.get("VNSTOCK_RATE_LIMIT", "10"))     # yêu cầu/giây mỗi nguồn
+RATE_BURST = int(os.environ.get("VNSTOCK_RATE_BURST", "20"))
+HEDGE_AFTER = os.environ.get("VNSTOCK_HEDGE_AFTER")                # giây; bỏ trống = tự thích nghi
+HEDGE_FACTOR = 3.0      # hedge khi chờ quá HEDGE_FACTOR × độ trễ trung bình của nguồn
+HEDGE_MIN = 0.5
+LISTING_SOURCES = {'TCBS': 'VCI'}   # TCBS không cung cấp danh sách niêm yết
+HTTP_KEEPALIVE = os.environ.get("VNSTOCK_HTTP_KEEPALIVE", "1") == "1"   # Session keep-alive theo thread
+
+
+class RateLimiter:
+    """Token bucket: tối đa `rate` yêu cầu/giây, cho phép dồn `burst` yêu cầu."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_for = (1 - self._tokens) / self.rate
+            time.sleep(wait_for)
+
+
+class _QuoteAdapter:
+    """Đối tượng giống vnstock.Quote (chỉ có .history) để dùng với BarStore."""
+
+    def __init__(self, provider: 'Provider', symbol: str):
+        self.provider = provider
+        self.symbol = symbol
+
+    def history(self, start: str, end: str, interval: str = '1D') -> pd.DataFrame:
+        return self.provider.history(self.symbol, start, end, interval)
+
+
+class Provider:
+    name = "base"
+
+    def history(self, symbol: str, start: str, end: str, interval: str = '1D') -> pd.DataFrame:
+        raise NotImplementedError
+
+    def company(self, symbol: str, info_type: str) -> pd.DataFrame:
+        raise NotImplementedError
+
+    def listing(self) -> pd.DataFrame:
+        """Các mã niêm yết: cột symbol, exchange (và type nếu nguồn có)."""
+        raise NotImplementedError
+
+    def quote(self, symbol: str) -> _QuoteAdapter:
+        return _QuoteAdapter(self, symbol.upper())
+
+    def stats(self) -> dict:
+        return {}
+
+
+# === kết nối keep-alive cho vnstock ===
+# vnstock gửi mọi yêu cầu HTTP qua vnstock.core.utils.client bằng requests.get/post
+# cấp module (mỗi lần một kết nối TCP/TLS mới) và không nhận Session từ ngoài vào.
+# Tên `requests` trong riêng module đó được thay bằng _SessionRequests: khi một
+# VnstockProvider đang gọi trên thread hiện tại, get/post đi qua Session riêng của
+# provider cho thread đó; mọi lời gọi khác vẫn là requests gốc.
+
+_active = threading.local()     # .session: Session của provider đang gọi trên thread này
+_routing_lock = threading.Lock()
+_routed: Optional[bool] = None
+
+
+class _SessionRequests:
+    def __init__(self, module):
+        self._requests = module
+
+    def __getattr__(self, name):
+        return getattr(self._requests, name)
+
+    def get(self, url, **kwargs):
+        return (getattr(_active, 'session', None) or self._requests).get(url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return (getattr(_active, 'session', None) or self._requests).post(url, **kwargs)
+
+
+def _route_vnstock_http() -> bool:
+    """Cài _SessionRequests vào module HTTP của vnstock (một lần); False nếu bản vnstock không có module đó."""
+    global _routed
+    with _routing_lock:
+        if _routed is None:
+            try:
+                from vnstock.core.utils import client
+                _routed = hasattr(client, 'requests')
+            except ImportError:
+                _routed = False
+            if _routed:
+                if not isinstance(client.requests, _SessionRequests):
+                    client.requests = _SessionRequests(client.requests)
+            else:
+                logging.warning("Bản vnstock này không gửi HTTP qua vnstock.core.utils.client: không dùng kết nối keep-alive.")
+        return _routed
+
+
+class VnstockProvider(Provider):
+    """
+    Một nguồn của vnstock (TCBS, VCI, ...). Tái sử dụng đối tượng Quote/Company theo mã
+    và một requests.Session keep-alive cho mỗi thread gọi nguồn này.
+    """
+
+    def __init__(self, source: str, rate: float = RATE_LIMIT, burst: int = RATE_BURST,
+                 keepalive: bool = HTTP_KEEPALIVE):
+        self.source = source.upper()
+        self.name = self.source
+        self.limiter = RateLimiter(rate, burst)
+        self.keepalive = keepalive
+        self._clients = TTLCache(maxsize=4096, ttl=3600)
+        self._local = threading.local()
+
+    @contextmanager
+    def _http(self):
+        """Trong khối with, HTTP của vnstock trên thread này dùng Session keep-alive của nguồn."""
+        if not self.keepalive or not _route_vnstock_http():
+            yield
+            return
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            import requests
+            session = self._local.session = requests.Session()
+        previous, _active.session = getattr(_active, 'session', None), session
+        try:
+            yield
+        finally:
+            _active.session = previous
+
+    def _client(self, kind: str, symbol: str):
+        key = (kind, symbol)
+        client = self._clients.get(key)
+        if client is MISSING:
+            from vnstock import Quote, Company
+            cls = Quote if kind == 'quote' else Company
+            client = cls(symbol=symbol, source=self.source)
+            self._clients.set(key, client)
+        return client
+
+    def history(self, symbol: str, start: str, end: str, interval: str = '1D') -> pd.DataFrame:
+        self.limiter.acquire()
+        with self._http():
+            return self._client('quote', symbol.upper()).history(start=start, end=end, interval=interval)
+
+    def company(self, symbol: str, info_type: str) -> pd.DataFrame:
+        if info_type not in ('shareholders', 'officers', 'subsidiaries'):
+            raise ValueError("Loại thông tin không hợp lệ.")
+        self.limiter.acquire()
+        with self._http():
+            return getattr(self._client('company', symbol.upper()), info_type)()
+
+    def listing(self) -> pd.DataFrame:
+        from vnstock import Listing
+        self.limiter.acquire()
+        with self._http():
+            return Listing(source=LISTING_SOURCES.get(self.source, self.source)).symbols_by_exchange()
+
+
+class FileProvider(Provider):
+    """
+    Dữ liệu ghi sẵn trên đĩa: <root>/<interval>/<MÃ>.csv (time, open, high, low, close, volume),
+    <root>/company/<MÃ>/<info_type>.csv và <root>/listing.csv (symbol, exchange, type).
+    Nếu có <root>/as_of.txt (ngày ghi dữ liệu), nến được dời theo số phiên từ ngày đó
+    tới hôm nay, để dữ liệu ghi một lần vẫn trả lời được "N ngày gần nhất".
+    Thiếu file -> ném FileNotFoundError.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.name = f"file:{root}"
+        self.shift = 0
+        as_of = os.path.join(root, 'as_of.txt')
+        if os.path.exists(as_of):
+            with open(as_of, encoding='utf-8') as f:
+                self.shift = sessions_between(date.fromisoformat(f.read().strip()), date.today())
+
+    def history(self, symbol: str, start: str, end: str, interval: str = '1D') -> pd.DataFrame:
+        df = pd.read_csv(os.path.join(self.root, interval, f"{symbol.upper()}.csv"), parse_dates=['time'])
+        if self.shift:
+            times = df['time'].values
+            days = times.astype('datetime64[D]')
+            df['time'] = shift_trading_days(days, self.shift).astype('datetime64[ns]') + (times - days)
+        end_exclusive = pd.Timestamp(end) + pd.Timedelta(days=1)
+        return df[(df['time'] >= pd.Timestamp(start)) & (df['time'] < end_exclusive)].reset_index(drop=True)
+
+    def company(self, symbol: str, info_type: str) -> pd.DataFrame:
+        return pd.read_csv(os.path.join(self.root, 'company', symbol.upper(), f"{info_type}.csv"))
+
+    def listing(self) -> pd.DataFrame:
+        return pd.read_csv(os.path.join(self.root, 'listing.csv'))
+
+
+class FailoverProvider(Provider):
+    """
+    Gọi nguồn ít lỗi nhất trước, cùng tỉ lệ lỗi thì nguồn nhanh hơn (độ trễ trung bình trượt). Nếu sau `hedge_after`
+    giây chưa xong thì gửi thêm yêu cầu tới nguồn kế tiếp và lấy kết quả về trước;
+    nếu một nguồn lỗi thì chuyển ngay sang nguồn kế tiếp.
+    """
+
+    def __init__(self, providers: List[Provider], hedge_after: Optional[float] = None, max_workers: int = 16):
+        self.providers = providers
+        self.name = ",".join(p.name for p in providers)
+        self.hedge_after = hedge_after
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="provider")
+        self._lock = threading.Lock()
+        self._stats = {p.name: {"calls": 0, "errors": 0, "recent_errors": 0, "hedges": 0,
+                                   "wins": 0, "latency": None} for p in providers}
+
+    def _ordered(self) -> List[Provider]:
+        # Xếp theo tỉ lệ lỗi trước: nguồn lỗi nhanh (chưa đo được độ trễ) không được giữ
+        # chỗ đầu. Nguồn chưa có độ trễ xếp sau nguồn đã đo; chưa nguồn nào có số liệu
+        # thì giữ thứ tự cấu hình.
+        def score(item):
+            i, p = item
+            s = self._stats[p.name]
+            error_rate = s["recent_errors"] / s["calls"] if s["calls"] else 0.0
+            latency = s["latency"] if s["latency"] is not None else float("inf")
+            return (error_rate, latency, i)
+        return [p for _, p in sorted(enumerate(self.providers), key=score)]
+
+    def _hedge_delay(self, provider: Provider) -> float:
+        if self.hedge_after is not None:
+            return self.hedge_after
+        latency = self._stats[provider.name]["latency"]
+        return HEDGE_MIN if latency is None else max(HEDGE_MIN, HEDGE_FACTOR * latency)
+
+    def _timed(self, provider: Provider, method: str, *args):
+        started = time.monotonic()
+        try:
+            result = getattr(provider, method)(*args)
+        except Exception:
+            with self._lock:
+                s = self._stats[provider.name]
+                s["errors"] += 1            # tổng số lỗi (chỉ tăng, xuất ra /metrics)
+                s["recent_errors"] += 1     # dùng để xếp hạng, giảm dần khi nguồn trả lời được
+            raise
+        elapsed = time.monotonic() - started
+        with self._lock:
+            s = self._stats[provider.name]
+            s["latency"] = elapsed if s["latency"] is None else 0.8 * s["latency"] + 0.2 * elapsed
+            # Nguồn trả lời thành công thì dần được "tha" lỗi cũ
+            s["recent_errors"] = max(0, s["recent_errors"] - 1)
+        return result
+
+    def _call(self, method: str, *args):
+        queue = self._ordered()
+        running = {}
+        last_error = None
+        while queue or running:
+            if queue and (not running or len(running) < 2):
+                provider = queue.pop(0)
+                with self._lock:
+                    self._stats[provider.name]["calls"] += 1
+                    if running:
+                        self._stats[provider.name]["hedges"] += 1
+                running[self._pool.submit(self._timed, provider, method, *args)] = provider
+
+            # Chờ nguồn đầu tiên tới hạn hedge; khi đã hedge thì chờ bất kỳ nguồn nào xong
+            timeout = self._hedge_delay(next(iter(running.values()))) if queue and len(running) == 1 else None
+            done, _ = wait(list(running), timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                provider = running.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    last_error = e
+                    logging.error(f"Nguồn {provider.name} lỗi ({method} {args[:1]}): {e}")
+                    continue
+                with self._lock:
+                    self._stats[provider.name]["wins"] += 1
+                return result
+        raise last_error or RuntimeError("Không có nguồn dữ liệu nào.")
+
+    def history(self, symbol: str, start: str, end: str, interval: str = '1D') -> pd.DataFrame:
+        return self._call('history', symbol, start, end, interval)
+
+    def company(self, symbol: str, info_type: str) -> pd.DataFrame:
+        return self._call('company', symbol, info_type)
+
+    def listing(self) -> pd.DataFrame:
+        return self._call('listing')
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {name: dict(s) for name, s in self._stats.items()}
+
+
+def build_provider(spec: str = None) -> Provider:
+    """'TCBS,VCI' -> FailoverProvider(TCBS, VCI); 'file:<dir>' -> FileProvider; một nguồn -> chính nó."""
+    spec = spec or os.environ.get("VNSTOCK_SOURCES", "TCBS,VCI")
+    providers = []
+    for item in (s.strip() for s in spec.split(",") if s.strip()):
+        if item.lower().startswith("file:"):
+            providers.append(FileProvider(item[5:]))
+        else:
+            providers.append(VnstockProvider(item))
+    if not providers:
+        raise ValueError("VNSTOCK_SOURCES rỗng.")
+    if len(providers) == 1:
+        return providers[0]
+    return FailoverProvider(providers, hedge_after=float(HEDGE_AFTER) if HEDGE_AFTER else None)
@@ -0,0 +1,42 @@
+import numpy as np
+
+from bars import Bars
+from trading_calendar import INTERVAL_MINUTES
+
+# Gộp nến 1 phút thành các khung lớn hơn (5m/15m/30m/1H/1D) bằng phép gộp
+# vector hóa (reduceat), căn theo giờ phiên HOSE: mỗi khung được tính từ đầu
+# phiên sáng (9:00, gồm ATO) hoặc đầu phiên chiều (13:00), nên không có nến
+# nào vắt qua giờ nghỉ trưa; nến ATC 14:45 rơi vào khung chứa mốc 14:45.
+
+NS_PER_MINUTE = 60 * 10 ** 9
+MINUTES_PER_DAY = 24 * 60
+MORNING_OPEN = 9 * 60
+AFTERNOON_OPEN = 13 * 60
+
+
+def bucket_keys(time_ns: np.ndarray, interval: str) -> np.ndarray:
+    """Mốc bắt đầu (phút kể từ epoch) của khung chứa từng nến."""
+    minutes = time_ns // NS_PER_MINUTE
+    day, minute = np.divmod(minutes, MINUTES_PER_DAY)
+    if interval.upper() == '1D':
+        return day * MINUTES_PER_DAY
+    step = INTERVAL_MINUTES[interval]
+    session_open = np.where(minute >= AFTERNOON_OPEN, AFTERNOON_OPEN, MORNING_OPEN)
+    return day * MINUTES_PER_DAY + session_open + (minute - session_open) // step * step
+
+
+def resample(bars: Bars, interval: str) -> Bars:
+    """Gộp nến (đã sắp xếp theo thời gian) sang khung `interval`; time = mốc đầu khung."""
+    if not len(bars) or interval == '1m':
+        return bars
+    keys = bucket_keys(bars.time, interval)
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    ends = np.r_[starts[1:], len(keys)] - 1
+    return Bars(
+        keys[starts] * NS_PER_MINUTE,
+        bars.open[starts],
+        np.maximum.reduceat(bars.high, starts),
+        np.minimum.reduceat(bars.low, starts),
+        bars.close[ends],
+        np.add.reduceat(bars.volume, starts),
+    )
@@ -0,0 +1,203 @@
+import json
+import math
+import importlib.util
+from typing import Any, Callable, Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+# Kết quả có cấu trúc của các tool: bảng dạng cột (mảng) + các trường tóm tắt.
+# Việc dựng text/JSON/Arrow để tầng API quyết định, chỉ làm khi cần và chỉ một lần.
+# Bảng lớn có thể là ColumnSource: các hàng chỉ được dựng theo lô khi được đọc,
+# nên khi stream, header đi trước và bộ nhớ không phụ thuộc kích thước bảng.
+
+
+class ColumnSource:
+    """Bảng dựng theo lô: fn(lo, hi) -> {tên cột: mảng} cho các hàng [lo, hi)."""
+
+    def __init__(self, names: List[str], num_rows: int, fn: Callable[[int, int], Dict[str, Any]]):
+        self.names = list(names)
+        self.num_rows = num_rows
+        self.fn = fn
+
+    def chunk(self, lo: int, hi: int) -> Dict[str, Any]:
+        return self.fn(lo, min(hi, self.num_rows))
+
+    def materialize(self) -> Dict[str, Any]:
+        return self.chunk(0, self.num_rows) if self.num_rows else {name: [] for name in self.names}
+
+
+class ToolResult:
+    """
+    summary: các dòng tóm tắt in trước bảng.
+    columns: bảng dạng cột {tên: mảng/list} hoặc ColumnSource (dựng theo lô), có thể rỗng.
+    notes: các dòng in sau bảng (cảnh báo, kết luận).
+    fields: số liệu tóm tắt dạng máy đọc được (ví dụ total_volume).
+    message: câu trả lời thuần văn bản (thông báo lỗi / không có dữ liệu).
+    """
+
+    def __init__(self, summary: List[str] = None, columns: Union[Dict[str, Any], ColumnSource] = None,
+                 notes: List[str] = None, fields: Dict[str, Any] = None,
+                 table_title: str = "", float_format: Optional[str] = "{:,.0f}",
+                 message: Optional[str] = None):
+        self.summary = summary or []
+        self._source = columns if isinstance(columns, ColumnSource) else None
+        self._columns = None if self._source is not None else (columns or {})
+        self.notes = notes or []
+        self.fields = fields or {}
+        self.table_title = table_title
+        self.float_format = float_format
+        self.message = message
+        self._rendered = {}
+
+    @classmethod
+    def text(cls, message: str) -> 'ToolResult':
+        return cls(message=message)
+
+    @property
+    def has_data(self) -> bool:
+        return self.message is None
+
+    @property
+    def columns(self) -> Dict[str, Any]:
+        """Toàn bộ bảng (ColumnSource chỉ được dựng hết ở lần truy cập đầu)."""
+        if self._columns is None:
+            self._columns = self._source.materialize()
+        return self._columns
+
+    def column_names(self) -> List[str]:
+        return self._source.names if self._columns is None else list(self._columns)
+
+    def num_rows(self) -> int:
+        if self._columns is None:
+            return self._source.num_rows
+        return len(next(iter(self._columns.values()))) if self._columns else 0
+
+    def column_chunk(self, lo: int, hi: int) -> Dict[str, Any]:
+        if self._columns is None:
+            return self._source.chunk(lo, hi)
+        return {name: values[lo:hi] for name, values in self._columns.items()}
+
+    # --- render ---
+
+    def _cached(self, fmt: str, fn):
+        if fmt not in self._rendered:
+            self._rendered[fmt] = fn()
+        return self._rendered[fmt]
+
+    def to_text(self) -> str:
+        return self._cached('text', self._render_text)
+
+    def to_json(self) -> dict:
+        return self._cached('json', self._render_json)
+
+    def to_arrow(self) -> bytes:
+        return self._cached('arrow', self._render_arrow)
+
+    def table_text(self) -> str:
+        if not self.columns:
+            return ""
+        df = pd.DataFrame(self.columns)
+        if self.float_format:
+            return df.to_string(index=False, float_format=self.float_format.format)
+        return df.to_string(index=False)
+
+    def _render_text(self) -> str:
+        if self.message is not None:
+            return self.message
+        parts = []
+        if self.summary:
+            parts.append("\n".join(self.summary))
+        if self.columns:
+            table = self.table_text()
+            parts.append(f"{self.table_title}\n{table}" if self.table_title else table)
+        if self.notes:
+            parts.append("\n".join(self.notes))
+        return "\n\n".join(parts)
+
+    def _render_json(self) -> dict:
+        if self.message is not None:
+            return {"message": self.message}
+        return {
+            "summary": self.summary,
+            "fields": {k: _json_value(v) for k, v in self.fields.items()},
+            "columns": {name: [_json_value(v) for v in _as_list(values)] for name, values in self.columns.items()},
+            "notes": self.notes,
+        }
+
+    def _render_arrow(self) -> bytes:
+        import pyarrow as pa   # tùy chọn: chỉ cần khi client yêu cầu Arrow
+
+        if self.message is not None:
+            table = pa.table({"message": [self.message]})
+        else:
+            table = pa.table({name: _as_list(values) for name, values in self.columns.items()})
+            meta = {"summary": self.summary, "notes": self.notes,
+                    "fields": {k: _json_value(v) for k, v in self.fields.items()}}
+            table = table.replace_schema_metadata({"tool_result": json.dumps(meta, ensure_ascii=False)})
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+    # --- streaming ---
+
+    def iter_rows(self, chunk_size: int = 500):
+        """Sinh từng hàng (list giá trị JSON-safe); mỗi lô chunk_size hàng chỉ được dựng khi tới lượt."""
+        names = self.column_names()
+        for start in range(0, self.num_rows(), chunk_size):
+            chunk = self.column_chunk(start, start + chunk_size)
+            for row in zip(*(_as_list(chunk[name]) for name in names)):
+                yield [_json_value(v) for v in row]
+
+    def iter_events(self):
+        """Chuỗi sự kiện (tên, payload): header → các row → end. Không dựng cả bảng."""
+        if self.message is not None:
+            yield "message", {"message": self.message}
+            return
+        yield "header", {
+            "summary": self.summary,
+            "fields": {k: _json_value(v) for k, v in self.fields.items()},
+            "columns": self.column_names(),
+            "num_rows": self.num_rows(),
+        }
+        for row in self.iter_rows():
+            yield "row", row
+        yield "end", {"notes": self.notes}
+
+    def __str__(self) -> str:
+        # Dạng chuỗi cũ (###DATA ... ###END_DATA) cho FunctionTool / LLM
+        if self.message is not None:
+            return self.message
+        return f"###DATA\n{self.to_text()}\n###END_DATA"
+
+
+def arrow_available() -> bool:
+    """pyarrow là tùy chọn: chỉ cần khi client yêu cầu format 'arrow'."""
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def _as_list(values) -> list:
+    if isinstance(values, (np.ndarray, pd.Series, pd.Index)):
+        return values.tolist()
+    return list(values)
+
+
+def _json_value(v):
+    if isinstance(v, dict):
+        return {k: _json_value(x) for k, x in v.items()}
+    if isinstance(v, (list, tuple)):
+        return [_json_value(x) for x in v]
+    if isinstance(v, np.generic):
+        v = v.item()
+    if isinstance(v, float) and math.isnan(v):
+        return None
+    return v
+
+
+def to_ndjson(event: str, payload) -> str:
+    return json.dumps({"type": event, "data": payload}, ensure_ascii=False) + "\n"
+
+
+def to_sse(event: str, payload) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
@@ -0,0 +1,150 @@
+import re
+from typing import Iterable, Optional
+
+# Bộ định tuyến câu hỏi một lượt quét: mọi từ khóa intent, mã chứng khoán,
+# chỉ báo, khung thời gian và cụm thời gian tiếng Việt được gộp vào MỘT
+# regex biên dịch sẵn; finditer đi qua câu hỏi đúng một lần.
+
+RESOLUTION_MAP = {
+    '1d': '1D', 'daily': '1D',
+    '1m': '1m',
+    '5m': '5m', '15m': '15m',
+    '30m': '30m',
+    '1h': '1H',
+}
+
+# Từ khóa số đo cho so sánh nhiều mã (compare_stocks) và tên trường giá tiếng Việt
+MEASURE_WORDS = {
+    'lợi nhuận': 'return', 'tỷ suất sinh lời': 'return', 'return': 'return', 'returns': 'return',
+    'biến động': 'volatility', 'volatility': 'volatility',
+    'tương quan': 'corr', 'correlation': 'corr',
+}
+FIELD_WORDS = {'mở cửa': 'open', 'đóng cửa': 'close'}
+
+# Các chuỗi in hoa 2-4 ký tự hay gặp nhưng không phải mã chứng khoán
+NOT_TICKERS = {'SMA', 'EMA', 'RSI', 'ATR', 'BB', 'MACD', 'VWAP', 'VND', 'API', 'ATO', 'ATC', 'OK'}
+
+# Thứ tự nhóm quan trọng: cụm dài đặt trước cụm ngắn, từ khóa đặt trước mã.
+_PATTERNS = [
+    ('screen', r'(?i:\blọc\b|\bscreen\b)'),
+    ('shareholders', r'(?i:cổ đông)'),
+    ('officers', r'(?i:ban lãnh đạo|lãnh đạo)'),
+    ('subsidiaries', r'(?i:công ty con)'),
+    ('compare', r'(?i:so sánh)'),
+    ('lowest', r'(?i:thấp nhất)'),
+    ('highest', r'(?i:cao nhất)'),
+    ('rank', r'(?i:xếp hạng)'),
+    ('measure', r'(?i:lợi nhuận|tỷ suất sinh lời|\breturns?\b|biến động|volatility|tương quan|correlation)'),
+    ('time', r'(?i:\d+\s*(?:ngày|tuần|tháng)|(?:từ đầu|từ|đầu) tháng\s+\d{1,2}|gần nhất|gần đây)'),
+    ('indicator', r'(?i:\b(?P<ind_n>sma|ema|rsi|atr)\s*(?P<ind_p>\d+)'
+                  r'|\b(?:bb|bollinger)(?![a-zà-ỹ])\s*(?P<bb_p>\d*)'
+                  r'|\b(?P<ind_x>macd|vwap)(?![a-zà-ỹ]))'),
+    ('resolution', r'(?i:\b(?:1m|5m|15m|30m|1h|1d|daily)\b)'),
+    ('volume', r'(?i:volume|khối lượng)'),
+    ('price', r'(?i:ohlcv|giá)'),
+    ('field', r'(?i:\b(?:close|open|high|low)\b|mở cửa|đóng cửa)'),
+    ('symbol', r'\b[A-Z]{2,4}\b'),
+]
+_MASTER_RE = re.compile('|'.join(f'(?P<{name}>{pattern})' for name, pattern in _PATTERNS))
+
+
+class Router:
+    """
+    Phân tích câu hỏi thành intent + tham số trong một lượt.
+    `tickers`: tập mã hợp lệ để lọc nhầm lẫn; None = chỉ loại NOT_TICKERS.
+    """
+
+    def __init__(self, tickers: Optional[Iterable[str]] = None):
+        self.tickers = {t.upper() for t in tickers} if tickers else None
+
+    def _is_ticker(self, token: str) -> bool:
+        if self.tickers is not None:
+            return token in self.tickers
+        return token not in NOT_TICKERS
+
+    def parse(self, question: str) -> dict:
+        flags = set()
+        symbols, indicators, times, fields, measures = [], [], [], [], []
+        resolution = None
+        condition_start = None
+
+        for m in _MASTER_RE.finditer(question):
+            kind = m.lastgroup
+            # lastgroup là nhóm ngoài cùng khớp; nhóm con của indicator có tên riêng
+            if m.group('indicator') is not None:
+                kind = 'indicator'
+
+            if kind == 'symbol':
+                if self._is_ticker(m.group()):
+                    symbols.append(m.group())
+            elif kind == 'indicator':
+                if m.group('ind_n'):
+                    indicators.append(f"{m.group('ind_n').upper()}_{m.group('ind_p')}")
+                elif m.group('ind_x'):
+                    indicators.append(m.group('ind_x').upper())
+                else:
+                    indicators.append(f"BB_{m.group('bb_p')}" if m.group('bb_p') else "BB")
+                flags.add('technical')
+                condition_start = m.start() if condition_start is None else condition_start
+            elif kind == 'time':
+                times.append(m.group())
+            elif kind == 'resolution':
+                resolution = resolution or m.group().lower()
+            elif kind in ('field', 'volume'):
+                if kind == 'field':
+                    fields.append(FIELD_WORDS.get(m.group().lower(), m.group().lower()))
+                flags.add(kind)
+                condition_start = m.start() if condition_start is None else condition_start
+            elif kind == 'measure':
+                measures.append(MEASURE_WORDS[m.group().lower()])
+                flags.add(kind)
+            else:
+                flags.add(kind)
+
+        if len(symbols) >= 2:
+            flags.add('basket')
+        if len(symbols) > 2:
+            flags.add('many')
+
+        parsed = {
+            "intent": self._intent(flags),
+            "symbols": symbols,
+            "date_query": " ".join(times) if times else question,
+            "resolution": RESOLUTION_MAP.get(resolution, "1D"),
+            "indicators": indicators,
+        }
+        if parsed["intent"] == "company_info":
+            parsed["info_type"] = next(t for t in ('shareholders', 'officers', 'subsidiaries') if t in flags)
+        elif parsed["intent"] == "screen":
+            if ":" in question:
+                condition = question.split(":", 1)[1]
+            else:
+                condition = question[condition_start:] if condition_start is not None else ""
+            parsed["condition"] = condition.strip().rstrip("?.")
+        elif parsed["intent"] == "compare_price":
+            parsed["metric"] = fields[0] if fields else "open"
+        elif parsed["intent"] == "compare_stocks":
+            # Số đo đầu tiên dùng để xếp hạng: từ khóa số đo, rồi trường giá, rồi volume
+            agg = 'min' if 'lowest' in flags else 'max' if 'highest' in flags else 'mean'
+            wanted = measures + [f"{agg}_{f}" for f in fields] + (['volume'] if 'volume' in flags else [])
+            parsed["measures"] = list(dict.fromkeys(wanted))
+        return parsed
+
+    @staticmethod
+    def _intent(flags: set) -> str:
+        if 'screen' in flags:
+            return "screen"
+        if flags & {'shareholders', 'officers', 'subsidiaries'}:
+            return "company_info"
+        # Rổ nhiều mã: xếp hạng / số đo / giá cao nhất, hoặc so sánh volume quá 2 mã
+        if 'basket' in flags and (flags & {'measure', 'rank', 'highest'} or {'compare', 'volume', 'many'} <= flags):
+            return "compare_stocks"
+        if 'compare' in flags and 'volume' in flags:
+            return "compare_volume"
+        if 'compare' in flags or 'lowest' in flags:
+            return "compare_price"
+        if 'technical' in flags:
+            return "technical"
+        if flags & {'price', 'volume'}:
+            return "ohlcv"
+        return "unknown"
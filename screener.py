@@ -0,0 +1,241 @@
+import re
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from indicators import IndicatorEngine, output_names, warmup_bars
+
+# Bộ lọc cổ phiếu toàn thị trường trên ma trận (ngày × mã).
+# Điều kiện dạng: "RSI_14 < 30 and close > SMA_50", hỗ trợ and/or/not (và/hoặc/không),
+# ngoặc đơn và các phép so sánh <, <=, >, >=, ==, !=. Điều kiện được xét tại nến mới nhất.
+
+FIELDS = ['open', 'high', 'low', 'close', 'volume']
+_SUFFIXES = ('_UPPER', '_MID', '_LOWER', '_SIGNAL', '_HIST')
+
+_TOKEN_RE = re.compile(r'\s*(?:(\d+(?:\.\d+)?)|([A-Za-z_][A-Za-z0-9_]*)|(<=|>=|==|!=|<|>)|([()]))')
+_KEYWORDS = {'and': 'and', 'và': 'and', 'or': 'or', 'hoặc': 'or', 'not': 'not', 'không': 'not'}
+_OPS = {
+    '<': np.less, '<=': np.less_equal, '>': np.greater,
+    '>=': np.greater_equal, '==': np.equal, '!=': np.not_equal,
+}
+
+
+# === condition parser ===
+
+
+def _normalize_name(name: str) -> str:
+    """'rsi14' -> 'RSI_14', 'close' -> 'close'."""
+    if name.lower() in FIELDS:
+        return name.lower()
+    return re.sub(r'^([A-Za-z]+)(\d)', r'\1_\2', name).upper()
+
+
+def _spec_for_column(name: str) -> str:
+    """Tên cột chỉ báo -> spec để tính ('BB_20_UPPER' -> 'BB_20')."""
+    for suffix in _SUFFIXES:
+        if name.endswith(suffix):
+            spec = name[:-len(suffix)]
+            if name in output_names(spec):
+                return spec
+    if name in output_names(name):
+        return name
+    raise ValueError(f"Không rõ chỉ báo: {name}")
+
+
+def _tokenize(condition: str) -> List[Tuple[str, str]]:
+    tokens = []
+    pos = 0
+    text = condition.strip()
+    while pos < len(text):
+        word = re.match(r'\s*(và|hoặc|không)\b', text[pos:])
+        if word:
+            tokens.append(('kw', _KEYWORDS[word.group(1)]))
+            pos += word.end()
+            continue
+        m = _TOKEN_RE.match(text, pos)
+        if not m or m.end() == pos:
+            raise ValueError(f"Điều kiện không hợp lệ gần: '{text[pos:pos + 20]}'")
+        number, ident, op, paren = m.groups()
+        if number:
+            tokens.append(('num', number))
+        elif ident:
+            kw = _KEYWORDS.get(ident.lower())
+            tokens.append(('kw', kw) if kw else ('name', _normalize_name(ident)))
+        elif op:
+            tokens.append(('op', op))
+        else:
+            tokens.append(('paren', paren))
+        pos = m.end()
+    return tokens
+
+
+class _Parser:
+    """Recursive descent: expr := and_expr (or and_expr)*; and_expr := unary (and unary)*."""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.i = 0
+
+    def _peek(self):
+        return self.tokens[self.i] if self.i < len(self.tokens) else (None, None)
+
+    def _take(self, kind=None, value=None):
+        tok = self._peek()
+        if tok[0] is None or (kind and tok[0] != kind) or (value and tok[1] != value):
+            raise ValueError(f"Điều kiện không hợp lệ: cần {value or kind}, gặp {tok[1]}")
+        self.i += 1
+        return tok
+
+    def parse(self):
+        node = self._or()
+        if self.i != len(self.tokens):
+            raise ValueError(f"Điều kiện không hợp lệ: thừa '{self._peek()[1]}'")
+        return node
+
+    def _or(self):
+        node = self._and()
+        while self._peek() == ('kw', 'or'):
+            self.i += 1
+            node = ('or', node, self._and())
+        return node
+
+    def _and(self):
+        node = self._unary()
+        while self._peek() == ('kw', 'and'):
+            self.i += 1
+            node = ('and', node, self._unary())
+        return node
+
+    def _unary(self):
+        if self._peek() == ('kw', 'not'):
+            self.i += 1
+            return ('not', self._unary())
+        if self._peek() == ('paren', '('):
+            self.i += 1
+            node = self._or()
+            self._take('paren', ')')
+            return node
+        left = self._operand()
+        op = self._take('op')[1]
+        return ('cmp', op, left, self._operand())
+
+    def _operand(self):
+        kind, value = self._take()
+        if kind == 'num':
+            return ('num', float(value))
+        if kind == 'name':
+            return ('col', value)
+        raise ValueError(f"Điều kiện không hợp lệ: không mong đợi '{value}'")
+
+
+def parse_condition(condition: str):
+    """Trả về (cây điều kiện, danh sách cột cần dùng)."""
+    tree = _Parser(_tokenize(condition)).parse()
+    columns = []
+
+    def walk(node):
+        if node[0] == 'col':
+            columns.append(node[1])
+        for child in node[1:]:
+            if isinstance(child, tuple):
+                walk(child)
+    walk(tree)
+    return tree, list(dict.fromkeys(columns))
+
+
+def _evaluate(node, values: Dict[str, np.ndarray]) -> np.ndarray:
+    kind = node[0]
+    if kind == 'num':
+        return node[1]
+    if kind == 'col':
+        return values[node[1]]
+    if kind == 'cmp':
+        with np.errstate(invalid='ignore'):
+            return _OPS[node[1]](_evaluate(node[2], values), _evaluate(node[3], values))
+    if kind == 'not':
+        return ~_evaluate(node[1], values)
+    left, right = _evaluate(node[1], values), _evaluate(node[2], values)
+    return (left & right) if kind == 'and' else (left | right)
+
+
+# === market matrix ===
+
+
+def build_matrix(columns_by_symbol: Dict[str, dict], lookback: Optional[int] = 300) -> Tuple[np.ndarray, List[str], Dict[str, np.ndarray]]:
+    """
+    Gộp các cột nến của từng mã (dict từ BarStore.read_columns) thành ma trận
+    (ngày × mã) cho mỗi trường, căn theo trục ngày chung, giữ `lookback` ngày gần nhất
+    (None = giữ tất cả).
+    Ngày mã không giao dịch được điền giá gần nhất trước đó, volume = 0.
+    """
+    symbols = [s for s, cols in columns_by_symbol.items() if cols and len(cols['time'])]
+    if not symbols:
+        return np.array([], dtype='int64'), [], {f: np.empty((0, 0)) for f in FIELDS}
+
+    dates = np.unique(np.concatenate([columns_by_symbol[s]['time'] for s in symbols]))
+    if lookback:
+        dates = dates[-lookback:]
+    matrix = {f: np.full((len(dates), len(symbols)), np.nan) for f in FIELDS}
+    for j, s in enumerate(symbols):
+        cols = columns_by_symbol[s]
+        keep = cols['time'] >= dates[0]
+        idx = np.searchsorted(dates, cols['time'][keep])
+        for f in FIELDS:
+            matrix[f][idx, j] = cols[f][keep]
+
+    for f in ['open', 'high', 'low', 'close']:
+        matrix[f] = pd.DataFrame(matrix[f]).ffill().to_numpy()
+    matrix['volume'] = np.nan_to_num(matrix['volume'])
+    return dates, symbols, matrix
+
+
+def _first_valid(matrix: Dict[str, np.ndarray]) -> np.ndarray:
+    """Dòng của nến đầu tiên từng mã (trước đó là NaN vì mã chưa giao dịch trong cửa sổ)."""
+    return np.argmax(~np.isnan(matrix['close']), axis=0)
+
+
+def _latest_indicators(matrix: Dict[str, np.ndarray], specs: List[str]) -> Dict[str, np.ndarray]:
+    """
+    Giá trị chỉ báo tại nến mới nhất của từng mã. Mỗi mã chỉ được tính từ nến đầu tiên
+    của nó (NaN phía trước sẽ làm hỏng cumsum/SMA và bị đếm như delta 0 trong RSI);
+    các mã cùng ngày bắt đầu được tính chung một lượt trên ma trận con.
+    """
+    if not specs:
+        return {}
+    starts = _first_valid(matrix)
+    latest = {}
+    for start in np.unique(starts):
+        cols = np.flatnonzero(starts == start)
+        engine = IndicatorEngine(*(matrix[f][start:, cols] for f in ('close', 'high', 'low', 'volume')))
+        for name, values in engine.compute(specs).items():
+            if name not in latest:
+                latest[name] = np.full(len(starts), np.nan)
+            latest[name][cols] = values[-1]
+    return latest
+
+
+def _warmed_up(matrix: Dict[str, np.ndarray], specs: List[str]) -> np.ndarray:
+    """Mã có đủ số nến khởi động cho mọi chỉ báo trong điều kiện (thiếu -> loại khỏi kết quả)."""
+    available = len(matrix['close']) - _first_valid(matrix)
+    return available > warmup_bars(specs) if specs else np.ones(len(available), dtype=bool)
+
+
+def run_screen(condition: str, columns_by_symbol: Dict[str, dict], lookback: int = 300) -> pd.DataFrame:
+    """Lọc toàn bộ mã theo điều kiện tại nến mới nhất; trả về bảng các mã thỏa mãn."""
+    tree, needed = parse_condition(condition)
+    specs = list(dict.fromkeys(_spec_for_column(c) for c in needed if c not in FIELDS))
+
+    dates, symbols, matrix = build_matrix(columns_by_symbol, lookback)
+    if not symbols:
+        return pd.DataFrame(columns=['symbol'] + needed)
+
+    latest = {f: matrix[f][-1] for f in FIELDS}
+    latest.update(_latest_indicators(matrix, specs))
+
+    mask = np.broadcast_to(np.asarray(_evaluate(tree, latest), dtype=bool), (len(symbols),))
+    mask = mask & _warmed_up(matrix, specs) & ~np.isnan(latest['close'])   # mã đã ngừng giao dịch trước cửa sổ
+    result = pd.DataFrame({'symbol': np.array(symbols)[mask]})
+    for col in needed:
+        result[col] = latest[col][mask]
+    return result.reset_index(drop=True)
@@ -0,0 +1,342 @@
+import os
+import json
+import fcntl
+import tempfile
+import shutil
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, date, timedelta, time as dtime
+from typing import Callable, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pandas as pd
+
+from bars import Bars
+from resample import resample
+
+# Kho dữ liệu nến (OHLCV) lưu trên đĩa theo từng (symbol, interval).
+# Mỗi cột được lưu thành một file .npy riêng (dạng cột), kèm meta.json
+# ghi lại các khoảng ngày đã có, để chỉ phải tải phần còn thiếu từ nguồn.
+# Khi đọc, các file được memory-map (xem bars.py): nhiều worker cùng đọc một
+# kho thì dùng chung page cache của OS thay vì mỗi worker giữ một bản riêng.
+# Nhiều tiến trình (worker uvicorn, worker tính toán, warmer) cùng ghi một kho:
+# chu trình đọc meta -> tải -> gộp -> ghi của mỗi (symbol, interval) giữ khóa
+# file (fcntl) bên cạnh khóa thread, và file .npy đã ghi không bao giờ bị ghi đè.
+
+STORE_DIR = os.environ.get(
+    "VNSTOCK_STORE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".bar_store"),
+)
+
+# Ngày đã đóng cửa thì nến là bất biến; phiên đang giao dịch chỉ được
+# tải lại tối đa mỗi SESSION_REFRESH giây.
+VN_TZ = ZoneInfo("Asia/Ho_Chi_Minh")
+SESSION_CLOSE = dtime(15, 0)
+SESSION_REFRESH = float(os.environ.get("VNSTOCK_SESSION_REFRESH", "60"))
+
+# Khung intraday lớn hơn 1m không tải riêng: chỉ lưu nến 1m và gộp cục bộ (resample.py)
+BASE_INTERVAL = '1m'
+DERIVED_INTERVALS = {'5m', '15m', '30m', '1H'} if os.environ.get("VNSTOCK_RESAMPLE", "1") == "1" else set()
+
+PRICE_COLUMNS = ['open', 'high', 'low', 'close']
+COLUMNS = ['time'] + PRICE_COLUMNS + ['volume']
+
+
+def _empty_bars() -> pd.DataFrame:
+    df = pd.DataFrame({col: pd.Series(dtype='float64') for col in COLUMNS})
+    df['time'] = pd.Series(dtype='datetime64[ns]')
+    return df
+
+
+# === date ranges ===
+
+
+def _to_date(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+
+
+def _merge_ranges(ranges: List[Tuple[date, date]]) -> List[Tuple[date, date]]:
+    """Gộp các khoảng ngày chồng lấn hoặc liền kề nhau."""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + timedelta(days=1):
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _missing_ranges(start: date, end: date, covered: List[Tuple[date, date]]) -> List[Tuple[date, date]]:
+    """Trả về các khoảng con của [start, end] chưa có trong covered."""
+    gaps = []
+    cursor = start
+    for c_start, c_end in covered:
+        if c_end < cursor:
+            continue
+        if c_start > end:
+            break
+        if c_start > cursor:
+            gaps.append((cursor, c_start - timedelta(days=1)))
+        cursor = max(cursor, c_end + timedelta(days=1))
+        if cursor > end:
+            break
+    if cursor <= end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+# === bar store ===
+
+
+class BarStore:
+    """
+    Kho nến trên đĩa, có nhận biết khoảng trống (gap-aware).
+    `quote_factory(symbol)` phải trả về đối tượng có `.history(start, end, interval)`
+    giống `vnstock.Quote` - có thể thay bằng Quote giả khi kiểm thử.
+    """
+
+    def __init__(self, quote_factory: Callable, root: str = STORE_DIR):
+        self.quote_factory = quote_factory
+        self.root = root
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self._fresh = {}   # (symbol, interval) -> (start, end, expires_at) của phiên hiện tại
+        self.upstream_calls = 0
+        self.hits = 0
+        self.misses = 0
+        self._mapped = {}   # (symbol, interval) -> (version, Bars memory-map)
+
+    def _lock(self, symbol: str, interval: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault((symbol, interval), threading.Lock())
+
+    def _path(self, symbol: str, interval: str) -> str:
+        return os.path.join(self.root, interval, symbol)
+
+    @contextmanager
+    def _file_lock(self, symbol: str, interval: str):
+        """Khóa độc quyền giữa các tiến trình cho (symbol, interval), giữ trong suốt khối with."""
+        base = self._path(symbol, interval)
+        os.makedirs(base, exist_ok=True)
+        with open(os.path.join(base, '.lock'), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    # --- đọc / ghi ---
+
+    def _read_meta(self, symbol: str, interval: str) -> dict:
+        path = os.path.join(self._path(symbol, interval), 'meta.json')
+        if not os.path.exists(path):
+            return {"version": 0, "ranges": []}
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def _covered(self, meta: dict) -> List[Tuple[date, date]]:
+        return [(_to_date(s), _to_date(e)) for s, e in meta["ranges"]]
+
+    def _load(self, symbol: str, interval: str, meta: dict) -> Bars:
+        """Memory-map phiên bản hiện tại (mỗi phiên bản chỉ map một lần, dùng chung mọi request)."""
+        if not meta["version"]:
+            return Bars.empty()
+        key = (symbol, interval)
+        mapped = self._mapped.get(key)
+        if mapped is not None and mapped[0] == meta["version"]:
+            return mapped[1]
+        version_dir = os.path.join(self._path(symbol, interval), f"v{meta['version']}")
+        bars = Bars.from_columns({col: np.load(os.path.join(version_dir, f"{col}.npy"), mmap_mode='r')
+                                  for col in COLUMNS})
+        self._mapped[key] = (meta["version"], bars)
+        return bars
+
+    @staticmethod
+    def storage_interval(interval: str) -> str:
+        """Khung thực sự được lưu/tải cho `interval` (khung gộp -> 1m)."""
+        return BASE_INTERVAL if interval in DERIVED_INTERVALS else interval
+
+    def read_bars(self, symbol: str, interval: str = '1D') -> Bars:
+        """Đọc toàn bộ nến đã lưu (memory-map, không gọi upstream). Rỗng nếu mã chưa có."""
+        if interval in DERIVED_INTERVALS:
+            return resample(self.read_bars(symbol, BASE_INTERVAL), interval)
+        symbol = symbol.upper()
+        for _ in range(2):   # phiên bản có thể vừa bị thay bởi một lần ghi song song
+            try:
+                return self._load(symbol, interval, self._read_meta(symbol, interval))
+            except FileNotFoundError:
+                continue
+        return Bars.empty()
+
+    def read_columns(self, symbol: str, interval: str = '1D') -> dict:
+        """
+        Đọc thẳng các cột đã lưu (không tạo DataFrame, không gọi upstream).
+        'time' là int64 epoch (ns). Trả về {} nếu mã chưa có trong kho.
+        """
+        bars = self.read_bars(symbol, interval)
+        return bars.as_dict() if len(bars) else {}
+
+    def symbols(self, interval: str = '1D') -> List[str]:
+        """Các mã đang có dữ liệu trong kho cho khung thời gian này."""
+        path = os.path.join(self.root, interval)
+        if not os.path.isdir(path):
+            return []
+        return sorted(d for d in os.listdir(path) if os.path.exists(os.path.join(path, d, 'meta.json')))
+
+    def _write(self, symbol: str, interval: str, df: pd.DataFrame, covered: List[Tuple[date, date]], meta: dict) -> dict:
+        """
+        Ghi phiên bản mới vào thư mục tạm riêng, đổi tên thành v{n+1} rồi mới thay
+        meta.json (atomic). Gọi khi đang giữ _file_lock; file của phiên bản cũ không
+        bị ghi đè nên tiến trình khác đang memory-map vẫn đọc an toàn.
+        """
+        base = self._path(symbol, interval)
+        version = meta["version"] + 1
+        version_dir = os.path.join(base, f"v{version}")
+        tmp_dir = tempfile.mkdtemp(prefix='.v', dir=base)
+        try:
+            for col, values in Bars.from_frame(df).as_dict().items():
+                np.save(os.path.join(tmp_dir, f"{col}.npy"), np.ascontiguousarray(values))
+            # Phiên bản dở dang của một lần ghi bị ngắt giữa chừng (meta chưa trỏ tới, không ai map)
+            shutil.rmtree(version_dir, ignore_errors=True)
+            os.rename(tmp_dir, version_dir)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        new_meta = {
+            "version": version,
+            "ranges": [[s.isoformat(), e.isoformat()] for s, e in covered],
+        }
+        fd, tmp = tempfile.mkstemp(prefix='.meta', suffix='.tmp', dir=base)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(new_meta, f)
+        os.replace(tmp, os.path.join(base, 'meta.json'))
+
+        # Các mapping cũ vẫn đọc được sau khi xóa (inode còn sống tới khi unmap)
+        if meta["version"]:
+            shutil.rmtree(os.path.join(base, f"v{meta['version']}"), ignore_errors=True)
+        return new_meta
+
+    # --- tải từ nguồn ---
+
+    def _fetch(self, symbol: str, start: date, end: date, interval: str) -> pd.DataFrame:
+        self.upstream_calls += 1
+        quote = self.quote_factory(symbol)
+        df = quote.history(start=start.isoformat(), end=end.isoformat(), interval=interval)
+        if df is None or df.empty:
+            return _empty_bars()
+        if 'time' not in df.columns:
+            df = df.reset_index()
+        df = df[COLUMNS].copy()
+        df['time'] = pd.to_datetime(df['time'])
+        return df
+
+    def final_until(self, end: date) -> date:
+        """
+        Ngày cuối cùng được coi là đã chốt: hôm nay chỉ chốt khi đã qua giờ
+        đóng cửa (hoặc là cuối tuần), ngược lại phiên hôm nay vẫn còn thay đổi.
+        """
+        now = datetime.now(VN_TZ)
+        today = now.date()
+        if now.weekday() >= 5 or now.time() >= SESSION_CLOSE:
+            return min(end, today)
+        return min(end, today - timedelta(days=1))
+
+    def _with_fresh(self, symbol: str, interval: str, covered: List[Tuple[date, date]]) -> List[Tuple[date, date]]:
+        """Coi phần phiên hiện tại vừa tải (chưa hết SESSION_REFRESH) là đã có."""
+        fresh = self._fresh.get((symbol, interval))
+        if fresh is None or fresh[2] <= time.monotonic():
+            return covered
+        return _merge_ranges(covered + [(fresh[0], fresh[1])])
+
+    def version(self, symbol: str, interval: str, start: str, end: str) -> Optional[int]:
+        """
+        Phiên bản dữ liệu đang phục vụ [start, end] nếu khoảng này đã có đủ (get_bars sẽ
+        không gọi upstream); None nếu còn thiếu hoặc phần phiên hiện tại đã tới hạn làm mới.
+        """
+        symbol = symbol.upper()
+        interval = self.storage_interval(interval)
+        meta = self._read_meta(symbol, interval)
+        covered = self._with_fresh(symbol, interval, self._covered(meta))
+        if not meta["version"] or _missing_ranges(_to_date(start), _to_date(end), covered):
+            return None
+        return meta["version"]
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "upstream_calls": self.upstream_calls}
+
+    def get_bars(self, symbol: str, start: str, end: str, interval: str = '1D') -> Bars:
+        """
+        Lấy nến trong [start, end]: phần đã có đọc từ đĩa, chỉ tải các khoảng thiếu.
+        Trả về view (không sao chép) vào bản memory-map của kho; khung gộp
+        (5m/15m/30m/1H) được tính từ nến 1m nên dùng chung một lần tải.
+        """
+        if interval in DERIVED_INTERVALS:
+            return resample(self.get_bars(symbol, start, end, BASE_INTERVAL), interval)
+        symbol = symbol.upper()
+        start_d, end_d = _to_date(start), _to_date(end)
+
+        with self._lock(symbol, interval):
+            meta = self._read_meta(symbol, interval)
+            gaps = _missing_ranges(start_d, end_d, self._with_fresh(symbol, interval, self._covered(meta)))
+            bars = None
+            if not gaps:
+                try:
+                    bars = self._load(symbol, interval, meta)
+                    self.hits += 1
+                except FileNotFoundError:   # phiên bản vừa bị tiến trình khác thay
+                    pass
+            if bars is None:
+                # Đọc lại meta khi đã giữ khóa file: tiến trình khác có thể vừa ghi xong
+                with self._file_lock(symbol, interval):
+                    bars = self._fill_gaps(symbol, interval, start_d, end_d)
+
+        # time đã sắp xếp: cắt bằng tìm kiếm nhị phân thay vì so sánh từng dòng
+        return bars.between(start_d, end_d + timedelta(days=1))
+
+    def _fill_gaps(self, symbol: str, interval: str, start_d: date, end_d: date) -> Bars:
+        """Tải các khoảng còn thiếu của [start_d, end_d], gộp với dữ liệu đã có và ghi (giữ _file_lock)."""
+        meta = self._read_meta(symbol, interval)
+        covered = self._covered(meta)
+        gaps = _missing_ranges(start_d, end_d, self._with_fresh(symbol, interval, covered))
+        bars = self._load(symbol, interval, meta)
+        if not gaps:
+            self.hits += 1
+            return bars
+
+        self.misses += 1
+        fetched = []
+        for g_start, g_end in gaps:
+            try:
+                fetched.append(self._fetch(symbol, g_start, g_end, interval))
+            except Exception as e:
+                logging.error(f"Lỗi tải {symbol} {interval} ({g_start} → {g_end}): {e}")
+                continue
+            final_end = self.final_until(g_end)
+            if final_end >= g_start:
+                covered.append((g_start, final_end))
+            if final_end < g_end:
+                fresh_start = max(g_start, final_end + timedelta(days=1))
+                self._fresh[(symbol, interval)] = (fresh_start, g_end, time.monotonic() + SESSION_REFRESH)
+
+        fetched = [f for f in fetched if not f.empty]
+        covered = _merge_ranges(covered)
+        if fetched or covered != self._covered(meta):
+            df = bars.to_frame()
+            if fetched:
+                df = pd.concat([df] + fetched, ignore_index=True)
+                df['time'] = pd.to_datetime(df['time'])
+                df = df.drop_duplicates(subset='time', keep='last').sort_values('time').reset_index(drop=True)
+            bars = self._load(symbol, interval, self._write(symbol, interval, df, covered, meta))
+        return bars
+
+    def get(self, symbol: str, start: str, end: str, interval: str = '1D') -> pd.DataFrame:
+        """Như get_bars nhưng trả về DataFrame (cột 'time' dạng datetime64)."""
+        return self.get_bars(symbol, start, end, interval).to_frame()
@@ -1,34 +1,65 @@
-
-
-from llama_index.core.tools import FunctionTool
-from vnstock import Quote, Company
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
+import numpy as np
 import pandas as pd
+import os
 import re
 import json
+import hashlib
 import logging
-from typing import List, Dict, Union, Tuple
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import List, Dict, Optional, Union, Tuple
+from store import BarStore, STORE_DIR, VN_TZ
+from providers import build_provider
+from bars import Bars
+from singleflight import SingleFlight
+from cache import TTLCache, MISSING
+from indicators import IndicatorEngine, IndicatorStateStore, output_names, warmup_bars
+from trading_calendar import INTERVAL_MINUTES, lookback_start, trading_days_back
+from screener import run_screen
+from compare import DEFAULT_MEASURES, cross_section, parse_measure, rank
+from results import ColumnSource, ToolResult
+import metrics
+import workers
 
 logging.getLogger("vnstock").setLevel(logging.ERROR)
-DATA_SOURCE = 'TCBS'
+LISTING_RETRY = 300   # lỗi lấy danh sách niêm yết chỉ được nhớ trong chừng này giây rồi thử lại
+
+# Nguồn dữ liệu (VNSTOCK_SOURCES, mặc định TCBS rồi VCI dự phòng), xem providers.py
+provider = build_provider()
+
+# Kho nến cục bộ: chỉ tải từ nguồn các khoảng ngày còn thiếu
+bar_store = BarStore(quote_factory=provider.quote)
+
+# Giới hạn số mã tải song song và thời gian chờ tối đa cho mỗi mã (giây)
+FETCH_MAX_WORKERS = 8
+FETCH_TIMEOUT = 20
+_fetch_pool = ThreadPoolExecutor(max_workers=FETCH_MAX_WORKERS, thread_name_prefix="fetch")
 
+# Các lời gọi trùng khóa đang chạy đồng thời chỉ tải upstream một lần
+history_flight = SingleFlight()   # key: (symbol, interval, start, end)
+company_flight = SingleFlight()   # key: (symbol, info_type)
 
-# === sma and rsi ===
+# Thông tin doanh nghiệp thay đổi theo quý → cache LRU + TTL theo từng info_type (giây)
+COMPANY_TTL = {
+    'shareholders': 7 * 24 * 3600,
+    'officers': 7 * 24 * 3600,
+    'subsidiaries': 30 * 24 * 3600,
+}
+company_cache = TTLCache(maxsize=1024, ttl=24 * 3600)
 
+# Cache câu trả lời: (tool, tham số chuẩn hóa, phiên bản dữ liệu) -> ToolResult
+ANSWER_TTL = 3600
+answer_cache = TTLCache(maxsize=4096, ttl=ANSWER_TTL)
 
-def _calculate_sma(series: pd.Series, period: int) -> pd.Series:
-    """Tính toán SMA (Simple Moving Average)"""
-    return series.rolling(window=period).mean()
+# Trạng thái chỉ báo cập nhật từng nến cho khung intraday (sống qua restart)
+indicator_states = IndicatorStateStore(os.path.join(STORE_DIR, '_indicator_state'))
+
+
+# === date parsing ===
 
-def _calculate_rsi(close: pd.Series, period: int = 14) -> pd.Series:
-    """Tính toán RSI (Relative Strength Index)"""
-    delta = close.diff()
-    gain = delta.where(delta > 0, 0).rolling(window=period).mean()
-    loss = (-delta.where(delta < 0, 0)).rolling(window=period).mean()
-    rs = gain / loss
-    rsi = 100 - (100 / (1 + rs))
-    return rsi
 
 def _parse_date_range(query: str) -> Tuple[str, str, int]:
     """
@@ -48,8 +79,9 @@ def _parse_date_range(query: str) -> Tuple[str, str, int]:
     m_month_start = re.search(r'(từ|từ đầu|đầu) tháng\s+(\d{1,2})', query)
 
     if m_days:
+        # "N ngày" = N phiên giao dịch gần nhất (bỏ cuối tuần, ngày lễ)
         num_days = int(m_days.group(1))
-        start_date = (today - timedelta(days=num_days)).strftime('%Y-%m-%d')
+        start_date = trading_days_back(today.date(), max(num_days - 1, 0)).strftime('%Y-%m-%d')
     elif m_weeks:
         num_days = int(m_weeks.group(1)) * 7
         start_date = (today - timedelta(weeks=int(m_weeks.group(1)))).strftime('%Y-%m-%d')
@@ -71,157 +103,481 @@ def _parse_date_range(query: str) -> Tuple[str, str, int]:
 # === company and trading data ===
 
 
-def _get_history_data(symbol: str, start: str, end: str, interval: str = '1D') -> pd.DataFrame:
-    """Helper: Lấy và cache dữ liệu lịch sử, xử lý lỗi."""
+def _get_history_data(symbol: str, start: str, end: str, interval: str = '1D') -> Bars:
+    """
+    Helper: Lấy dữ liệu lịch sử qua kho nến cục bộ (chỉ tải phần thiếu), xử lý lỗi.
+    Trả về Bars: view chỉ-đọc vào kho (dùng chung giữa các request, không sao chép);
+    'time' là epoch ns đã sắp xếp, chỉ đổi sang chuỗi khi hiển thị.
+    """
     try:
-        quote = Quote(symbol=symbol.upper(), source=DATA_SOURCE)
-        df = quote.history(start=start, end=end, interval=interval)
-        if df.empty:
+        key = (symbol.upper(), interval, start, end)
+        with metrics.timed('fetch'):
+            bars = history_flight.do(key, bar_store.get_bars, symbol, start, end, interval)
+        if not len(bars):
             raise ValueError(f"Không có dữ liệu cho mã {symbol} trong khoảng thời gian này.")
-        df = df.reset_index()
-        df['time'] = pd.to_datetime(df['time']).dt.strftime('%Y-%m-%d')
-        return df
+        return bars
     except Exception as e:
         logging.error(f"Lỗi _get_history_data cho {symbol}: {e}")
-        return pd.DataFrame() 
+        return Bars.empty()
 
-def _get_company_data(symbol: str, info_type: str) -> pd.DataFrame:
-    try:
-        company = Company(symbol=symbol.upper(), source=DATA_SOURCE)
-
-        if info_type == 'shareholders':
-            df = company.shareholders()
-
-            if df is None or df.empty:
-                return pd.DataFrame(columns=[
-                    "id", "share_holder", "quantity", "share_own_percent", "update_date"
-                ])
-
-            rename_map = {
-                "holder_name": "share_holder",
-                "own_percent": "share_own_percent",
-                "own_quantity": "quantity",
-                "last_update": "update_date",
-                "update": "update_date"
-            }
-            df = df.rename(columns=rename_map)
+def _time_labels(bars: Bars, interval: str = '1D') -> np.ndarray:
+    """Helper: mốc thời gian -> chuỗi hiển thị (vector hóa); khung phút/giờ giữ cả giờ:phút."""
+    unit = 'D' if interval.upper() == '1D' else 'm'
+    return np.char.replace(np.datetime_as_string(bars.datetimes(), unit=unit), 'T', ' ')
 
-            # ensure schema
-            for col in ["id", "share_holder", "quantity", "share_own_percent", "update_date"]:
-                if col not in df.columns:
-                    df[col] = None
-
-            return df[["id", "share_holder", "quantity", "share_own_percent", "update_date"]]
-
-        elif info_type == 'officers':
-            return company.officers()
-
-        elif info_type == 'subsidiaries':
-            return company.subsidiaries()
+def _get_history_batch(symbols: List[str], start: str, end: str, interval: str = '1D',
+                       timeout: float = FETCH_TIMEOUT) -> Dict[str, Bars]:
+    """
+    Helper: Tải song song dữ liệu lịch sử cho nhiều mã (tối đa FETCH_MAX_WORKERS mã cùng lúc).
+    Trả về dict {MÃ: Bars} theo đúng thứ tự đầu vào; mã lỗi/quá hạn nhận Bars rỗng.
+    """
+    unique = list(dict.fromkeys(s.upper() for s in symbols))
+    futures = {s: _fetch_pool.submit(contextvars.copy_context().run, _get_history_data, s, start, end, interval)
+               for s in unique}
+    deadline = time.monotonic() + timeout
+
+    results = {}
+    for s, future in futures.items():
+        try:
+            results[s] = future.result(timeout=max(0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            future.cancel()
+            logging.error(f"Quá thời gian tải dữ liệu cho {s} ({timeout}s).")
+            results[s] = Bars.empty()
+    return results
+
+def _fetch_company_data(symbol: str, info_type: str) -> pd.DataFrame:
+    """Helper: Gọi nguồn dữ liệu (có failover), ném lỗi nếu thất bại."""
+    if info_type not in ('shareholders', 'officers', 'subsidiaries'):
+        raise ValueError("Loại thông tin không hợp lệ.")
+    df = provider.company(symbol, info_type)
+
+    if info_type == 'shareholders':
+
+        if df is None or df.empty:
+            return pd.DataFrame(columns=[
+                "id", "share_holder", "quantity", "share_own_percent", "update_date"
+            ])
+
+        rename_map = {
+            "holder_name": "share_holder",
+            "own_percent": "share_own_percent",
+            "own_quantity": "quantity",
+            "last_update": "update_date",
+            "update": "update_date"
+        }
+        df = df.rename(columns=rename_map)
+
+        # ensure schema
+        for col in ["id", "share_holder", "quantity", "share_own_percent", "update_date"]:
+            if col not in df.columns:
+                df[col] = None
+
+        return df[["id", "share_holder", "quantity", "share_own_percent", "update_date"]]
+
+    return df
+
+def _cache_company(key: tuple, df: pd.DataFrame):
+    """
+    Đưa vào company_cache kèm phiên bản theo nội dung (df.attrs['version']) cho khóa cache
+    câu trả lời: cùng dữ liệu thì cùng phiên bản ở mọi worker, nên ETag không lệch giữa các tiến trình.
+    """
+    content = df.to_json(orient='split', date_format='iso', default_handler=str)
+    df.attrs['version'] = hashlib.sha1(content.encode()).hexdigest()[:16]
+    company_cache.set(key, df, ttl=COMPANY_TTL.get(key[1]))
 
-        else:
-            raise ValueError("Loại thông tin không hợp lệ.")
+def _get_company_data(symbol: str, info_type: str) -> pd.DataFrame:
+    key = (symbol.upper(), info_type)
+    cached = company_cache.get(key)
+    if cached is not MISSING:
+        return cached.copy()
 
+    try:
+        with metrics.timed('company_fetch'):
+            df = company_flight.do(key, _fetch_company_data, symbol, info_type)
     except Exception as e:
         logging.error(f"Lỗi _get_company_data cho {symbol} ({info_type}): {e}")
         return pd.DataFrame()
+    if df is None:
+        return pd.DataFrame()
+
+    _cache_company(key, df)
+    return df.copy()
+
+def invalidate_company_cache(symbol: str = None, info_type: str = None) -> int:
+    """Xóa cache thông tin doanh nghiệp theo mã và/hoặc info_type (bỏ trống = tất cả)."""
+    return company_cache.invalidate(
+        lambda key: (symbol is None or key[0] == symbol.upper())
+        and (info_type is None or key[1] == info_type)
+    )
+
+def warm_company_cache(symbols: List[str], info_types: List[str] = None):
+    """Nạp sẵn cache thông tin doanh nghiệp (bỏ qua các khóa còn hạn)."""
+    for s in symbols:
+        for info_type in info_types or list(COMPANY_TTL):
+            _get_company_data(s, info_type)
+
+def refresh_company_data(symbol: str, info_type: str) -> bool:
+    """Tải lại thông tin doanh nghiệp và thay vào cache (bản cũ vẫn phục vụ tới khi có bản mới)."""
+    key = (symbol.upper(), info_type)
+    df = company_flight.do(key, _fetch_company_data, symbol, info_type)
+    if df is None:
+        return False
+    _cache_company(key, df)
+    return True
+
+def cache_stats() -> dict:
+    """Số liệu hit/miss của cache doanh nghiệp, kho nến và single-flight."""
+    return {
+        "company_cache": company_cache.stats(),
+        "answer_cache": answer_cache.stats(),
+        "bar_store": bar_store.stats(),
+        "history_flight": history_flight.stats(),
+        "company_flight": company_flight.stats(),
+        "providers": provider.stats(),
+        "workers": workers.stats(),
+    }
+
+def _get_listed_symbols(exchanges: List[str] = None, fallback: bool = True) -> List[str]:
+    """
+    Helper: Danh sách mã cổ phiếu niêm yết (HOSE/HNX/UPCoM) từ nguồn dữ liệu đang cấu hình,
+    cache 1 ngày. Nếu không lấy được thì dùng các mã đang có trong kho nến cục bộ
+    (fallback=False thì ném lỗi); lỗi được nhớ LISTING_RETRY giây để không gọi lại liên tục.
+    """
+    key, error_key = ('*', 'listing'), ('*', 'listing_error')
+    listing = company_cache.get(key)
+    if listing is MISSING:
+        error = company_cache.get(error_key)
+        try:
+            if error is not MISSING:
+                raise error
+            try:
+                listing = provider.listing()
+            except Exception as e:
+                company_cache.set(error_key, e, ttl=LISTING_RETRY)
+                logging.error(f"Lỗi lấy danh sách niêm yết: {e}")
+                raise
+            if 'type' in listing.columns:
+                listing = listing[listing['type'] == 'STOCK']
+            company_cache.set(key, listing, ttl=24 * 3600)
+        except Exception:
+            if not fallback:
+                raise
+            return bar_store.symbols('1D')
+
+    if exchanges:
+        aliases = {'HOSE': 'HSX', 'HSX': 'HSX', 'HNX': 'HNX', 'UPCOM': 'UPCOM'}
+        wanted = {aliases.get(e.upper(), e.upper()) for e in exchanges}
+        listing = listing[listing['exchange'].str.upper().isin(wanted)]
+    return listing['symbol'].str.upper().tolist()
+
+def screen_market(condition: str, exchanges: List[str] = None, refresh: bool = False,
+                  lookback: int = 300) -> pd.DataFrame:
+    """
+    Helper: Chạy bộ lọc trên toàn thị trường từ kho nến cục bộ (ma trận ngày × mã).
+    Trước khi lọc, mọi mã đều được bảo đảm có đủ `lookback` phiên đã chốt trong kho
+    (chỉ tải phần thiếu), để kết quả không phụ thuộc mã nào từng được hỏi trước đó.
+    refresh=True tải thêm cả phiên đang giao dịch.
+    """
+    symbols = _get_listed_symbols(exchanges)
+    today = datetime.now(VN_TZ).date()
+    start = trading_days_back(today, lookback).isoformat()
+    end = (today if refresh else bar_store.final_until(today)).isoformat()
+    missing = [s for s in symbols if bar_store.version(s, '1D', start, end) is None]
+    if missing:
+        with metrics.timed('screen_fetch'):
+            _get_history_batch(missing, start, end, '1D', timeout=FETCH_TIMEOUT * 10)
+    with metrics.timed('screen'):
+        if workers.enabled():
+            return workers.run(workers.screen, bar_store.root, condition, symbols, lookback)
+        columns = {s: bar_store.read_columns(s, '1D') for s in symbols}
+        return run_screen(condition, columns, lookback)
+
+def _analysis_range(date_query: str, indicators: List[str] = None, resolution: str = '1D') -> Tuple[str, str, int, str]:
+    """
+    Helper: (start_date, end_date, num_days, fetch_start) cho get_stock_analysis.
+    Chỉ tải thêm đúng số nến khởi động mà các chỉ báo cần (tính theo phiên giao
+    dịch, có nghỉ lễ): OHLCV thuần không tải thêm gì, SMA_200 lùi đủ 199 phiên.
+    """
+    start_date, end_date, num_days = _parse_date_range(date_query)
+    specs = []
+    for ind in indicators or []:
+        try:
+            output_names(ind)
+            specs.append(ind)
+        except ValueError:
+            pass   # chỉ báo không hợp lệ sẽ được cảnh báo ở get_stock_analysis
+    fetch_start = lookback_start(start_date, warmup_bars(specs), resolution).strftime('%Y-%m-%d')
+    return start_date, end_date, num_days, fetch_start
+
+def _data_needs(tool_call: dict) -> Tuple[List[Tuple[str, str, str, str]], List[Tuple[str, str]]]:
+    """Helper: Dữ liệu một tool_call sẽ đọc: ([(symbol, interval, start, end)], [(symbol, info_type)])."""
+    name, args = tool_call["name"], tool_call["arguments"]
+    if name == "get_stock_analysis" and args.get("symbol"):
+        _, end, _, fetch_start = _analysis_range(args["date_query"], args.get("indicators"), args.get("resolution", '1D'))
+        return [(args["symbol"].upper(), args.get("resolution", '1D'), fetch_start, end)], []
+    if name == "compare_stock_prices":
+        start, end, _ = _parse_date_range(args["date_query"])
+        return [(s.upper(), '1D', start, end) for s in args.get("symbols") or []], []
+    if name == "compare_stocks":
+        start, end, _ = _parse_date_range(args["date_query"])
+        return [(s.upper(), '1D', start, end) for s in args.get("symbols") or []], []
+    if name == "compare_stock_volumes":
+        start, end, _ = _parse_date_range(args["date_query"])
+        return [(s.upper(), '1D', start, end) for s in (args.get("symbol1"), args.get("symbol2")) if s], []
+    if name == "get_company_info" and args.get("symbol"):
+        return [], [(args["symbol"].upper(), args["info_type"])]
+    return [], []
+
+def answer_key(tool_call: dict) -> Optional[tuple]:
+    """
+    Khóa cache câu trả lời: (tool, tham số chuẩn hóa, phiên bản dữ liệu). Thời gian tương
+    đối ("10 ngày") được đổi ra khoảng ngày tuyệt đối. None nếu không cache được: tool
+    không hỗ trợ, hoặc dữ liệu cần dùng chưa có đủ / đã tới hạn làm mới.
+    """
+    name, args = tool_call["name"], dict(tool_call["arguments"])
+    try:
+        history, company = _data_needs(tool_call)
+    except Exception:
+        return None
+    if not history and not company:
+        return None   # screen_stocks: phụ thuộc toàn thị trường
+
+    if "date_query" in args:
+        args["date_query"] = _parse_date_range(args["date_query"])[:2]
+    for field in ("symbol", "symbol1", "symbol2"):
+        if isinstance(args.get(field), str):
+            args[field] = args[field].upper()
+    for field in ("symbols", "indicators"):
+        if args.get(field):
+            args[field] = [str(v).upper() for v in args[field]]
+    if args.get("measures"):
+        args["measures"] = [str(v).strip().lower() for v in args["measures"]]
+
+    versions = []
+    for symbol, interval, start, end in history:
+        version = bar_store.version(symbol, interval, start, end)
+        if version is None:
+            return None
+        versions.append((symbol, interval, start, end, version))
+    for key in company:
+        cached = company_cache.peek(key)
+        if cached is MISSING:
+            return None
+        versions.append(key + (cached.attrs.get('version'),))
+    return name, json.dumps(args, sort_keys=True, ensure_ascii=False, default=str), tuple(versions)
+
+def prefetch_for_tool_calls(tool_calls: List[dict], timeout: float = FETCH_TIMEOUT * 3) -> dict:
+    """
+    Lập kế hoạch tải chung cho nhiều tool_call: gộp các khoảng của cùng (symbol, interval)
+    thành khoảng rộng nhất, gộp trùng thông tin doanh nghiệp, rồi tải song song một lần
+    vào kho nến / cache. Sau đó từng tool đọc lại phần của mình mà không gọi upstream.
+    """
+    ranges = {}
+    company = set()
+    for call in tool_calls:
+        history, infos = _data_needs(call)
+        for symbol, interval, start, end in history:
+            interval = bar_store.storage_interval(interval)   # 5m/15m/... dùng chung nến 1m
+            lo, hi = ranges.get((symbol, interval), (start, end))
+            ranges[(symbol, interval)] = (min(lo, start), max(hi, end))
+        company.update(infos)
+
+    futures = [_fetch_pool.submit(bar_store.get_bars, s, lo, hi, interval) for (s, interval), (lo, hi) in ranges.items()]
+    futures += [_fetch_pool.submit(_get_company_data, s, info_type) for s, info_type in company]
+    deadline = time.monotonic() + timeout
+    for future in futures:
+        try:
+            future.result(timeout=max(0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            future.cancel()
+        except Exception as e:
+            logging.error(f"Lỗi tải trước dữ liệu: {e}")
+    return {"history_fetches": len(ranges), "company_fetches": len(company), "tool_calls": len(tool_calls)}
+
+def _closed_count(bars: Bars, interval: str) -> int:
+    """Helper: Số nến đầu đã đóng; nến cuối còn đang hình thành nếu mốc kết thúc chưa tới."""
+    now = np.datetime64(datetime.now(VN_TZ).replace(tzinfo=None), 'ns').astype('int64')
+    step = INTERVAL_MINUTES.get(interval, 24 * 60) * 60 * 10 ** 9
+    return len(bars) - int(len(bars) and bars.time[-1] + step > now)
+
+def _streaming_indicator_columns(symbol: str, resolution: str, specs: List[str], bars: Bars,
+                                 first: int = 0) -> Dict[str, list]:
+    """
+    Helper: Chỉ báo intraday từ trạng thái ấm - chỉ nạp các nến ĐÃ ĐÓNG mới hơn lần trước
+    (O(1) mỗi nến); nến đang hình thành được tính trên bản sao trạng thái, không ghi lại.
+    Trạng thái được nạp lại từ đầu `bars` khi không nối tiếp được hoặc không phủ tới nến
+    hiển thị đầu tiên (bars[first]); vẫn không phủ được (vượt HISTORY_BARS) thì tính lại toàn bộ.
+    """
+    if not specs:
+        return {}
+    state, lock = indicator_states.get(symbol, resolution, specs)
+    labels = _time_labels(bars, resolution)
+    shown_from = labels[min(first, len(labels) - 1)]
+    closed = _closed_count(bars, resolution)
+
+    def bar_at(i: int) -> dict:
+        t = labels[i]
+        return {'time': t, 'session': t[:10], 'open': float(bars.open[i]), 'high': float(bars.high[i]),
+                'low': float(bars.low[i]), 'close': float(bars.close[i]), 'volume': float(bars.volume[i])}
+
+    with lock:
+        if state.last_time is not None and (labels[0] > state.last_time or shown_from < state.first_time):
+            state.reset()
+        first_new = 0 if state.last_time is None else int(np.searchsorted(labels[:closed], state.last_time, side='right'))
+        for i in range(first_new, closed):
+            state.update(bar_at(i))
+        columns = None
+        if state.first_time is not None and state.first_time <= shown_from:
+            pending = (labels[closed], state.preview(bar_at(closed))) if closed < len(bars) else None
+            columns = state.columns(labels.tolist(), pending)
+    indicator_states.save(symbol, resolution, specs)
+
+    if columns is None:
+        sessions = bars.time // (24 * 60 * 60 * 10 ** 9)
+        return IndicatorEngine(bars.close, bars.high, bars.low, bars.volume, sessions).compute(specs)
+    return columns
+
+def _daily_indicator_columns(symbol: str, resolution: str, specs: List[str], bars: Bars) -> Dict[str, np.ndarray]:
+    """
+    Helper: Chỉ báo tính lại toàn bộ trên `bars`. Bật ANALYTICS_WORKERS thì tính ở
+    tiến trình worker (đọc chung kho nến qua memory-map); worker lỗi thì tính tại chỗ.
+    """
+    if workers.enabled() and specs:
+        try:
+            return workers.run(workers.indicator_columns, bar_store.root, symbol.upper(), resolution,
+                               int(bars.time[0]), int(bars.time[-1]), len(bars), specs)
+        except workers.WorkerTimeout:
+            raise
+        except Exception as e:
+            logging.error(f"Worker tính chỉ báo {symbol} lỗi, tính tại chỗ: {e}")
+    return IndicatorEngine(bars.close, bars.high, bars.low, bars.volume).compute(specs)
 
 # ==============================================================================
 # === 3. TOOLS DÀNH CHO AGENT (AGENT TOOLS) ===
 # ==============================================================================
 
 
-def get_stock_analysis(symbol: str, date_query: str, indicators: List[str] = None, resolution: str = '1D') -> str:
+def get_stock_analysis(symbol: str, date_query: str, indicators: List[str] = None, resolution: str = '1D') -> ToolResult:
     """
     Tool chính: Lấy dữ liệu OHLCV, tính tổng Volume VÀ các chỉ báo kỹ thuật
-    (SMA, RSI...) cho một mã cổ phiếu dựa trên truy vấn thời gian
+    (SMA, EMA, RSI, MACD, BB, ATR, VWAP) cho một mã cổ phiếu dựa trên truy vấn thời gian
     (ví dụ: "10 ngày qua", "2 tuần", "từ đầu tháng 11").
     """
     try:
-        # 1. Parse thời gian
-        start_date, end_date, num_days = _parse_date_range(date_query)
+        # 1. Parse thời gian + khoảng cần tải (gồm số nến khởi động cho chỉ báo)
+        start_date, end_date, _, fetch_start = _analysis_range(date_query, indicators, resolution)
         
         # 2. Lấy dữ liệu
-        # Cần lấy thêm dữ liệu quá khứ để tính indicators (ví dụ SMA20 cần 20 ngày)
-        # Lấy thêm 3 tháng dữ liệu làm "buffer"
-        buffer_start_date = (datetime.strptime(start_date, '%Y-%m-%d') - relativedelta(months=3)).strftime('%Y-%m-%d')
-        df = _get_history_data(symbol, buffer_start_date, end_date, resolution)
-        if df.empty: return f"Không tìm thấy dữ liệu cho {symbol}."
-
-        # 3. Tính toán
-        total_volume = df[df['time'] >= start_date]['volume'].sum()
+        bars = _get_history_data(symbol, fetch_start, end_date, resolution)
+        if not len(bars): return ToolResult.text(f"Không tìm thấy dữ liệu cho {symbol}.")
+
+        # 3. Tính toán (time đã sắp xếp: vị trí bắt đầu hiển thị tìm bằng nhị phân)
+        first = bars.index_of(start_date)
+        total_volume = int(bars.volume[first:].sum())
         
-        cols_to_display = ['time', 'open', 'high', 'low', 'close', 'volume']
+        columns_all = {}
         indicator_warnings = []
 
         if indicators:
+            # Gom toàn bộ chỉ báo hợp lệ rồi tính trong một lượt dùng chung mảng giá
+            specs = []
             for ind in indicators:
-                ind = ind.upper()
-                if ind.startswith('SMA_'):
-                    period = int(ind.split('_')[1])
-                    df[ind] = _calculate_sma(df['close'], period)
-                elif ind.startswith('RSI_'):
-                    period = int(ind.split('_')[1])
-                    df[ind] = _calculate_rsi(df['close'], period)
-                
-                if ind not in cols_to_display:
-                    cols_to_display.append(ind)
-                
-                # Check cảnh báo RSI
-                if ind.startswith('RSI_'):
-                    rsi_val = df[ind].iloc[-1]
-                    if rsi_val > 70: indicator_warnings.append(f"CẢNH BÁO: {ind} = {rsi_val:.1f} > 70 (Quá mua)")
-                    elif rsi_val < 30: indicator_warnings.append(f"CẢNH BÁO: {ind} = {rsi_val:.1f} < 30 (Quá bán)")
+                try:
+                    output_names(ind)
+                    specs.append(ind.upper())
+                except ValueError as e:
+                    indicator_warnings.append(f"BỎ QUA: {e}")
+
+            specs = list(dict.fromkeys(specs))
+            with metrics.timed('indicators'):
+                if resolution.upper() == '1D':
+                    columns = _daily_indicator_columns(symbol, resolution, specs, bars)
+                else:
+                    columns = _streaming_indicator_columns(symbol, resolution, specs, bars, first)
+
+            for name, values in columns.items():
+                columns_all[name] = values
 
-        # 4. Lọc lại đúng khung thời gian
-        df_display = df[df['time'] >= start_date].tail(num_days * 2) # Hiển thị 2* số ngày cho chắc
-        
-        # 5. Format Output
-        table = df_display[cols_to_display].round(2).to_string(index=False, float_format="{:,.0f}".format)
+                # Check cảnh báo RSI
+                if name.startswith('RSI_'):
+                    rsi_val = values[-1]
+                    if rsi_val > 70: indicator_warnings.append(f"CẢNH BÁO: {name} = {rsi_val:.1f} > 70 (Quá mua)")
+                    elif rsi_val < 30: indicator_warnings.append(f"CẢNH BÁO: {name} = {rsi_val:.1f} < 30 (Quá bán)")
+
+        # 4. Lọc lại đúng khung thời gian (view, không sao chép); bảng hiển thị
+        #    chỉ được dựng theo lô khi được đọc (stream gửi header trước, không giữ cả bảng)
+        shown = bars[first:]
+        indicator_values = {name: np.asarray(values)[first:] for name, values in columns_all.items()}
+
+        def display(lo: int, hi: int) -> dict:
+            part = shown[lo:hi]
+            cols = {'time': _time_labels(part, resolution)}
+            for col in ('open', 'high', 'low', 'close'):
+                # float32 -> float64 làm tròn để JSON không mang sai số float32
+                cols[col] = part.column(col).astype('float64').round(4)
+            cols['volume'] = part.volume
+            cols.update({name: values[lo:hi] for name, values in indicator_values.items()})
+            return cols
+
+        names = ['time', 'open', 'high', 'low', 'close', 'volume'] + list(indicator_values)
         
-        output = f"###DATA\n"
-        output += f"Kết quả cho {symbol.upper()} (từ {start_date} đến {end_date}):\n"
-        output += f"Tổng khối lượng (Volume): {total_volume:,.0f} cổ phiếu.\n\n"
-        output += f"Dữ liệu chi tiết:\n{table}\n"
-        if indicator_warnings:
-            output += "\n" + "\n".join(indicator_warnings) + "\n"
-        output += "###END_DATA"
-        return output
+        # 5. Kết quả dạng cột (việc dựng text/JSON để tầng API quyết định)
+        return ToolResult(
+            summary=[
+                f"Kết quả cho {symbol.upper()} (từ {start_date} đến {end_date}):",
+                f"Tổng khối lượng (Volume): {total_volume:,.0f} cổ phiếu.",
+            ],
+            table_title="Dữ liệu chi tiết:",
+            columns=ColumnSource(names, len(shown), display),
+            notes=indicator_warnings,
+            fields={
+                "symbol": symbol.upper(), "start_date": start_date, "end_date": end_date,
+                "total_volume": total_volume, "resolution": resolution,
+            },
+        )
 
     except Exception as e:
-        return f"Lỗi khi phân tích {symbol}: {e}"
+        return ToolResult.text(f"Lỗi khi phân tích {symbol}: {e}")
 
 
-def get_company_info(symbol: str, info_type: str) -> str:
+def get_company_info(symbol: str, info_type: str) -> ToolResult:
     """
     Lấy thông tin cơ bản của công ty.
     info_type phải là một trong: 'shareholders' (cổ đông), 'officers' (lãnh đạo), 'subsidiaries' (công ty con).
     """
     if info_type not in ['shareholders', 'officers', 'subsidiaries']:
-        return "Lỗi: info_type không hợp lệ. Phải là 'shareholders', 'officers', hoặc 'subsidiaries'."
+        return ToolResult.text("Lỗi: info_type không hợp lệ. Phải là 'shareholders', 'officers', hoặc 'subsidiaries'.")
 
     try:
         df = _get_company_data(symbol, info_type)
         if df.empty:
-            return f"Không có dữ liệu {info_type} cho {symbol}."
+            return ToolResult.text(f"Không có dữ liệu {info_type} cho {symbol}.")
 
-        output = ""
+        fields = {"symbol": symbol.upper(), "info_type": info_type}
         # Xử lý đặc biệt cho 'officers' để lấy tên
         if info_type == 'officers':
             working = df[df['type'] == 'đang làm việc'] if 'type' in df.columns else df
-            table = working[['officer_name', 'position']].head(10).to_string(index=False)
-            names = ', '.join(working['officer_name'].dropna().tolist())
-            output = f"###DATA\n{table}\nTên (toàn bộ): {names}\n###END_DATA"
-        else:
-            table = df.head(10).to_string(index=False)
-            output = f"###DATA\n{table}\n###END_DATA"
-        
-        return output
+            table = working[['officer_name', 'position']].head(10)
+            names = working['officer_name'].dropna().tolist()
+            return ToolResult(
+                columns={col: table[col].to_numpy() for col in table.columns},
+                notes=[f"Tên (toàn bộ): {', '.join(names)}"],
+                fields={**fields, "officer_names": names},
+                float_format=None,
+            )
+
+        table = df.head(10)
+        return ToolResult(
+            columns={col: table[col].to_numpy() for col in table.columns},
+            fields=fields,
+            float_format=None,
+        )
     except Exception as e:
-        return f"Lỗi khi lấy thông tin {info_type} cho {symbol}: {e}"
+        return ToolResult.text(f"Lỗi khi lấy thông tin {info_type} cho {symbol}: {e}")
 
 
-def compare_stock_prices(symbols: List[str], date_query: str, metric: str = 'open') -> str:
+def compare_stock_prices(symbols: List[str], date_query: str, metric: str = 'open') -> ToolResult:
     """
     So sánh giá (open, high, low, close) của nhiều mã và tìm mã thấp nhất/cao nhất.
     metric: 'open', 'high', 'low', 'close'.
@@ -230,108 +586,236 @@ def compare_stock_prices(symbols: List[str], date_query: str, metric: str = 'ope
         start_date, end_date, _ = _parse_date_range(date_query)
         results = {}
         
-        for s in symbols:
-            df = _get_history_data(s.upper(), start_date, end_date, '1D')
-            if not df.empty:
-                results[s.upper()] = df[metric].min() # Tìm giá MỞ CỬA thấp nhất
+        for s, bars in _get_history_batch(symbols, start_date, end_date, '1D').items():
+            if len(bars):
+                results[s] = round(float(bars.column(metric).min()), 4) # Tìm giá MỞ CỬA thấp nhất
             else:
-                results[s.upper()] = None
+                results[s] = None
         
         valid = {k: v for k, v in results.items() if v is not None}
-        if not valid: return "Không có dữ liệu cho bất kỳ mã nào."
+        if not valid: return ToolResult.text("Không có dữ liệu cho bất kỳ mã nào.")
         
         min_symbol = min(valid, key=valid.get)
         min_value = valid[min_symbol]
         
-        summary = "\n".join([f"Mã {s}: {v:,.0f} VND" if v else f"Mã {s}: Không có dữ liệu" for s, v in results.items()])
+        summary = [f"Mã {s}: {v:,.0f} VND" if v else f"Mã {s}: Không có dữ liệu" for s, v in results.items()]
         
-        return f"###DATA\n{summary}\n\nMã có giá {metric} thấp nhất: {min_symbol} ({min_value:,.0f} VND)\n###END_DATA"
+        return ToolResult(
+            summary=summary,
+            notes=[f"Mã có giá {metric} thấp nhất: {min_symbol} ({min_value:,.0f} VND)"],
+            fields={"metric": metric, "values": results, "min_symbol": min_symbol, "min_value": min_value},
+        )
     except Exception as e:
-        return f"Lỗi so sánh giá: {e}"
+        return ToolResult.text(f"Lỗi so sánh giá: {e}")
 
 
-def compare_stock_volumes(symbol1: str, symbol2: str, date_query: str) -> str:
+def compare_stock_volumes(symbol1: str, symbol2: str, date_query: str) -> ToolResult:
     """So sánh tổng khối lượng giao dịch (volume) của 2 mã cổ phiếu."""
     try:
         start_date, end_date, _ = _parse_date_range(date_query)
         
-        df1 = _get_history_data(symbol1.upper(), start_date, end_date, '1D')
-        df2 = _get_history_data(symbol2.upper(), start_date, end_date, '1D')
+        batch = _get_history_batch([symbol1, symbol2], start_date, end_date, '1D')
+        bars1 = batch.get(symbol1.upper(), Bars.empty())
+        bars2 = batch.get(symbol2.upper(), Bars.empty())
         
-        if df1.empty or df2.empty:
-            return "Không có đủ dữ liệu để so sánh."
+        if not len(bars1) or not len(bars2):
+            return ToolResult.text("Không có đủ dữ liệu để so sánh.")
             
-        v1 = df1['volume'].sum()
-        v2 = df2['volume'].sum()
+        v1 = int(bars1.volume.sum())
+        v2 = int(bars2.volume.sum())
         
-        return f"###DATA\n{symbol1.upper()}: {v1:,.0f}\n{symbol2.upper()}: {v2:,.0f}\n###END_DATA"
+        return ToolResult(
+            summary=[f"{symbol1.upper()}: {v1:,.0f}", f"{symbol2.upper()}: {v2:,.0f}"],
+            fields={symbol1.upper(): v1, symbol2.upper(): v2},
+        )
     except Exception as e:
-        return f"Lỗi so sánh volume: {e}"
+        return ToolResult.text(f"Lỗi so sánh volume: {e}")
 
 
-# === 4. DANH SÁCH TOOLS (FINAL) ===
+def compare_stocks(symbols: List[str], date_query: str, measures: List[str] = None) -> ToolResult:
+    """
+    So sánh chéo một rổ mã trên cùng trục phiên giao dịch, xếp hạng theo số đo đầu tiên.
+    measures: min_/max_/mean_ + open/high/low/close, 'volume', 'return', 'volatility', 'corr'
+    (mặc định: return, volatility, volume).
+    """
+    try:
+        try:
+            wanted = list(dict.fromkeys(parse_measure(m) for m in (measures or DEFAULT_MEASURES)))
+        except ValueError as e:
+            return ToolResult.text(str(e))
+        start_date, end_date, _ = _parse_date_range(date_query)
+
+        batch = _get_history_batch(symbols, start_date, end_date, '1D')
+        with metrics.timed('compare'):
+            names, _, values, corr = cross_section({s: b.as_dict() for s, b in batch.items() if len(b)}, wanted)
+        if not names: return ToolResult.text("Không có dữ liệu cho bất kỳ mã nào.")
+
+        # Bảng: mỗi hàng một mã, sắp theo hạng của số đo đầu tiên (corr không xếp hạng)
+        ranked = [m for m in wanted if m in values]
+        order = np.argsort(rank(values[ranked[0]])) if ranked else np.arange(len(names))
+        columns = {'symbol': np.array(names)[order]}
+        if ranked:
+            columns['rank'] = np.arange(1, len(names) + 1)
+        for m in ranked:
+            columns[m] = values[m][order] if m == 'volume' else values[m][order].round(4)
+        if corr is not None:
+            for j in order:
+                columns[f"corr_{names[j]}"] = corr[order, j].round(4)
+
+        notes = []
+        for m in ranked:
+            if np.isnan(values[m].astype('float64')).all():
+                continue
+            hi, lo = int(np.nanargmax(values[m])), int(np.nanargmin(values[m]))
+            fmt = ',.0f' if m == 'volume' else ',.4f'
+            notes.append(f"{m}: cao nhất {names[hi]} ({values[m][hi]:{fmt}}), thấp nhất {names[lo]} ({values[m][lo]:{fmt}})")
+        missing = [s.upper() for s in symbols if s.upper() not in names]
+        if missing:
+            notes.append(f"Không có dữ liệu: {', '.join(missing)}")
+
+        return ToolResult(
+            summary=[f"So sánh {len(names)} mã (từ {start_date} đến {end_date}):"],
+            table_title=f"Xếp hạng theo {ranked[0]}:" if ranked else "Tương quan lợi suất theo phiên:",
+            columns=columns,
+            notes=notes,
+            float_format="{:,.4f}",
+            fields={
+                "symbols": names, "measures": wanted, "rank_by": ranked[0] if ranked else None,
+                "start_date": start_date, "end_date": end_date,
+                "correlation": corr.round(4).tolist() if corr is not None else None,
+            },
+        )
+    except Exception as e:
+        return ToolResult.text(f"Lỗi so sánh nhiều mã: {e}")
 
 
-all_tools = [
-    FunctionTool.from_defaults(
-        fn=get_stock_analysis,
-        name="get_stock_analysis",
-        description=(
-            "Tool chính để lấy dữ liệu OHLCV, Tổng Volume, HOẶC tính các chỉ báo kỹ thuật (SMA, RSI) cho MỘT mã cổ phiếu."
-            " Sử dụng cho các câu hỏi về giá, khối lượng, hoặc chỉ báo của 1 mã."
-            "\n"
-            "HƯỚNG DẪN THAM SỐ:\n"
-            "1. `symbol`: Mã cổ phiếu (ví dụ: 'HPG', 'VIC').\n"
-            "2. `date_query`: PHẢI là chuỗi (string) thời gian GỐC bằng TIẾNG VIỆT lấy TỪ CÂU HỎI. "
-            "   KHÔNG ĐƯỢC dịch sang tiếng Anh, KHÔNG ĐƯỢC tự ý đổi thành ngày tháng (YYYY-MM-DD)."
-            "   VÍ DỤ ĐÚNG: '10 ngày gần nhất', 'từ đầu tháng 11', '1 tuần gần đây', '2 tháng'.\n"
-            "3. `indicators`: PHẢI là một DANH SÁCH (list) các CHUỖI (string). "
-            "   - Định dạng là 'TEN_SO', ví dụ: ['SMA_9', 'SMA_20', 'RSI_14']. "
-            "   - Nếu câu hỏi chỉ lấy OHLCV hoặc Volume (như Câu 1, 2, 4 trong file test), hãy truyền vào một DANH SÁCH RỖNG: [].\n"
-            "4. `resolution`: Khung thời gian. Mặc định là '1D'. Chỉ thay đổi nếu người dùng yêu cầu rõ (ví dụ: '1m', '1H')."
+def screen_stocks(condition: str, exchanges: List[str] = None, limit: int = 50) -> ToolResult:
+    """
+    Lọc toàn bộ cổ phiếu HOSE/HNX/UPCoM theo điều kiện kỹ thuật tại phiên gần nhất,
+    ví dụ: "RSI_14 < 30 and close > SMA_50".
+    """
+    try:
+        df = screen_market(condition, exchanges)
+        if df.empty:
+            return ToolResult.text(f"Không có mã nào thỏa điều kiện: {condition}")
+
+        table = df.head(limit)
+        return ToolResult(
+            summary=[f"Có {len(df)} mã thỏa điều kiện: {condition}"],
+            columns={col: table[col].to_numpy() for col in table.columns},
+            fields={"condition": condition, "count": len(df)},
+            float_format="{:,.2f}",
         )
+    except Exception as e:
+        return ToolResult.text(f"Lỗi khi lọc cổ phiếu: {e}")
+
+
+# === 4. DANH SÁCH TOOLS (FINAL) ===
+
+
+# Tra cứu trực tiếp theo tên cho router (không cần duyệt all_tools)
+tool_functions = {
+    "get_stock_analysis": get_stock_analysis,
+    "get_company_info": get_company_info,
+    "compare_stock_prices": compare_stock_prices,
+    "compare_stock_volumes": compare_stock_volumes,
+    "compare_stocks": compare_stocks,
+    "screen_stocks": screen_stocks,
+}
+
+
+# Mô tả tool cho LLM routing (tên -> hướng dẫn tham số)
+TOOL_DESCRIPTIONS = {
+    "get_stock_analysis": (
+        "Tool chính để lấy dữ liệu OHLCV, Tổng Volume, HOẶC tính các chỉ báo kỹ thuật (SMA, EMA, RSI, MACD, BB, ATR, VWAP) cho MỘT mã cổ phiếu."
+        " Sử dụng cho các câu hỏi về giá, khối lượng, hoặc chỉ báo của 1 mã."
+        "\n"
+        "HƯỚNG DẪN THAM SỐ:\n"
+        "1. `symbol`: Mã cổ phiếu (ví dụ: 'HPG', 'VIC').\n"
+        "2. `date_query`: PHẢI là chuỗi (string) thời gian GỐC bằng TIẾNG VIỆT lấy TỪ CÂU HỎI. "
+        "   KHÔNG ĐƯỢC dịch sang tiếng Anh, KHÔNG ĐƯỢC tự ý đổi thành ngày tháng (YYYY-MM-DD)."
+        "   VÍ DỤ ĐÚNG: '10 ngày gần nhất', 'từ đầu tháng 11', '1 tuần gần đây', '2 tháng'.\n"
+        "3. `indicators`: PHẢI là một DANH SÁCH (list) các CHUỖI (string). "
+        "   - Định dạng là 'TEN_SO', ví dụ: ['SMA_9', 'SMA_20', 'RSI_14', 'EMA_12', 'ATR_14', 'BB_20']. "
+        "   - 'MACD' (mặc định 12/26/9) và 'VWAP' không cần số. "
+        "   - Nếu câu hỏi chỉ lấy OHLCV hoặc Volume (như Câu 1, 2, 4 trong file test), hãy truyền vào một DANH SÁCH RỖNG: [].\n"
+        "4. `resolution`: Khung thời gian. Mặc định là '1D'. Chỉ thay đổi nếu người dùng yêu cầu rõ (ví dụ: '1m', '1H')."
     ),
-    FunctionTool.from_defaults(
-        fn=get_company_info,
-        name="get_company_info",
-        description=(
-            "Lấy thông tin cơ bản của công ty (cổ đông, lãnh đạo, công ty con)."
-            "\n"
-            "HƯỚNG DẪN THAM SỐ:\n"
-            "1. `symbol`: Mã cổ phiếu (ví dụ: 'VCB').\n"
-            "2. `info_type`: PHẢI là MỘT TRONG BA chuỗi (string) sau: 'shareholders', 'officers', hoặc 'subsidiaries'."
-            "   - Dùng 'shareholders' cho câu hỏi về 'cổ đông lớn'."
-            "   - Dùng 'officers' cho câu hỏi về 'ban lãnh đạo', 'lãnh đạo đang làm việc', 'tên các lãnh đạo'."
-            "   - Dùng 'subsidiaries' cho câu hỏi về 'công ty con'."
-            "   KHÔNG ĐƯỢC dùng bất kỳ giá trị nào khác (ví dụ: 'management_board' là SAI)."
-        )
+    "get_company_info": (
+        "Lấy thông tin cơ bản của công ty (cổ đông, lãnh đạo, công ty con)."
+        "\n"
+        "HƯỚNG DẪN THAM SỐ:\n"
+        "1. `symbol`: Mã cổ phiếu (ví dụ: 'VCB').\n"
+        "2. `info_type`: PHẢI là MỘT TRONG BA chuỗi (string) sau: 'shareholders', 'officers', hoặc 'subsidiaries'."
+        "   - Dùng 'shareholders' cho câu hỏi về 'cổ đông lớn'."
+        "   - Dùng 'officers' cho câu hỏi về 'ban lãnh đạo', 'lãnh đạo đang làm việc', 'tên các lãnh đạo'."
+        "   - Dùng 'subsidiaries' cho câu hỏi về 'công ty con'."
+        "   KHÔNG ĐƯỢC dùng bất kỳ giá trị nào khác (ví dụ: 'management_board' là SAI)."
     ),
-    FunctionTool.from_defaults(
-        fn=compare_stock_prices,
-        name="compare_stock_prices",
-        description=(
-            "So sánh giá (open, high, low, close) của NHIỀU mã (từ 2 mã trở lên) và tìm mã thấp nhất."
-            " Chỉ dùng khi câu hỏi yêu cầu so sánh GIÁ."
-            "\n"
-            "HƯỚNG DẪN THAM SỐ:\n"
-            "1. `symbols`: PHẢI là một DANH SÁCH (list) các mã, ví dụ: ['BID', 'TCB', 'VCB'].\n"
-            "2. `date_query`: PHẢI là chuỗi (string) thời gian GỐC bằng TIẾNG VIỆT. "
-            "   VÍ DỤ ĐÚNG: '10 ngày qua'. KHÔNG ĐƯỢC dùng '10 days ago'.\n"
-            "3. `metric`: Loại giá để so sánh. Dùng 'open' cho 'giá mở cửa'."
-        )
+    "compare_stock_prices": (
+        "So sánh giá (open, high, low, close) của NHIỀU mã (từ 2 mã trở lên) và tìm mã thấp nhất."
+        " Chỉ dùng khi câu hỏi yêu cầu so sánh GIÁ."
+        "\n"
+        "HƯỚNG DẪN THAM SỐ:\n"
+        "1. `symbols`: PHẢI là một DANH SÁCH (list) các mã, ví dụ: ['BID', 'TCB', 'VCB'].\n"
+        "2. `date_query`: PHẢI là chuỗi (string) thời gian GỐC bằng TIẾNG VIỆT. "
+        "   VÍ DỤ ĐÚNG: '10 ngày qua'. KHÔNG ĐƯỢC dùng '10 days ago'.\n"
+        "3. `metric`: Loại giá để so sánh. Dùng 'open' cho 'giá mở cửa'."
     ),
-    FunctionTool.from_defaults(
-        fn=compare_stock_volumes,
-        name="compare_stock_volumes",
-        description=(
-            "So sánh tổng khối lượng giao dịch (volume) của 2 mã cổ phiếu."
-            " Chỉ dùng khi câu hỏi yêu cầu so sánh VOLUME."
-            "\n"
-            "HƯỚNG DẪN THAM SỐ:\n"
-            "1. `symbol1`, `symbol2`: Hai mã cổ phiếu cần so sánh.\n"
-            "2. `date_query`: PHẢI là chuỗi (string) thời gian GỐC bằng TIẾNG VIỆT. "
-            "   VÍ DỤ ĐÚNG: '2 tuần gần đây'."
-        )
+    "compare_stock_volumes": (
+        "So sánh tổng khối lượng giao dịch (volume) của 2 mã cổ phiếu."
+        " Chỉ dùng khi câu hỏi yêu cầu so sánh VOLUME."
+        "\n"
+        "HƯỚNG DẪN THAM SỐ:\n"
+        "1. `symbol1`, `symbol2`: Hai mã cổ phiếu cần so sánh.\n"
+        "2. `date_query`: PHẢI là chuỗi (string) thời gian GỐC bằng TIẾNG VIỆT. "
+        "   VÍ DỤ ĐÚNG: '2 tuần gần đây'."
+    ),
+    "compare_stocks": (
+        "So sánh chéo một rổ NHIỀU mã (2-30 mã) trên cùng các phiên giao dịch và XẾP HẠNG các mã:"
+        " tỷ suất sinh lời, độ biến động, tương quan, tổng volume, giá thấp/cao/trung bình."
+        " Dùng khi câu hỏi yêu cầu xếp hạng, lợi nhuận, biến động hoặc tương quan giữa các mã."
+        "\n"
+        "HƯỚNG DẪN THAM SỐ:\n"
+        "1. `symbols`: PHẢI là một DANH SÁCH (list) các mã, ví dụ: ['FPT', 'HPG', 'VCB', 'MBB'].\n"
+        "2. `date_query`: PHẢI là chuỗi (string) thời gian GỐC bằng TIẾNG VIỆT, ví dụ: '3 tháng'.\n"
+        "3. `measures`: DANH SÁCH số đo, số đo đầu tiên dùng để xếp hạng. Giá trị hợp lệ: "
+        "   'return', 'volatility', 'volume', 'corr', và 'min_'/'max_'/'mean_' ghép với "
+        "   'open'/'high'/'low'/'close' (ví dụ: 'max_close'). Bỏ trống = ['return', 'volatility', 'volume']."
+    ),
+    "screen_stocks": (
+        "Lọc TOÀN BỘ cổ phiếu trên thị trường theo điều kiện kỹ thuật tại phiên gần nhất."
+        " Chỉ dùng khi câu hỏi yêu cầu lọc/tìm các mã thỏa điều kiện, KHÔNG dùng cho một mã cụ thể."
+        "\n"
+        "HƯỚNG DẪN THAM SỐ:\n"
+        "1. `condition`: Biểu thức điều kiện, ví dụ: 'RSI_14 < 30 and close > SMA_50'. "
+        "   Dùng các trường open/high/low/close/volume và chỉ báo SMA_n, EMA_n, RSI_n, ATR_n, "
+        "   BB_n_UPPER/MID/LOWER, MACD/MACD_SIGNAL/MACD_HIST; kết hợp bằng and/or/not.\n"
+        "2. `exchanges`: Danh sách sàn (ví dụ: ['HOSE', 'HNX']). Bỏ trống = tất cả.\n"
+        "3. `limit`: Số mã tối đa hiển thị. Mặc định 50."
     ),
-]
+}
+
+_all_tools = None
+
+
+def get_all_tools() -> list:
+    """FunctionTool (llama_index) cho từng tool - chỉ dựng (và import llama_index) khi cần tới LLM."""
+    global _all_tools
+    if _all_tools is None:
+        from llama_index.core.tools import FunctionTool
+        _all_tools = [FunctionTool.from_defaults(fn=tool_functions[name], name=name, description=description)
+                      for name, description in TOOL_DESCRIPTIONS.items()]
+    return _all_tools
+
+
+def __getattr__(name: str):
+    # `tools.all_tools` vẫn dùng được như trước, nhưng chỉ được dựng ở lần truy cập đầu
+    if name == "all_tools":
+        return get_all_tools()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
+def llm_tool_schemas() -> list:
+    """Schema function-calling (dạng OpenAI) của all_tools cho LLM routing."""
+    return [t.metadata.to_openai_tool() for t in get_all_tools()]
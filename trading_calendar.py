@@ -0,0 +1,163 @@
+import os
+import math
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Set
+
+import numpy as np
+
+# Lịch giao dịch HOSE/HNX: thứ 2 - thứ 6, trừ các ngày nghỉ lễ.
+# Tết Nguyên đán và Giỗ Tổ theo âm lịch nên ghi theo từng năm; ngày lễ
+# dương lịch rơi vào cuối tuần được nghỉ bù vào ngày làm việc kế tiếp.
+# Ngày nghỉ bổ sung (hoán đổi, nghỉ bù do Sở công bố) ghi ở EXTRA_HOLIDAYS
+# hoặc biến môi trường VN_EXTRA_HOLIDAYS="2026-09-01,2026-09-03".
+
+# Mùng 1 Tết âm lịch; sàn nghỉ các ngày làm việc từ 2 ngày trước đến 4 ngày sau
+LUNAR_NEW_YEAR = {
+    2019: date(2019, 2, 5), 2020: date(2020, 1, 25), 2021: date(2021, 2, 12),
+    2022: date(2022, 2, 1), 2023: date(2023, 1, 22), 2024: date(2024, 2, 10),
+    2025: date(2025, 1, 29), 2026: date(2026, 2, 17), 2027: date(2027, 2, 6),
+    2028: date(2028, 1, 26),
+}
+TET_BEFORE, TET_AFTER = 2, 4
+
+# Giỗ Tổ Hùng Vương (10/3 âm lịch)
+HUNG_KINGS = {
+    2019: date(2019, 4, 14), 2020: date(2020, 4, 2), 2021: date(2021, 4, 21),
+    2022: date(2022, 4, 10), 2023: date(2023, 4, 29), 2024: date(2024, 4, 18),
+    2025: date(2025, 4, 7), 2026: date(2026, 4, 26), 2027: date(2027, 4, 16),
+    2028: date(2028, 4, 4),
+}
+
+# Ngày lễ dương lịch: Tết dương lịch, 30/4, 1/5, Quốc khánh 2/9
+FIXED_HOLIDAYS = [(1, 1), (4, 30), (5, 1), (9, 2)]
+
+EXTRA_HOLIDAYS = {
+    date(2023, 1, 2), date(2023, 5, 2), date(2023, 5, 3), date(2023, 9, 1), date(2023, 9, 4),
+    date(2024, 4, 29), date(2024, 9, 3),
+    date(2025, 5, 2), date(2025, 9, 1),
+}
+
+# Khoảng năm được tính sẵn thành mảng; ngoài khoảng này thì đếm từng ngày
+CALENDAR_FIRST_YEAR = 2000
+CALENDAR_LAST_YEAR = date.today().year + 2
+
+# Phiên khớp lệnh: 9:00-11:30 và 13:00-14:45 (gồm ATC)
+SESSION_MINUTES = 150 + 105
+INTERVAL_MINUTES = {'1m': 1, '5m': 5, '15m': 15, '30m': 30, '1H': 60}
+
+
+def _env_holidays() -> Set[date]:
+    raw = os.environ.get("VN_EXTRA_HOLIDAYS", "")
+    return {datetime.strptime(d.strip(), '%Y-%m-%d').date() for d in raw.split(",") if d.strip()}
+
+
+@lru_cache(maxsize=None)
+def holidays(year: int) -> frozenset:
+    """Các ngày làm việc (thứ 2 - thứ 6) sàn nghỉ trong năm."""
+    days = set()
+    for month, day in FIXED_HOLIDAYS:
+        d = date(year, month, day)
+        # Lễ rơi vào cuối tuần (hoặc trùng ngày lễ khác) -> nghỉ bù ngày làm việc kế tiếp
+        while d.weekday() >= 5 or d in days:
+            d += timedelta(days=1)
+        days.add(d)
+    if year in HUNG_KINGS:
+        d = HUNG_KINGS[year]
+        while d.weekday() >= 5 or d in days:
+            d += timedelta(days=1)
+        days.add(d)
+    if year in LUNAR_NEW_YEAR:
+        tet = LUNAR_NEW_YEAR[year]
+        days.update(tet + timedelta(days=i) for i in range(-TET_BEFORE, TET_AFTER + 1))
+    days.update(d for d in EXTRA_HOLIDAYS | _env_holidays() if d.year == year)
+    return frozenset(d for d in days if d.weekday() < 5)
+
+
+def is_trading_day(d: date) -> bool:
+    return d.weekday() < 5 and d not in holidays(d.year)
+
+
+def _step_back(d: date, n: int) -> date:
+    while not is_trading_day(d):
+        d -= timedelta(days=1)
+    while n > 0:
+        d -= timedelta(days=1)
+        if is_trading_day(d):
+            n -= 1
+    return d
+
+
+# === bảng tính sẵn ===
+# _TRADING_DAYS: mọi phiên giao dịch (datetime64[D], tăng dần).
+# _FLOOR_INDEX[i]: vị trí trong _TRADING_DAYS của phiên gần nhất <= ngày thứ i kể từ _BASE
+# (-1 nếu chưa có phiên nào), nên "lùi N phiên" chỉ là hai lần tra mảng.
+
+
+def _build(first_year: int, last_year: int):
+    base = date(first_year, 1, 1)
+    days = np.arange(np.datetime64(base, 'D'), np.datetime64(date(last_year, 12, 31), 'D') + 1)
+    weekday = (days.astype('int64') + 3) % 7   # 1970-01-01 là thứ 5
+    closed = np.array(sorted(d for y in range(first_year, last_year + 1) for d in holidays(y)),
+                      dtype='datetime64[D]')
+    is_open = (weekday < 5) & ~np.isin(days, closed)
+    return base, days[is_open], np.cumsum(is_open) - 1
+
+
+_BASE, _TRADING_DAYS, _FLOOR_INDEX = _build(CALENDAR_FIRST_YEAR, CALENDAR_LAST_YEAR)
+
+
+def _floor_index(d: date) -> int:
+    """Vị trí phiên gần nhất <= d trong _TRADING_DAYS, -1 nếu d nằm ngoài bảng."""
+    offset = (d - _BASE).days
+    if 0 <= offset < len(_FLOOR_INDEX):
+        return int(_FLOOR_INDEX[offset])
+    return -1
+
+
+def trading_days_back(d: date, n: int) -> date:
+    """Ngày giao dịch đứng trước `d` đúng n phiên (n=0: chính d, hoặc phiên gần nhất trước d). O(1)."""
+    idx = _floor_index(d)
+    if idx - n < 0:
+        return _step_back(d, n)
+    return _TRADING_DAYS[idx - n].item()
+
+
+def sessions_between(start: date, end: date) -> int:
+    """Số phiên từ phiên gần nhất <= start tới phiên gần nhất <= end (âm nếu end < start)."""
+    return _floor_index(end) - _floor_index(start)
+
+
+def shift_trading_days(days: np.ndarray, n: int) -> np.ndarray:
+    """Dời từng phiên trong `days` (datetime64[D], trong bảng tính sẵn) đi n phiên; n < 0 là lùi."""
+    offsets = (days.astype('datetime64[D]') - np.datetime64(_BASE, 'D')).astype('int64')
+    return _TRADING_DAYS[_FLOOR_INDEX[offsets] + n]
+
+
+def trading_days(start: date, end: date) -> np.ndarray:
+    """Các phiên giao dịch trong [start, end] (datetime64[D])."""
+    if _BASE < start and (end - _BASE).days < len(_FLOOR_INDEX):
+        return _TRADING_DAYS[_floor_index(start - timedelta(days=1)) + 1:_floor_index(end) + 1]
+    days = np.arange(np.datetime64(start, 'D'), np.datetime64(end, 'D') + 1)
+    return days[[is_trading_day(d.item()) for d in days]]
+
+
+def bars_per_session(interval: str = '1D') -> int:
+    """Số nến trong một phiên giao dịch theo khung thời gian."""
+    minutes = INTERVAL_MINUTES.get(interval)
+    return 1 if minutes is None else math.ceil(SESSION_MINUTES / minutes)
+
+
+def lookback_start(start, bars: int, interval: str = '1D') -> date:
+    """Ngày bắt đầu cần tải để có thêm `bars` nến trước `start` (khung `interval`)."""
+    if isinstance(start, str):
+        start = datetime.strptime(start[:10], '%Y-%m-%d').date()
+    elif isinstance(start, datetime):
+        start = start.date()
+    if bars <= 0:
+        return start
+    sessions = math.ceil(bars / bars_per_session(interval))
+    first = start
+    while not is_trading_day(first):
+        first += timedelta(days=1)
+    return trading_days_back(first, sessions)
@@ -0,0 +1,133 @@
+import os
+import time
+import logging
+import threading
+from datetime import datetime, time as dtime
+from typing import Callable, Dict, List, Optional
+
+from providers import RateLimiter
+from store import VN_TZ, SESSION_CLOSE
+from trading_calendar import is_trading_day, trading_days_back
+import tools
+
+# Bộ làm ấm cache chạy nền cạnh FastAPI, cho một danh sách mã theo dõi:
+#  - sau giờ đóng cửa: tải nến ngày (chốt phiên) vào kho nến;
+#  - trong phiên: làm mới nến intraday định kỳ;
+#  - ban đêm: tải lại thông tin doanh nghiệp vào cache.
+# Chạy tuần tự, có giới hạn tốc độ riêng (thấp hơn nguồn) và nhường khi có
+# request thật đang xử lý, để không tranh upstream với người dùng.
+
+VN30 = [
+    'ACB', 'BCM', 'BID', 'BVH', 'CTG', 'FPT', 'GAS', 'GVR', 'HDB', 'HPG',
+    'LPB', 'MBB', 'MSN', 'MWG', 'PLX', 'SAB', 'SHB', 'SSB', 'SSI', 'STB',
+    'TCB', 'TPB', 'VCB', 'VHM', 'VIB', 'VIC', 'VJC', 'VNM', 'VPB', 'VRE',
+]
+WATCHLISTS = {'VN30': VN30}
+
+WARM_WATCHLIST = os.environ.get("WARM_WATCHLIST", "")              # "VN30" hoặc "HPG,VCB,..."; rỗng = tắt
+WARM_INTRADAY = os.environ.get("WARM_INTRADAY", "5m")              # các khung intraday, phân tách bởi dấu phẩy
+WARM_INTRADAY_EVERY = float(os.environ.get("WARM_INTRADAY_EVERY", "300"))   # giây
+WARM_RATE = float(os.environ.get("WARM_RATE", "2"))                 # yêu cầu/giây của bộ làm ấm
+WARM_DAILY_BARS = 300       # số phiên nến ngày giữ ấm
+WARM_INTRADAY_DAYS = 5      # số phiên nến intraday giữ ấm
+SESSION_OPEN = dtime(9, 0)
+OVERNIGHT = (dtime(1, 0), dtime(6, 0))
+TICK = 15                   # giây giữa hai lần kiểm tra lịch
+
+
+def parse_watchlist(spec: str) -> List[str]:
+    symbols = []
+    for item in (s.strip().upper() for s in spec.split(",") if s.strip()):
+        symbols.extend(WATCHLISTS.get(item, [item]))
+    return list(dict.fromkeys(symbols))
+
+
+class Warmer:
+    """`busy()` trả về True khi đang có request thật -> bộ làm ấm tạm dừng giữa các mã."""
+
+    def __init__(self, watchlist: List[str], intraday: List[str] = None,
+                 busy: Optional[Callable[[], bool]] = None, rate: float = WARM_RATE):
+        self.watchlist = watchlist
+        self.intraday = intraday if intraday is not None else [i.strip() for i in WARM_INTRADAY.split(",") if i.strip()]
+        self.busy = busy or (lambda: False)
+        self.limiter = RateLimiter(rate, 1)
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_eod = None
+        self._last_company = None
+        self._next_intraday = 0.0
+        self._jobs: Dict[str, dict] = {}
+        self.current = None
+
+    # --- vòng lặp ---
+
+    def start(self):
+        if self._thread is None and self.watchlist:
+            self._thread = threading.Thread(target=self._loop, name="warmer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.tick()
+            except Exception as e:
+                logging.error(f"Lỗi bộ làm ấm cache: {e}")
+            self._stop.wait(TICK)
+
+    def tick(self, now: datetime = None):
+        """Chạy các việc đến hạn tại thời điểm `now` (giờ Việt Nam)."""
+        now = now or datetime.now(VN_TZ)
+        today, clock = now.date(), now.time()
+        trading = is_trading_day(today)
+
+        # Lần đầu (khởi động) luôn làm ấm nến ngày; sau đó mỗi ngày một lần sau giờ đóng cửa
+        if self._last_eod is None or (trading and clock >= SESSION_CLOSE and self._last_eod != today):
+            start = trading_days_back(today, WARM_DAILY_BARS).isoformat()
+            self._run('eod', lambda s: tools.bar_store.get_bars(s, start, today.isoformat(), '1D'))
+            self._last_eod = today
+
+        if trading and SESSION_OPEN <= clock < SESSION_CLOSE and time.monotonic() >= self._next_intraday:
+            start = trading_days_back(today, WARM_INTRADAY_DAYS).isoformat()
+            for interval in self.intraday:
+                self._run(f'intraday_{interval}',
+                          lambda s, i=interval: tools.bar_store.get_bars(s, start, today.isoformat(), i))
+            self._next_intraday = time.monotonic() + WARM_INTRADAY_EVERY
+
+        if OVERNIGHT[0] <= clock < OVERNIGHT[1] and self._last_company != today:
+            def refresh(s):
+                for info_type in tools.COMPANY_TTL:
+                    tools.refresh_company_data(s, info_type)
+            self._run('company', refresh)
+            self._last_company = today
+
+    def _run(self, job: str, fn: Callable[[str], object]):
+        status = {"started": datetime.now(VN_TZ).isoformat(timespec='seconds'), "finished": None,
+                  "ok": 0, "errors": 0, "total": len(self.watchlist)}
+        self._jobs[job] = status
+        for symbol in self.watchlist:
+            if self._stop.is_set():
+                break
+            while self.busy() and not self._stop.is_set():
+                self._stop.wait(0.5)
+            self.limiter.acquire()
+            self.current = (job, symbol)
+            try:
+                fn(symbol)
+                status["ok"] += 1
+            except Exception as e:
+                status["errors"] += 1
+                logging.error(f"Làm ấm {job} {symbol} lỗi: {e}")
+        self.current = None
+        status["finished"] = datetime.now(VN_TZ).isoformat(timespec='seconds')
+
+    def status(self) -> dict:
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "watchlist": self.watchlist,
+            "intraday": self.intraday,
+            "current": self.current,
+            "jobs": {name: dict(s) for name, s in self._jobs.items()},
+        }
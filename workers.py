@@ -0,0 +1,140 @@
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from store import BarStore
+from indicators import IndicatorEngine
+from screener import run_screen
+
+# Chế độ worker tiến trình cho phần tính toán nặng CPU (chỉ báo khung ngày,
+# lọc toàn thị trường), để không giữ GIL của worker uvicorn.
+# Tác vụ không gửi DataFrame/mảng qua pickle: tiến trình con tự memory-map
+# cùng các file .npy của kho nến (bộ nhớ dùng chung qua page cache của OS),
+# chỉ nhận (thư mục kho, mã, khung, mốc thời gian) và trả về các mảng kết quả.
+# Thư mục kho đi theo từng tác vụ, nên kho được trỏ đi nơi khác (benchmark,
+# kiểm thử) vẫn dùng được worker.
+# ANALYTICS_WORKERS=0 (mặc định) thì mọi thứ vẫn chạy trong thread của request.
+
+ANALYTICS_WORKERS = int(os.environ.get("ANALYTICS_WORKERS", "0"))        # số tiến trình; 0 = tắt
+ANALYTICS_TIMEOUT = float(os.environ.get("ANALYTICS_TIMEOUT", "30"))     # giây cho mỗi tác vụ
+START_METHOD = os.environ.get("ANALYTICS_START_METHOD", "forkserver")    # tránh fork khi đang có thread
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+_stats = {"submitted": 0, "completed": 0, "timeouts": 0, "errors": 0, "restarts": 0}
+_stats_lock = threading.Lock()
+
+
+class WorkerTimeout(Exception):
+    pass
+
+
+def enabled() -> bool:
+    return ANALYTICS_WORKERS > 0
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            context = multiprocessing.get_context(START_METHOD)
+            if START_METHOD == 'forkserver':
+                context.set_forkserver_preload(['workers'])
+            _pool = ProcessPoolExecutor(max_workers=ANALYTICS_WORKERS, mp_context=context)
+        return _pool
+
+
+def _count(stat: str):
+    with _stats_lock:
+        _stats[stat] += 1
+
+
+def _reset_pool(broken: ProcessPoolExecutor):
+    global _pool
+    with _pool_lock:
+        restarted = _pool is broken
+        if restarted:
+            _pool = None
+    if restarted:
+        _count("restarts")
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def run(fn, *args, timeout: float = ANALYTICS_TIMEOUT):
+    """
+    Chạy fn(*args) trong pool tiến trình, chờ tối đa `timeout` giây.
+    Hết giờ -> WorkerTimeout (tác vụ chưa chạy thì bị hủy; đang chạy thì để
+    worker chạy nốt, kết quả bị bỏ). Pool hỏng (worker chết) thì được tạo lại.
+    """
+    pool = _get_pool()
+    _count("submitted")
+    try:
+        future = pool.submit(fn, *args)
+        result = future.result(timeout=timeout)
+    except FutureTimeoutError:
+        future.cancel()
+        _count("timeouts")
+        raise WorkerTimeout(f"tính toán vượt quá {timeout:.0f} giây")
+    except BrokenProcessPool:
+        _count("errors")
+        _reset_pool(pool)
+        raise
+    except Exception:
+        _count("errors")
+        raise
+    _count("completed")
+    return result
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def stats() -> dict:
+    with _stats_lock:
+        return {"processes": ANALYTICS_WORKERS, "timeout": ANALYTICS_TIMEOUT, **_stats}
+
+
+# === phía tiến trình con ===
+
+_stores: Dict[str, BarStore] = {}   # thư mục kho -> BarStore (chỉ đọc) trong tiến trình con
+
+
+def _offline_quote(symbol: str):
+    raise RuntimeError("worker chỉ đọc kho nến, không gọi upstream")
+
+
+def _store(root: str) -> BarStore:
+    store = _stores.get(root)
+    if store is None:
+        store = _stores[root] = BarStore(quote_factory=_offline_quote, root=root)
+    return store
+
+
+def indicator_columns(root: str, symbol: str, interval: str, first_ns: int, last_ns: int, count: int,
+                      specs: List[str]) -> Dict[str, np.ndarray]:
+    """
+    Chỉ báo cho đúng đoạn nến [first_ns, last_ns] mà request đã đọc. `count` để
+    kiểm tra hai bên thấy cùng một dữ liệu (kho vừa được ghi phiên bản khác thì báo lỗi).
+    """
+    bars = _store(root).read_bars(symbol, interval)
+    bars = bars[int(np.searchsorted(bars.time, first_ns)):int(np.searchsorted(bars.time, last_ns, side='right'))]
+    if len(bars) != count:
+        raise RuntimeError(f"dữ liệu {symbol} {interval} đã thay đổi trong lúc tính")
+    return IndicatorEngine(bars.close, bars.high, bars.low, bars.volume).compute(specs)
+
+
+def screen(root: str, condition: str, symbols: List[str], lookback: int) -> pd.DataFrame:
+    store = _store(root)
+    columns = {s: store.read_columns(s, '1D') for s in symbols}
+    return run_screen(condition, columns, lookback)